@@ -1,17 +1,18 @@
 import argparse
 import os
 import sys
-import json
-import tkinter as tk
 import platform
-from annotate.spanannotator import SpanAnnotatorFrame
-from annotate.spanannotator_relations import SpanAnnotatorRelationFrame
+from annotate.consts import BATCH_COMMANDS
 from annotate.version import __version__
-from annotate.utils import validate
+from annotate.config import load_config
 from annotate.exceptions import ConfigReadError
 
 
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] in BATCH_COMMANDS:  # satya convert|export|check, without a display
+        from annotate.batch import main as batch_main
+
+        sys.exit(batch_main(sys.argv[1:]))
     parser = argparse.ArgumentParser("SATYA: Span Annotator Tool, Yet Another")
     parser.add_argument("config", help="config file to run with")
     parser.add_argument("--input", help="input file to load", default=None)
@@ -24,30 +25,22 @@ def main():
 
     args = parser.parse_args()
     config_file = os.path.expanduser(args.config)
-    if not os.path.exists(config_file):
-        print(f"ERROR: no config file at {config_file}")
-        sys.exit(1)
-    if config_file.endswith("json"):
-        config_dict = json.load(open(config_file))
-    elif config_file.endswith("yml") or config_file.endswith("yaml"):
-        import yaml
-
-        config_dict = yaml.load(open(config_file))
-    else:
-        print(f"ERROR: unsupported format for {config_file}")
+    try:
+        config_dict = load_config(config_file)  # validated, and cached until the file changes
+    except ConfigReadError as e:
+        print(f"ERROR: {e.msg}")
         sys.exit(1)
     print(f"Span Annotator Version {__version__}")
     print(f"OS:{platform.system()}")
+    import tkinter as tk
+    from annotate.spanannotator import SpanAnnotatorFrame
+    from annotate.spanannotator_relations import SpanAnnotatorRelationFrame
+
     root = tk.Tk()
-    try:
-        validate(config_dict)
-    except ConfigReadError as e:
-        print(e.msg)
-        sys.exit(1)
     root.geometry("1300x700+200+200")
     annotator_frame = SpanAnnotatorFrame if args.usage == 'default' else SpanAnnotatorRelationFrame
     app = annotator_frame(root, config_dict, input_file=args.input)
-    app.init_ui()
+    app.init_ui()  # once, after the subclass has set up its keys
     root.mainloop()
 
 
@@ -1,5 +1,6 @@
 import tkinter as tk
 from annotate.consts import *
+from annotate.labelindex import LabelIndex, LabelScan
 from tkinter.constants import *
 
 
@@ -15,6 +16,7 @@ class AutocompleteEntry(tk.Toplevel, object):
     Methods:
     __init__ -- Set up the `tk.Listbox` and `tk.Entry` widgets
     build -- Build a list of autocompletion entries
+    _schedule_update -- Internal method
     _update_autocomplete -- Internal method
     _select_entry -- Internal method
     _cycle_up -- Internal method
@@ -47,9 +49,11 @@ class AutocompleteEntry(tk.Toplevel, object):
             self, selectmode="browse", height=TYPE_AHEAD_LISTBOX_HEIGHT, width=TYPE_AHEAD_LISTBOX_WIDTH
         )
         self._case_sensitive = None
-        self._entries = None
+        self._index = None
         self._no_results_message = None
         self._listbox_height = None
+        self._update_pending = False
+        self._shown_text = None  # the text the listbox has the matches of
 
     def build(self, entries, max_entries=5, no_results_message=TYPE_AHEAD_NO_RESULTS_MESSAGE):
         """Set up the autocompletion settings.
@@ -58,7 +62,8 @@ class AutocompleteEntry(tk.Toplevel, object):
         smooth cycling between autocompletion entries.
 
         Arguments:
-        entries -- An iterable containing autocompletion entries (strings)
+        entries -- An iterable containing autocompletion entries (strings), or a `LabelIndex` (or `LabelScan`) of
+                   them; pass the index when the same entries are used again, it is built once
         max_entries -- [int] The maximum number of entries to display
         no_results_message -- [str] Message to display when no entries
                               match the current entry; you can use a
@@ -68,11 +73,11 @@ class AutocompleteEntry(tk.Toplevel, object):
         Returns:
         None
         """
-        self._entries = entries
+        self._index = entries if isinstance(entries, (LabelIndex, LabelScan)) else LabelIndex(entries)
         self._no_results_message = no_results_message
         self._listbox_height = max_entries
 
-        self.entry.bind("<KeyRelease>", self._update_autocomplete)
+        self.entry.bind("<KeyRelease>", self._schedule_update)
         self.entry.focus()
         self.entry.grid(column=0, row=0)
 
@@ -81,10 +86,22 @@ class AutocompleteEntry(tk.Toplevel, object):
         self.listbox.grid_forget()
         # Initially, the listbox widget doesn't show up.
 
+    def _schedule_update(self, event):
+        """Internal method.
+        Update the matches once the pending key events are handled, a burst of keys is searched once.
+        """
+        if not self._update_pending:
+            self._update_pending = True
+            self.after_idle(self._update_autocomplete, event)
+
     def _update_autocomplete(self, event):
         """Internal method.
-        Update `self.listbox` to display new matches.
+        Update `self.listbox` to display new matches, unless the text did not change (e.g. a Shift or arrow key).
         """
+        self._update_pending = False
+        if self.text_.get() == self._shown_text:
+            return
+        self._shown_text = self.text_.get()
         self.listbox.delete(0, END)
         self.listbox["height"] = self._listbox_height
 
@@ -92,9 +109,9 @@ class AutocompleteEntry(tk.Toplevel, object):
         if not text:
             self.listbox.grid_forget()
         else:
-            for entry in self._entries:
-                if text.lower() in entry.strip().lower():
-                    self.listbox.insert(END, entry)
+            matches = self._index.search(text, TYPE_AHEAD_MAX_RESULTS)
+            if matches:
+                self.listbox.insert(END, *matches)
 
         listbox_size = self.listbox.size()
         if not listbox_size:
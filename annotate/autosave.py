@@ -0,0 +1,168 @@
+# writes the journal and the snapshots of the content on a worker thread
+import threading
+import time
+from typing import Any, Callable, Dict, List, Tuple, Union
+from annotate.consts import *
+from annotate.data import Content
+from annotate.journal import Journal
+
+RECORD = 'record'
+SNAPSHOT = 'snapshot'
+
+
+class AutoSaver:
+    """
+    The UI thread only numbers the operations and marks where the snapshots go. The worker waits until no edit has
+    come in for `delay` seconds and then writes everything pending at once: a snapshot makes the records and the
+    snapshots before it redundant, the records after it are appended to the emptied journal.
+
+    With `load`, the worker keeps its own copy of the content: it is populated with `load` and the records are applied
+    to it as they are written, so the snapshots are serialized on the worker and the UI thread never walks the whole
+    content. The copy costs the memory of the sentences the records touch (all of them for a conll file, which is
+    not read lazily). Without `load`, `save` serializes the content it is given on the calling thread.
+    """
+
+    def __init__(
+        self, journal: Journal, delay: float = AUTOSAVE_DELAY, load: Union[Callable[[Content], Any], None] = None
+    ):
+        """
+        :param journal:
+        :param delay: seconds without edits before writing
+        :param load: populates a content like the one whose operations are appended, with the records in the journal
+        file applied, before anything is written
+        """
+        self.journal = journal
+        self.delay = delay
+        self._load = load
+        self._content: Union[Content, None] = None  # the copy of the worker
+        self.error: Union[Exception, None] = None  # the last error the worker ran into
+        self._pending: List[Tuple[str, Dict]] = []
+        self._last_submit = 0.0
+        self._submitted = 0
+        self._written = 0
+        self._flush = False
+        self._closed = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name='satya-autosave', daemon=True)
+        self._thread.start()
+
+    def append(self, operation: Dict):
+        """queue an operation for the journal
+        :param operation:
+        :return:
+        """
+        self._submit(RECORD, self.journal.record(operation))
+
+    def save(self, content: Union[Content, None] = None):
+        """queue a snapshot of the content
+        :param content: not needed (and not used) with `load`, the worker serializes its copy
+        :return:
+        """
+        if self._load is None:
+            self._submit(SNAPSHOT, self.journal.snapshot(content))
+        else:
+            self._submit(SNAPSHOT, {JOURNAL_SEQ_KEY: self.journal.mark()})
+
+    def _submit(self, kind: str, item: Dict):
+        with self._condition:
+            if self._closed:
+                raise RuntimeError('autosave is closed')
+            self._pending.append((kind, item))
+            self._last_submit = time.monotonic()
+            self._submitted += 1
+            self._condition.notify_all()
+
+    def flush(self, timeout: Union[float, None] = None) -> bool:
+        """write everything pending without waiting for the quiet period, block until it is written
+        :param timeout: seconds to wait
+        :return: True if everything submitted before the call was written
+        """
+        with self._condition:
+            target = self._submitted
+            self._flush = True
+            self._condition.notify_all()
+            return self._condition.wait_for(lambda: self._written >= target, timeout=timeout)
+
+    def close(self, timeout: Union[float, None] = None) -> bool:
+        """flush and stop the worker
+        :param timeout: seconds to wait
+        :return: True if everything was written
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join(timeout)
+        return not self._thread.is_alive() and self._written >= self._submitted
+
+    def _run(self):
+        if self._load is not None:
+            try:  # before anything is written, the files are the ones the UI thread loaded
+                content = Content()
+                self._load(content)
+                self._content = content
+            except Exception as e:  # the records are still written, without snapshots
+                self.error = e
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending or self._closed)
+                while not (self._flush or self._closed):  # wait for the quiet period
+                    remaining = self._last_submit + self.delay - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                pending, self._pending = self._pending, []
+                self._flush = False
+                if not pending and self._closed:
+                    return
+            try:
+                self._write(pending)
+            except Exception as e:  # keep the worker alive, the UI reports the error
+                self.error = e
+            with self._condition:
+                self._written += len(pending)
+                self._condition.notify_all()
+
+    def _apply(self, pending: List[Tuple[str, Dict]]):
+        """apply the records to the copy of the worker. if that fails the copy is dropped, the records are still
+        written but there are no snapshots anymore
+        """
+        if self._content is None:
+            return
+        try:
+            for kind, item in pending:
+                if kind == RECORD:
+                    self._content.apply_operation(item)
+        except Exception as e:
+            self._content = None
+            self.error = e
+
+    def _serialize(self, snapshot: Dict) -> Union[Dict, None]:
+        """
+        :param snapshot: the sequence number of the snapshot
+        :return: the snapshot of the copy of the worker, None if there is no copy
+        """
+        if self._content is None:
+            return None
+        try:
+            return {**self._content.serialize_columns(), **snapshot}
+        except Exception as e:
+            self._content = None
+            self.error = e
+            return None
+
+    def _write(self, pending: List[Tuple[str, Dict]]):
+        snapshots = [index for index, (kind, _) in enumerate(pending) if kind == SNAPSHOT]
+        if snapshots:
+            snapshot = pending[snapshots[-1]][1]
+            if self._load is not None:  # serialize the copy as it was when the snapshot was asked for
+                self._apply(pending[: snapshots[-1]])
+                snapshot = self._serialize(snapshot)
+                self._apply(pending[snapshots[-1] + 1 :])
+            if snapshot is not None:
+                self.journal.write_snapshot(snapshot)
+                pending = pending[snapshots[-1] + 1 :]
+        elif self._load is not None:
+            self._apply(pending)
+        records = [item for kind, item in pending if kind == RECORD]
+        if records:
+            self.journal.write(records)
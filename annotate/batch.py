@@ -0,0 +1,191 @@
+# headless commands that work on many files at once: satya convert|export|check. nothing here imports tkinter
+import os
+import sys
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Tuple, Union
+from annotate.consts import *
+from annotate.exceptions import CustomException, ConfigReadError
+from annotate.export import export, BratEncoder, ENCODERS
+from annotate.config import load_config
+from annotate.utils import check_content, convert, file_stem, file_type_from_name, read_content
+
+
+def input_files(paths: List[str]) -> Iterator[str]:
+    """expand the directories to the content files in them (recursively), files are kept as they are. exported
+    files (e.g. `a.bio.conll`, or the text file of a brat export next to its `.ann` file) are skipped
+    :param paths:
+    :return:
+    """
+    export_exts = tuple(encoder.extension for encoder in ENCODERS.values())
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+        for directory, _, file_names in sorted(os.walk(path)):
+            names = set(file_names)
+            for file_name in sorted(file_names):
+                try:
+                    file_type_from_name(file_name)
+                except CustomException:
+                    continue
+                if file_name.endswith(export_exts):
+                    continue
+                if file_name.endswith(BRAT_TEXT_FILE_EXT) and f'{file_stem(file_name)}{BratEncoder.extension}' in names:
+                    continue
+                yield os.path.join(directory, file_name)
+
+
+def output_file(input_file: str, ext: str, output_dir: Union[str, None]) -> str:
+    """the name of the output file for an input file: the same name with another extension, in output_dir if it is
+    given
+    """
+    name = f'{file_stem(input_file)}{ext}'
+    if output_dir is not None:
+        name = os.path.join(output_dir, os.path.basename(name))
+    return name
+
+
+def command_output_file(command: str, input_file: str, options: Dict) -> Union[str, None]:
+    """the output file a command writes for an input file, None if it writes nothing
+    """
+    if command == BATCH_CONVERT:
+        return output_file(input_file, f'.{options["to"]}', options['output_dir'])
+    if command == BATCH_EXPORT:
+        return output_file(input_file, ENCODERS[options['format']].extension, options['output_dir'])
+    return None
+
+
+def output_collisions(command: str, files: List[str], options: Dict) -> Dict[str, str]:
+    """find the input files that would write the same output file, e.g. `a.txt` and `a.json` both export to
+    `a.bio.conll`. they would overwrite each other, so none of them is run
+    :return: input file -> error
+    """
+    inputs: Dict[str, List[str]] = dict()  # output file -> input files
+    for input_file in files:
+        output = command_output_file(command, input_file, options)
+        if output is not None:
+            inputs.setdefault(os.path.abspath(output), []).append(input_file)
+    errors = dict()
+    for output, inputs_this_output in inputs.items():
+        if len(inputs_this_output) > 1:
+            for input_file in inputs_this_output:
+                errors[input_file] = f'{", ".join(inputs_this_output)} would all write {output}, run them separately'
+    return errors
+
+
+def convert_file(input_file: str, options: Dict) -> str:
+    output = command_output_file(BATCH_CONVERT, input_file, options)
+    if os.path.abspath(output) == os.path.abspath(input_file):
+        raise CustomException(f'{input_file} is already a {options["to"]} file')
+    convert(input_file, output)
+    return output
+
+
+def export_file(input_file: str, options: Dict) -> str:
+    output = command_output_file(BATCH_EXPORT, input_file, options)
+    text_file = f'{file_stem(output)}{BRAT_TEXT_FILE_EXT}'
+    if options['format'] == EXPORT_FORMAT_BRAT and os.path.abspath(text_file) == os.path.abspath(input_file):
+        raise CustomException(f'the brat text file would replace {input_file}, use --output-dir')
+    export(read_content(input_file), output, options['format'])
+    return output
+
+
+def check_file(input_file: str, options: Dict) -> str:
+    problems = check_content(read_content(input_file), options['config'])
+    if problems:
+        raise CustomException('; '.join(problems))
+    return ''
+
+
+COMMANDS = {BATCH_CONVERT: convert_file, BATCH_EXPORT: export_file, BATCH_CHECK: check_file}
+
+
+def run(command: str, input_file: str, options: Dict) -> Tuple[str, str, Union[str, None], float]:
+    """run a command on a file, in a worker process
+    :param command:
+    :param input_file:
+    :param options:
+    :return: the input file, the output file, the error (None if there was none) and the seconds it took
+    """
+    start = time.time()
+    try:
+        output = COMMANDS[command](input_file, options)
+    except CustomException as e:
+        return input_file, '', e.msg, time.time() - start
+    except Exception as e:  # a malformed file only fails that file
+        return input_file, '', f'{type(e).__name__}: {e}', time.time() - start
+    return input_file, output, None, time.time() - start
+
+
+def run_all(command: str, files: List[str], options: Dict, workers: int) -> List[Tuple]:
+    """run a command on every file, on a pool of `workers` processes
+    :return: the results of `run`, in the order of the files
+    """
+    if workers <= 1 or len(files) <= 1:
+        return [run(command, input_file, options) for input_file in files]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(run, [command] * len(files), files, [options] * len(files)))
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser('satya', description='SATYA batch commands, they do not need a display')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+    convert_parser = commands.add_parser(BATCH_CONVERT, help='convert to the json, compressed json or binary format')
+    convert_parser.add_argument('--to', default='satya', choices=BATCH_CONVERT_TARGETS, help='format of the output')
+    export_parser = commands.add_parser(BATCH_EXPORT, help='export the labels')
+    export_parser.add_argument('--format', default=EXPORT_FORMAT_BIO, choices=ALL_EXPORT_FORMATS)
+    check_parser = commands.add_parser(BATCH_CHECK, help='check the files for broken ids and unknown labels')
+    check_parser.add_argument('--config', default=None, help='config file with the entities and relations')
+    for command_parser in [convert_parser, export_parser, check_parser]:
+        command_parser.add_argument('inputs', nargs='+', help='input files or directories')
+        command_parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1, help='number of processes working on the files'
+        )
+        if command_parser is not check_parser:
+            command_parser.add_argument(
+                '--output-dir', default=None, help='where to write the output files, next to the inputs by default'
+            )
+    return parser
+
+
+def main(argv: Union[List[str], None] = None) -> int:
+    """run a batch command and print a summary line per file
+    :param argv: the command line arguments, without the program name
+    :return: the exit status, 1 if a file failed
+    """
+    args = get_parser().parse_args(argv)
+    options = {
+        'to': getattr(args, 'to', None),
+        'format': getattr(args, 'format', None),
+        'output_dir': getattr(args, 'output_dir', None),
+        'config': None,
+    }
+    if getattr(args, 'config', None) is not None:
+        try:
+            options['config'] = load_config(os.path.expanduser(args.config))
+        except ConfigReadError as e:
+            print(f'ERROR: {e.msg}')
+            return 1
+    if options['output_dir'] is not None:
+        os.makedirs(options['output_dir'], exist_ok=True)
+    files = list(input_files(args.inputs))
+    errors = output_collisions(args.command, files, options)
+    results = run_all(args.command, [x for x in files if x not in errors], options, args.workers)
+    results += [(input_file, '', error, 0.0) for input_file, error in errors.items()]
+    positions = {input_file: position for position, input_file in enumerate(files)}
+    results.sort(key=lambda result: positions[result[0]])
+    for input_file, output, error, seconds in results:
+        if error is None:
+            print(f'OK    {input_file}{" -> " + output if output else ""} ({seconds:.2f}s)')
+        else:
+            print(f'ERROR {input_file}: {error}')
+    failed = sum(1 for result in results if result[2] is not None)
+    print(f'{len(results) - failed} of {len(results)} files done, {failed} failed')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,197 @@
+# compact binary format for the content: fixed width tables of int32 and a string pool, read through mmap
+import os
+import sys
+import mmap
+import struct
+from array import array
+from typing import BinaryIO, Dict, List, Tuple, Union
+from annotate.consts import *
+
+BINARY_MAGIC = b'SATYABIN'
+BINARY_VERSION = 1
+HEADER = struct.Struct('<8sIIq')  # magic, version, number of sections, journal sequence number
+SECTION = struct.Struct('<4sQQ')  # name, offset, size in bytes
+# the tokens are stored column by column, the other tables row by row, every row has WIDTHS[table] int32 values.
+# strings are indices in the string pool. default ids (`sen_index:tok_index` for tokens,
+# `sen_index:tok_start_index:tok_end_index` for spans) are not stored.
+TOKEN_SEN_INDEX = b'TSEN'
+TOKEN_TOK_INDEX = b'TTOK'
+TOKEN_CHAR_START = b'TCST'
+TOKEN_CHAR_END = b'TCEN'
+TOKEN_CONTENT = b'TCON'
+TOKEN_IDS = b'TIDS'  # token row, id
+TOKEN_TAGS = b'TTAG'  # token row, tag, in the order of the tags
+# sen_index, tok_start_index, tok_end_index, char_start_index, char_end_index, content, id (-1 for the default),
+# row of the first tag in SPAN_TAGS, number of tags
+SPANS = b'SPAN'
+SPAN_TAGS = b'STAG'  # content, color, level
+RELATIONS = b'RELS'  # start span id, end span id, name
+TOKENS_SPANS = b'TKSP'  # token, span: a row of the token/span table, or ~string for an id that is not in the table
+STRING_OFFSETS = b'STRO'  # uint64 char offset of every string in the pool, then the length of the pool
+STRINGS = b'STRS'  # the pool, utf-8
+WIDTHS = {TOKEN_IDS: 2, TOKEN_TAGS: 2, SPANS: 9, SPAN_TAGS: 3, RELATIONS: 3, TOKENS_SPANS: 2}
+
+
+def _int32s(values) -> array:
+    column = array('i', values)
+    if sys.byteorder == 'big':
+        column.byteswap()
+    return column
+
+
+class StringPool:
+    def __init__(self):
+        self.indices: Dict[str, int] = dict()
+        self.offsets = array('Q', [0])
+        self.strings: List[str] = []
+
+    def add(self, string: Union[str, None]) -> int:
+        if string is None:
+            return -1
+        index = self.indices.get(string)
+        if index is None:
+            index = self.indices[string] = len(self.strings)
+            self.strings.append(string)
+            self.offsets.append(self.offsets[-1] + len(string))
+        return index
+
+
+def write_binary(content: Dict, fp: BinaryIO):
+    """write a serialized content in the compact layout (see `Content.serialize_columns`) in the binary format
+    :param content:
+    :param fp: a file open for writing bytes
+    :return:
+    """
+    pool = StringPool()
+    tokens = content.get('tokens', dict())
+    columns: Dict[bytes, List[int]] = {
+        TOKEN_SEN_INDEX: tokens.get('sen_index', []),
+        TOKEN_TOK_INDEX: tokens.get('tok_index', []),
+        TOKEN_CHAR_START: tokens.get('char_start_index', []),
+        TOKEN_CHAR_END: tokens.get('char_end_index', []),
+        TOKEN_CONTENT: [pool.add(x) for x in tokens.get('content', [])],
+    }
+    columns.update({name: [] for name in WIDTHS})
+    for row, id_ in tokens.get('id', []):
+        columns[TOKEN_IDS].extend([row, pool.add(id_)])
+    for row, tags in tokens.get('tags', []):
+        for tag in tags:
+            columns[TOKEN_TAGS].extend([row, pool.add(tag)])
+    for sen_index, tok_start_index, tok_end_index, char_start_index, char_end_index, text, id_, tags in content.get(
+        'spans', []
+    ):
+        columns[SPANS].extend(
+            [
+                sen_index,
+                tok_start_index,
+                tok_end_index,
+                char_start_index,
+                char_end_index,
+                pool.add(text),
+                pool.add(id_),
+                len(columns[SPAN_TAGS]) // WIDTHS[SPAN_TAGS],
+                len(tags),
+            ]
+        )
+        for tag_content, color, level in tags:
+            columns[SPAN_TAGS].extend([pool.add(tag_content), pool.add(color), level])
+    for start_id, end_id, name in content.get('relations', []):
+        columns[RELATIONS].extend([pool.add(start_id), pool.add(end_id), pool.add(name)])
+    for token, span in content.get('tokens_spans', []):
+        columns[TOKENS_SPANS].append(token if isinstance(token, int) else ~pool.add(token))
+        columns[TOKENS_SPANS].append(span if isinstance(span, int) else ~pool.add(span))
+    sections: List[Tuple[bytes, bytes]] = [(name, _int32s(values).tobytes()) for name, values in columns.items()]
+    offsets = pool.offsets
+    if sys.byteorder == 'big':
+        offsets.byteswap()
+    sections.append((STRING_OFFSETS, offsets.tobytes()))
+    sections.append((STRINGS, ''.join(pool.strings).encode('utf-8')))
+    position = HEADER.size + SECTION.size * len(sections)
+    directory = []
+    for name, data in sections:
+        position += -position % 8  # align the tables for memoryview.cast
+        directory.append(SECTION.pack(name, position, len(data)))
+        position += len(data)
+    fp.write(HEADER.pack(BINARY_MAGIC, BINARY_VERSION, len(sections), content.get(JOURNAL_SEQ_KEY, 0)))
+    fp.write(b''.join(directory))
+    position = HEADER.size + SECTION.size * len(sections)
+    for name, data in sections:
+        fp.write(b'\0' * (-position % 8))
+        position += -position % 8
+        fp.write(data)
+        position += len(data)
+
+
+class BinaryFile:
+    """
+    A content in the binary format. The file is memory mapped, the tables are memoryviews on it: nothing is read
+    until it is used.
+    """
+
+    def __init__(self, file_name: str):
+        with open(file_name, 'rb') as f:
+            if os.fstat(f.fileno()).st_size < HEADER.size:
+                raise ValueError(f'{file_name} is not a binary content file')
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.data)
+        magic, version, num_sections, self.journal_seq = HEADER.unpack_from(self.data)
+        if magic != BINARY_MAGIC or version != BINARY_VERSION:
+            self.close()
+            raise ValueError(f'{file_name} is not a binary content file of version {BINARY_VERSION}')
+        self.sections: Dict[bytes, Tuple[int, int]] = dict()
+        for index in range(num_sections):
+            name, offset, size = SECTION.unpack_from(self.data, HEADER.size + index * SECTION.size)
+            self.sections[name] = (offset, size)
+        self._strings: Union[List[str], None] = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def table(self, name: bytes) -> Union[memoryview, array]:
+        """get a table as a flat sequence of int32, row after row
+        :param name:
+        :return:
+        """
+        if sys.byteorder == 'big':  # the file is little endian
+            return self.column(name)
+        offset, size = self.sections.get(name, (0, 0))
+        return self.view[offset : offset + size].cast('i')
+
+    def column(self, name: bytes) -> array:
+        """get a table as an array, with a single copy
+        :param name:
+        :return:
+        """
+        column = array('i')
+        offset, size = self.sections.get(name, (0, 0))
+        column.frombytes(self.view[offset : offset + size])
+        if sys.byteorder == 'big':
+            column.byteswap()
+        return column
+
+    def strings(self) -> List[str]:
+        """decode the string pool, every string once
+        :return:
+        """
+        if self._strings is None:
+            offset, size = self.sections[STRING_OFFSETS]
+            offsets = array('Q')
+            offsets.frombytes(self.view[offset : offset + size])
+            if sys.byteorder == 'big':
+                offsets.byteswap()
+            offset, size = self.sections[STRINGS]
+            text = str(self.view[offset : offset + size], 'utf-8')
+            self._strings = [sys.intern(text[offsets[i] : offsets[i + 1]]) for i in range(len(offsets) - 1)]
+        return self._strings
+
+    def rows(self, name: bytes) -> List[List[int]]:
+        table = self.table(name).tolist()
+        width = WIDTHS[name]
+        return [table[index : index + width] for index in range(0, len(table), width)]
+
+    def close(self):
+        self.view.release()
+        self.data.close()
@@ -0,0 +1,160 @@
+# the entities of a config, with the ones of an external catalogue file for large label sets
+import json
+import colorsys
+import threading
+from typing import Dict, List, Set, Union
+from annotate.consts import *
+from annotate.labelindex import LabelIndex, LabelScan
+from annotate.exceptions import ConfigReadError
+
+
+def entity_color(index: int) -> str:
+    """the color of the index-th entity without a color: the tkinter colors first, then colors spread around the hue
+    circle by the golden ratio, so there is always one
+    :param index:
+    :return:
+    """
+    if index < len(TKINTER_COLORS):
+        return TKINTER_COLORS[index]
+    index -= len(TKINTER_COLORS)
+    hue = index * GOLDEN_RATIO_CONJUGATE % 1
+    # the hues get close after a few hundred colors, the saturation and value tell those apart
+    red, green, blue = colorsys.hsv_to_rgb(hue, 0.4 + 0.2 * (index % 3), 0.95 - 0.15 * (index // 3 % 3))
+    return f'#{int(red * 255):02x}{int(green * 255):02x}{int(blue * 255):02x}'
+
+
+def read_catalogue(catalogue_file: str) -> List[Dict]:
+    """read an entity catalogue. in a .jsonl file every line is an entity like
+    {"name": .., "aliases": [..], "level": .., "color": ..}, only the name is required. in a .tsv file the columns are
+    the name, the aliases separated by |, the level and the color, the last ones can be left out. empty lines and
+    lines starting with # are skipped.
+    :param catalogue_file:
+    :return: the entities, in the format of the config
+    """
+    entities = []
+    with open(catalogue_file, encoding='utf-8') as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip() or line.startswith('#'):
+                continue
+            if catalogue_file.endswith(CATALOGUE_JSONL_EXT):
+                entity = json.loads(line)
+            else:
+                columns = line.rstrip('\r\n').split('\t')
+                entity = {'name': columns[0]}
+                if len(columns) > 1 and columns[1]:
+                    entity['aliases'] = columns[1].split(CATALOGUE_ALIAS_SEP)
+                if len(columns) > 2 and columns[2]:
+                    entity['level'] = int(columns[2])
+                if len(columns) > 3 and columns[3]:
+                    entity['color'] = columns[3]
+            if not entity.get('name'):
+                raise ConfigReadError(msg=f'entity without a name at line {line_number} of {catalogue_file}')
+            entities.append(entity)
+    return entities
+
+
+class EntityCatalogue:
+    """
+    The entities a label can be: the ones of the config, then the ones of its catalogue file (`entity_catalogue` in
+    the config). The catalogue is read the first time it is needed, names are checked with a set and the type-ahead
+    index is built once, in the background with `build_index`. Until it is built the type-ahead scans the labels.
+    """
+
+    def __init__(self, entities: List[Dict], catalogue_file: Union[str, None] = None):
+        self.catalogue_file = catalogue_file
+        self._entities = entities
+        self._names: Union[List[str], None] = None
+        self._name_set: Set[str] = set()
+        self._aliases: Dict[str, str] = dict()  # alias -> name
+        self._colors: Dict[str, str] = dict()
+        self._levels: Dict[str, int] = dict()
+        self._index: Union[LabelIndex, None] = None
+        self._index_thread: Union[threading.Thread, None] = None
+        self._scan: Union[LabelScan, None] = None
+        self._lock = threading.Lock()  # the catalogue is read by the thread that builds the index or by the caller
+
+    def _load(self):
+        with self._lock:
+            if self._names is None:
+                self._read()
+
+    def _read(self):
+        entities = list(self._entities)
+        if self.catalogue_file is not None:
+            entities.extend(read_catalogue(self.catalogue_file))
+        names = []
+        num_colors = 0  # entities that got a generated color
+        for entity in entities:
+            name = entity['name']
+            if name not in self._name_set:  # the first definition wins, the config comes before the catalogue
+                self._name_set.add(name)
+                names.append(name)
+                if 'color' in entity:
+                    self._colors[name] = entity['color']
+                else:
+                    self._colors[name] = entity_color(num_colors)
+                    num_colors += 1
+                self._levels[name] = entity.get('level', 1)
+            for alias in entity.get('aliases', []):  # the catalogue can add aliases to the entities of the config
+                self._aliases.setdefault(alias, name)
+        self._names = names
+
+    def __len__(self) -> int:
+        self._load()
+        return len(self._names)
+
+    def __contains__(self, name: str) -> bool:
+        self._load()
+        return name in self._name_set
+
+    @property
+    def names(self) -> List[str]:
+        self._load()
+        return self._names
+
+    @property
+    def colors(self) -> Dict[str, str]:
+        self._load()
+        return self._colors
+
+    @property
+    def levels(self) -> Dict[str, int]:
+        self._load()
+        return self._levels
+
+    def resolve(self, label: str) -> Union[str, None]:
+        """
+        :param label: an entity name or alias
+        :return: the name of the entity, None if there is no such entity
+        """
+        self._load()
+        if label in self._name_set:
+            return label
+        return self._aliases.get(label)
+
+    def _build_index(self):
+        self._load()
+        self._index = LabelIndex(self._names + list(self._aliases))
+
+    def build_index(self) -> threading.Thread:
+        """read the catalogue and build the type-ahead index in a background thread, once
+        :return: the thread
+        """
+        if self._index_thread is None:
+            self._index_thread = threading.Thread(target=self._build_index, name='satya-label-index', daemon=True)
+            self._index_thread.start()
+        return self._index_thread
+
+    def label_index(self) -> Union[LabelIndex, LabelScan]:
+        """the type-ahead index of the names and aliases. it is built here unless `build_index` was called, then the
+        labels are scanned until it is built
+        :return:
+        """
+        if self._index is None:
+            if self._index_thread is not None:
+                if self._scan is None:
+                    self._load()
+                    self._scan = LabelScan(self._names + list(self._aliases))
+                return self._scan
+            self._build_index()
+        return self._index
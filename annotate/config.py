@@ -0,0 +1,175 @@
+# reading, validating and caching the config files
+import os
+import json
+import hashlib
+import tempfile
+from typing import Dict, List, Union
+from annotate.consts import *
+from annotate.catalogue import EntityCatalogue, entity_color
+from annotate.exceptions import ConfigReadError
+
+
+def parse_config(config_file: str, data: bytes) -> Dict:
+    """parse the text of a json or yml config file
+    :param config_file: the name of the file, for the format
+    :param data: the content of the file
+    :return:
+    """
+    if config_file.endswith("json"):
+        return json.loads(data.decode('utf-8'))
+    if config_file.endswith("yml") or config_file.endswith("yaml"):
+        import yaml
+
+        return yaml.safe_load(data)
+    raise ConfigReadError(msg=f'unsupported format for {config_file}')
+
+
+def read_config(config_file: str) -> Dict:
+    """read a json or yml config file
+    :param config_file:
+    :return:
+    """
+    if not os.path.exists(config_file):
+        raise ConfigReadError(msg=f'no config file at {config_file}')
+    with open(config_file, 'rb') as f:
+        return parse_config(config_file, f.read())
+
+
+def validate(config: Dict):
+    """validate the config file for the span annotator, raise exceptions as necessary. the entity catalogue is only
+    read if a relation has an entity that is not in the config
+    :param config:
+    :return:
+    """
+    if not isinstance(config, dict) or not config.get(ENTITIES_KEY):
+        raise ConfigReadError(msg='must provide entities')
+    for entity_desc in config['entities']:
+        if 'name' not in entity_desc:
+            raise ConfigReadError(msg='each entity must have a name')
+        if entity_desc.get('shortcut') in RESERVED_CHARS:
+            raise ConfigReadError(
+                msg=f'shortcut {entity_desc.get("shortcut")} for entity {entity_desc["name"]} not allowed because it '
+                f'is a reserved character'
+            )
+    entity_names = set(entity['name'] for entity in config['entities'])
+    catalogue = EntityCatalogue(config['entities'], config.get(ENTITY_CATALOGUE_KEY))
+    relation_entities = [(relation['name'], relation['entities']) for relation in config.get('relations') or []]
+    for relation_name, entities_this_relation in relation_entities:
+        for entity_pair in entities_this_relation:
+            start = entity_pair.get('start')
+            end = entity_pair.get('end')
+            if start is None or end is None:
+                raise ConfigReadError(msg=f'Start or End entity not provided for relation {relation_name}')
+            for entity in [start, end]:
+                if entity not in entity_names and entity not in catalogue:
+                    raise ConfigReadError(
+                        msg=f'relation {relation_name} has an entity {entity} which is not in the entities list'
+                    )
+    return
+
+
+def get_entity_colors(entity_list: List[Dict[str, str]]) -> Dict[str, str]:
+    """get the  entity colors. if no color is provided, create own
+    :param entity_list:
+    :return:
+    """
+    color_index = 0
+    entity_colors = dict()
+    for entity_desc in entity_list:
+        if 'color' in entity_desc:
+            entity_colors[entity_desc['name']] = entity_desc['color']
+        else:
+            entity_colors[entity_desc['name']] = entity_color(color_index)
+            color_index += 1
+    return entity_colors
+
+
+def compile_config(config: Dict) -> Dict:
+    """validate a config and add what the annotator needs from it: the entity names, colors, shortcuts and levels
+    :param config:
+    :return: a new dict, compiling it again returns it as it is
+    """
+    if config.get(CONFIG_COMPILED_KEY):
+        return config
+    validate(config)
+    entities = config[ENTITIES_KEY]
+    return {
+        **config,
+        CONFIG_COMPILED_KEY: True,
+        ENTITY_NAMES_KEY: [x['name'] for x in entities],
+        ENTITY_COLORS_KEY: get_entity_colors(entities),
+        ENTITY_SHORTCUTS_KEY: {x['shortcut']: x['name'] for x in entities if 'shortcut' in x},
+        ENTITY_LEVELS_KEY: {x['name']: x.get('level', 1) for x in entities},
+    }
+
+
+def load_config(config_file: str, cache_dir: Union[str, None] = None) -> Dict:
+    """read, validate and compile a config file. the compiled config is cached: it is used as long as the file has
+    the same mtime and size, or else the same sha256, so the file is only parsed and validated after it changes (or
+    its entity catalogue changes). the path of the catalogue is made relative to the config file
+    :param config_file:
+    :param cache_dir: where the compiled configs are kept, CONFIG_CACHE_DIR by default
+    :return:
+    """
+    try:
+        stat = os.stat(config_file)
+    except OSError:
+        raise ConfigReadError(msg=f'no config file at {config_file}')
+    cache_dir = os.path.expanduser(cache_dir or os.environ.get(CONFIG_CACHE_DIR_ENV, CONFIG_CACHE_DIR))
+    key = hashlib.sha1(os.path.abspath(config_file).encode('utf-8')).hexdigest()
+    cache_file = os.path.join(cache_dir, f'{key}.json')
+    cached = read_cached_config(cache_file)
+    if cached is not None:
+        catalogue_key = file_key(cached['config'].get(ENTITY_CATALOGUE_KEY))
+        if [cached['mtime_ns'], cached['size'], cached['catalogue']] == [stat.st_mtime_ns, stat.st_size, catalogue_key]:
+            return cached['config']
+    with open(config_file, 'rb') as f:
+        data = f.read()
+    sha256 = hashlib.sha256(data).hexdigest()
+    if cached is not None and cached['sha256'] == sha256 and cached['catalogue'] == catalogue_key:  # only touched
+        config = cached['config']
+    else:
+        config = parse_config(config_file, data)
+        if isinstance(config, dict) and config.get(ENTITY_CATALOGUE_KEY):
+            catalogue_file = os.path.expanduser(config[ENTITY_CATALOGUE_KEY])
+            config[ENTITY_CATALOGUE_KEY] = os.path.join(os.path.dirname(os.path.abspath(config_file)), catalogue_file)
+        config = compile_config(config)
+    cached = {
+        'version': CONFIG_CACHE_VERSION,
+        'mtime_ns': stat.st_mtime_ns,
+        'size': stat.st_size,
+        'sha256': sha256,
+        'catalogue': file_key(config.get(ENTITY_CATALOGUE_KEY)),
+        'config': config,
+    }
+    try:  # the cache is optional, e.g. the home directory can be read only
+        os.makedirs(cache_dir, exist_ok=True)
+        with tempfile.NamedTemporaryFile('w', dir=cache_dir, suffix=JOURNAL_TEMP_FILE_EXT, delete=False) as f:
+            json.dump(cached, f)
+        os.replace(f.name, cache_file)
+    except (OSError, TypeError, ValueError):
+        pass
+    return config
+
+
+def file_key(file_name: Union[str, None]) -> Union[List[int], None]:
+    """the mtime and size of a file, None if there is no such file
+    :param file_name:
+    :return:
+    """
+    try:
+        stat = os.stat(file_name)
+    except (OSError, TypeError):
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def read_cached_config(cache_file: str) -> Union[Dict, None]:
+    try:
+        with open(cache_file) as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(cached, dict) or cached.get('version') != CONFIG_CACHE_VERSION:
+        return None
+    return cached
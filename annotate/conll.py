@@ -0,0 +1,44 @@
+# reads (multi-column) conll files: one token per line, the word then a BIO label per column, sentences separated by
+# empty lines
+from typing import IO, Iterator, List, Tuple
+from annotate.consts import *
+
+
+def iter_conll_sentences(fp: IO[str]) -> Iterator[List[List[str]]]:
+    """read a conll file one sentence at a time
+    :param fp: the open file
+    :return: the rows of every sentence, a row is the word and its labels
+    """
+    rows = []
+    for line in fp:
+        row = line.split()
+        if not row:
+            if rows:
+                yield rows
+                rows = []
+        elif row[0] != CONLL_DOC_START:
+            rows.append(row)
+    if rows:
+        yield rows
+
+
+def decode_bio(labels: List[str]) -> List[Tuple[str, int, int]]:
+    """find the spans of a column of BIO (or BIOES) labels. an I- label that does not continue a span of the same
+    entity starts a new one, as if it was a B- label. anything else than B-, I-, E- and S- labels is outside of a span.
+    :param labels: one label per token
+    :return: (entity, index of the first token, index of the last token) of every span
+    """
+    spans = []
+    entity, start = None, 0
+    for index, label in enumerate(labels):
+        prefix, name = label[: len(BIO_BEGIN)], label[len(BIO_BEGIN) :]
+        if entity is None or prefix not in [BIO_INSIDE, BIO_END] or name != entity:  # the span does not go on
+            if entity is not None:
+                spans.append((entity, start, index - 1))
+            entity, start = (name, index) if prefix in [BIO_BEGIN, BIO_INSIDE, BIO_END, BIO_SINGLE] else (None, 0)
+        if entity is not None and prefix in [BIO_END, BIO_SINGLE]:
+            spans.append((entity, start, index))
+            entity = None
+    if entity is not None:
+        spans.append((entity, start, len(labels) - 1))
+    return spans
@@ -17,6 +17,18 @@ NEW_LINE_CHAR = "\n"
 ALL_INPUT_KEYS = "0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ"
 ENTITIES_KEY = "entities"
 RELATIONS_KEY = "relations"
+CONFIG_COMPILED_KEY = "compiled"  # the keys below are added to a config by compile_config
+ENTITY_NAMES_KEY = "entity_names"
+ENTITY_COLORS_KEY = "entity_colors"
+ENTITY_SHORTCUTS_KEY = "entity_shortcuts"
+ENTITY_LEVELS_KEY = "entity_levels"
+CONFIG_CACHE_DIR = "~/.cache/satya"
+CONFIG_CACHE_DIR_ENV = "SATYA_CACHE_DIR"
+CONFIG_CACHE_VERSION = 2
+ENTITY_CATALOGUE_KEY = "entity_catalogue"  # a .tsv or .jsonl file with more entities, relative to the config file
+CATALOGUE_JSONL_EXT = ".jsonl"
+CATALOGUE_ALIAS_SEP = "|"
+GOLDEN_RATIO_CONJUGATE = 0.618033988749895  # spreads the generated entity colors around the hue circle
 PARENT_TITLE = "Span Annotator"
 TAG_START_B = "/B-"
 TAG_START_I = "/I-"
@@ -24,6 +36,8 @@ TAG_START_I = "/I-"
 # special keys
 UNDO_KEY = "<Control-z>"
 UNDO_COMMAND = "undo"
+REDO_KEY = "<Control-y>"
+REDO_COMMAND = "redo"
 UN_LABEL_KEY = "<Control-q>"
 UN_LABEL_COMMAND = "un label entities"
 SHOW_SPAN_INFO_KEY = "<Control-s>"
@@ -32,7 +46,14 @@ UN_LABEL_FROM_SPAN_INFO_AREA_KEY = "<Control-d>"
 UN_LABEL_FROM_SPAN_INFO_AREA_COMMAND = "un label relations"
 RELATION_ENTITY_KEY = "<Control-e>"
 RELATION_ENTITY_COMMAND = "select-relation-entity"
-SPECIAL_KEYS = [UNDO_KEY, UN_LABEL_KEY, SHOW_SPAN_INFO_KEY, UN_LABEL_FROM_SPAN_INFO_AREA_KEY, RELATION_ENTITY_KEY]
+SPECIAL_KEYS = [
+    UNDO_KEY,
+    REDO_KEY,
+    UN_LABEL_KEY,
+    SHOW_SPAN_INFO_KEY,
+    UN_LABEL_FROM_SPAN_INFO_AREA_KEY,
+    RELATION_ENTITY_KEY,
+]
 RESERVED_CHARS = [x.split("-")[1][0] for x in SPECIAL_KEYS]
 
 # consts for typeahead
@@ -40,12 +61,61 @@ TYPE_AHEAD_LISTBOX_HEIGHT = 5
 TYPE_AHEAD_LISTBOX_WIDTH = 25
 TYPE_AHEAD_ENTRY_WIDTH = 25
 TYPE_AHEAD_NO_RESULTS_MESSAGE = "No results found for '{0:}'"
+TYPE_AHEAD_MAX_RESULTS = 50  # labels shown in the type-ahead listbox, the best matches first
+LABEL_INDEX_GRAM_SIZE = 3  # the type-ahead indexes the substrings of the labels up to this length
 
 DEFAULT_HIGHLIGHT_COLOR = 'yellow'
+LABEL_TAG_PREFIX = 'LABEL_TAG_'  # text area tags are named LABEL_TAG_<level>.<label>
 FILE_TYPE_JSON = '.json'
 FILE_TYPE_TXT = '.txt'
 FILE_TYPE_CONLL = '.conll'
-ALLOWED_FILE_TYPE = [FILE_TYPE_JSON, FILE_TYPE_TXT, FILE_TYPE_CONLL]
+FILE_TYPE_BINARY = '.satya'
+GZIP_FILE_EXT = '.gz'
+XZ_FILE_EXT = '.xz'
+COMPRESSED_FILE_EXTS = [GZIP_FILE_EXT, XZ_FILE_EXT]  # json files can be compressed
+JSON_VERSION_KEY = 'version'
+JSON_VERSION = 2  # tokens stored column by column, spans, relations and token-span pairs as rows
+CONTENT_KEYS = [JSON_VERSION_KEY, 'tokens', 'spans', 'relations', 'tokens_spans']
+ALLOWED_FILE_TYPE = [FILE_TYPE_JSON, FILE_TYPE_TXT, FILE_TYPE_CONLL, FILE_TYPE_BINARY]
+BIO_BEGIN = 'B-'
+BIO_INSIDE = 'I-'
+BIO_END = 'E-'  # BIOES
+BIO_SINGLE = 'S-'  # BIOES
+BIO_OUTSIDE = 'O'
+CONLL_DOC_START = '-DOCSTART-'
+EXPORT_FORMAT_BIO = 'bio'
+EXPORT_FORMAT_BIOES = 'bioes'
+EXPORT_FORMAT_JSONL = 'jsonl'
+EXPORT_FORMAT_BRAT = 'brat'
+ALL_EXPORT_FORMATS = [EXPORT_FORMAT_BIO, EXPORT_FORMAT_BIOES, EXPORT_FORMAT_JSONL, EXPORT_FORMAT_BRAT]
+EXPORT_BUFFER_SIZE = 1 << 20  # bytes buffered by the exporters before writing
+BRAT_TEXT_FILE_EXT = '.txt'
+BATCH_CONVERT = 'convert'
+BATCH_EXPORT = 'export'
+BATCH_CHECK = 'check'
+BATCH_COMMANDS = [BATCH_CONVERT, BATCH_EXPORT, BATCH_CHECK]
+BATCH_CONVERT_TARGETS = ['json', 'json.gz', 'json.xz', 'satya']  # extensions of the converted files
+
+# operations on the content, these are written to the journal
+OP_ADD_ENTITY = 'add_entity'
+OP_DELETE_ENTITY = 'delete_entity'
+OP_RESTORE_ENTITY = 'restore_entity'  # puts back a deleted tag, used by undo
+OP_ADD_RELATION = 'add_relation'
+OP_DELETE_RELATION = 'delete_relation'
+JOURNAL_FILE_EXT = '.journal'
+JOURNAL_SEQ_KEY = 'journal_seq'
+JOURNAL_COMPACT_SIZE = 1000  # write a snapshot after these many journal records
+JOURNAL_TEMP_FILE_EXT = '.tmp'
+AUTOSAVE_DELAY_KEY = "autosave_delay"
+AUTOSAVE_DELAY = 1.0  # seconds without edits before the pending edits are written
+JSON_READ_CHUNK_SIZE = 1 << 20  # characters read at a time from a json file
+TEXT_INDEX_FILE_EXT = '.idx'
+TEXT_INDEX_CACHE_SIZE = 1 << 24  # the line offsets of text files bigger than this (bytes) are cached next to them
+VIEW_WINDOW_KEY = "view_window"
+VIEW_WINDOW_SENTENCES = 400  # larger documents are shown in a window of these many sentences, 0 shows everything
+MOVETO = 'moveto'
+VIEW_PAGE_THRESHOLD = 0.2  # move the window when the viewport is this close to one of its edges
+HISTORY_MAX_OPERATIONS = 100000  # operations (and their inverses) kept for undo
 
 TKINTER_COLORS = [
     'LightGreen',
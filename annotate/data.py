@@ -1,20 +1,41 @@
 # code for data models
-from typing import Dict, Set, List, Union, Tuple
+from typing import Any, Callable, Dict, Iterator, Sequence, Set, List, Union, Tuple
+from array import array
+from itertools import chain, groupby
+from bisect import bisect_left, bisect_right, insort
 import json
+import sys
+from annotate.jsonstream import iter_json_items, open_json
+from annotate.textsource import TextSource
+from annotate.conll import iter_conll_sentences, decode_bio
+from annotate.binary import BinaryFile, TOKEN_SEN_INDEX, TOKEN_TOK_INDEX, TOKEN_CHAR_START, TOKEN_CHAR_END
+from annotate.binary import TOKEN_CONTENT, TOKEN_IDS, TOKEN_TAGS, SPANS, SPAN_TAGS, RELATIONS, TOKENS_SPANS
 from annotate.exceptions import *
 
 
 class Tag:
+    __slots__ = ('content', 'color', 'level')
+
     def __init__(self, content: str, color: str, level: int = 1):
         self.content = content
         self.color = color
         self.level = level
 
     def serialize(self) -> Dict:
-        return {'content': self.content, 'color': self.color}
+        return {'content': self.content, 'color': self.color, 'level': self.level}
+
+    def __eq__(self, other):
+        if not isinstance(other, Tag):
+            return NotImplemented
+        return (self.content, self.color, self.level) == (other.content, other.color, other.level)
+
+    def __hash__(self):
+        return hash((self.content, self.color, self.level))
 
 
 class Token:
+    __slots__ = ('content', 'sen_index', 'tok_index', 'char_start_index', 'char_end_index', 'id', 'tags')
+
     def __init__(
         self, content: str, sen_index: int, tok_index: int, char_start_index: int, char_end_index: int, **kwargs
     ):
@@ -25,7 +46,7 @@ class Token:
         self.char_start_index = char_start_index
         self.char_end_index = char_end_index
         self.id: str = kwargs.get('id', f'{self.sen_index}:{self.tok_index}')
-        self.tags: List[str] = kwargs.get('tag', [])
+        self.tags: List[str] = list(kwargs.get('tags', kwargs.get('tag', [])))
 
     def serialize(self) -> Dict:
         return {
@@ -35,11 +56,257 @@ class Token:
             'char_start_index': self.char_start_index,
             'char_end_index': self.char_end_index,
             'id': self.id,
-            'tags': self.tags,
+            'tags': list(self.tags),
+        }
+
+    def __eq__(self, other):
+        if not isinstance(other, (Token, TokenView)):
+            return NotImplemented
+        return token_key(self) == token_key(other)
+
+    def __hash__(self):
+        return hash(self.id)
+
+
+def token_key(token: Union[Token, 'TokenView']) -> Tuple:
+    """the values that make two tokens equal, the tags are not part of it"""
+    return token.id, token.content, token.sen_index, token.char_start_index, token.char_end_index
+
+
+class TokenView:
+    """
+    A token stored in a `TokenTable`, with the same attributes as `Token`. Views are created on access and hold no
+    data of their own. A token without tags returns a new empty list from `tags`, change the tags through `Content`.
+    """
+
+    __slots__ = ('table', 'row')
+
+    def __init__(self, table: 'TokenTable', row: int):
+        self.table = table
+        self.row = row
+
+    @property
+    def content(self) -> str:
+        return self.table.contents[self.row]
+
+    @property
+    def sen_index(self) -> int:
+        return self.table.sen_indices[self.row]
+
+    @property
+    def tok_index(self) -> int:
+        return self.table.tok_indices[self.row]
+
+    @property
+    def char_start_index(self) -> int:
+        return self.table.char_start_indices[self.row]
+
+    @property
+    def char_end_index(self) -> int:
+        return self.table.char_end_indices[self.row]
+
+    @property
+    def id(self) -> str:
+        return self.table.token_id(self.row)
+
+    @property
+    def tags(self) -> List[str]:
+        return self.table.tags.get(self.row, [])
+
+    def serialize(self) -> Dict:
+        return self.table.serialize_row(self.row)
+
+    def __eq__(self, other):
+        if not isinstance(other, (Token, TokenView)):
+            return NotImplemented
+        if isinstance(other, TokenView) and other.table is self.table:
+            return other.row == self.row
+        return token_key(self) == token_key(other)
+
+    def __hash__(self):
+        return hash(self.id)
+
+
+class TokenTable:
+    """
+    The tokens of a content in parallel columns: `array`s for the sentence index, token index and char offsets, a
+    list of interned strings for the contents. Ids that differ from `sen_index:tok_index` and the tags are stored
+    sparsely. The tokens of a sentence must be appended together and in order, so a sentence is a range of rows.
+    """
+
+    def __init__(self):
+        self.sen_indices = array('i')
+        self.tok_indices = array('i')
+        self.char_start_indices = array('i')
+        self.char_end_indices = array('i')
+        self.contents: List[str] = []
+        self.tags: Dict[int, List[str]] = dict()  # row -> tags, only for tokens that have tags
+        self._ids: Dict[int, str] = dict()  # row -> id, only for ids that are not `sen_index:tok_index`
+        self._rows_by_id: Dict[str, int] = dict()
+        self._sentence_rows: Dict[int, Tuple[int, int]] = dict()  # sen_index -> (first row, last row + 1)
+
+    def __len__(self) -> int:
+        return len(self.contents)
+
+    def __iter__(self) -> Iterator[TokenView]:
+        return (TokenView(self, row) for row in range(len(self.contents)))
+
+    def __getitem__(self, row: int) -> TokenView:
+        if row < 0:
+            row += len(self.contents)
+        if not 0 <= row < len(self.contents):
+            raise IndexError('token row out of range')
+        return TokenView(self, row)
+
+    def append(
+        self,
+        content: str,
+        sen_index: int,
+        tok_index: int,
+        char_start_index: int,
+        char_end_index: int,
+        id_: Union[str, None] = None,
+        tags: Union[List[str], None] = None,
+    ) -> int:
+        """add a token after the last one
+        :return: the row of the token
+        """
+        assert content.strip()
+        row = len(self.contents)
+        first_row, end_row = self._sentence_rows.get(sen_index, (row, row))
+        if end_row != row:
+            raise ValueError(f'the tokens of sentence {sen_index} must be added together')
+        if end_row > first_row and char_start_index < self.char_start_indices[row - 1]:
+            raise ValueError(f'the tokens of sentence {sen_index} must be added in order')
+        self._sentence_rows[sen_index] = (first_row, row + 1)
+        self.sen_indices.append(sen_index)
+        self.tok_indices.append(tok_index)
+        self.char_start_indices.append(char_start_index)
+        self.char_end_indices.append(char_end_index)
+        self.contents.append(sys.intern(content))
+        if id_ is not None and id_ != f'{sen_index}:{tok_index}':
+            self._ids[row] = id_
+            self._rows_by_id[id_] = row
+        if tags:
+            self.tags[row] = [sys.intern(tag) for tag in tags]
+        return row
+
+    def extend(
+        self,
+        sen_indices: array,
+        tok_indices: array,
+        char_start_indices: array,
+        char_end_indices: array,
+        contents: List[str],
+        ids: Dict[int, str],
+        tags: Dict[int, List[str]],
+    ):
+        """add whole columns of tokens after the last one, the tokens must be grouped by sentence and in order
+        :param ids: row in the new columns -> id, for the ids that are not `sen_index:tok_index`
+        :param tags: row in the new columns -> tags
+        :return:
+        """
+        first_row = len(self.contents)
+        row = first_row
+        for sen_index, group in groupby(sen_indices):
+            if sen_index in self._sentence_rows:
+                raise ValueError(f'the tokens of sentence {sen_index} must be added together')
+            end_row = row + sum(1 for _ in group)
+            self._sentence_rows[sen_index] = (row, end_row)
+            row = end_row
+        self.sen_indices.extend(sen_indices)
+        self.tok_indices.extend(tok_indices)
+        self.char_start_indices.extend(char_start_indices)
+        self.char_end_indices.extend(char_end_indices)
+        self.contents.extend(contents)
+        for row, id_ in ids.items():
+            self._ids[first_row + row] = id_
+            self._rows_by_id[id_] = first_row + row
+        for row, tags_this_row in tags.items():
+            self.tags[first_row + row] = tags_this_row
+
+    def ids(self) -> Dict[int, str]:
+        """get the ids that are not `sen_index:tok_index`
+        :return: row -> id
+        """
+        return dict(self._ids)
+
+    def token_id(self, row: int) -> str:
+        id_ = self._ids.get(row)
+        if id_ is None:
+            return f'{self.sen_indices[row]}:{self.tok_indices[row]}'
+        return id_
+
+    def row_from_token_id(self, id_: str) -> Union[int, None]:
+        """find a token by id without a dict of all the ids: default ids are `sen_index:tok_index`, and the token
+        indices of a sentence are sorted
+        :param id_:
+        :return:
+        """
+        row = self._rows_by_id.get(id_)
+        if row is not None:
+            return row
+        try:
+            sen_index, tok_index = [int(x) for x in id_.split(':')]
+        except ValueError:
+            return None
+        first_row, end_row = self._sentence_rows.get(sen_index, (0, 0))
+        row = bisect_left(self.tok_indices, tok_index, first_row, end_row)
+        if row == end_row or self.tok_indices[row] != tok_index:  # token indices out of order, scan the sentence
+            rows = [x for x in range(first_row, end_row) if self.tok_indices[x] == tok_index]
+            if not rows:
+                return None
+            row = rows[0]
+        if row in self._ids:
+            return None
+        return row
+
+    def sentence_indices(self) -> List[int]:
+        return list(self._sentence_rows)
+
+    def sentence_rows(self, sen_index: int) -> range:
+        return range(*self._sentence_rows.get(sen_index, (0, 0)))
+
+    def add_tag(self, row: int, tag: str, index: Union[int, None] = None):
+        tags = self.tags.setdefault(row, [])
+        tags.insert(len(tags) if index is None else index, sys.intern(tag))
+
+    def remove_tag(self, row: int, tag: str) -> int:
+        """remove a tag from a token
+        :return: the position the tag had
+        """
+        tags = self.tags[row]
+        index = tags.index(tag)
+        del tags[index]
+        if not tags:
+            del self.tags[row]
+        return index
+
+    def serialize_row(self, row: int) -> Dict:
+        return {
+            'content': self.contents[row],
+            'sen_index': self.sen_indices[row],
+            'tok_index': self.tok_indices[row],
+            'char_start_index': self.char_start_indices[row],
+            'char_end_index': self.char_end_indices[row],
+            'id': self.token_id(row),
+            'tags': list(self.tags.get(row, [])),
         }
 
 
 class Span:
+    __slots__ = (
+        'sen_index',
+        'tok_start_index',
+        'tok_end_index',
+        'content',
+        'char_start_index',
+        'char_end_index',
+        'tags',
+        'id',
+        'max_level',
+    )
+
     def __init__(self, **kwargs):
         tokens: List[Token] = kwargs.get('tokens', [])
         if tokens:
@@ -63,6 +330,7 @@ class Span:
             self.char_end_index = kwargs['char_end_index']
         self.tags: List[Tag] = kwargs.get('tags', [])
         self.id = kwargs.get('id', f'{self.sen_index}:{self.tok_start_index}:{self.tok_end_index}')
+        self.max_level = max([tag.level for tag in self.tags], default=0)  # kept up to date by the tag methods
 
     def add_entity(self, tag: Tag):
         """add a label to the span
@@ -70,14 +338,31 @@ class Span:
         :param tag:
         :return:
         """
-        tag_max_level = max([tag.level for tag in self.tags])
-        if tag.level < tag_max_level:
+        if tag.level < self.max_level:
             raise TagLevelHierarchyError(
                 f'span {self.content} has tags {[(x.content, x.level) for x in self.tags]}, '
                 f'tag {tag.content} has a lower level {tag.level}'
             )
         if tag.content not in [tag.content for tag in self.tags]:
-            self.tags.append(tag)
+            self.insert_tag(len(self.tags), tag)
+
+    def insert_tag(self, index: int, tag: Tag):
+        """put a tag at a position without checking the levels
+        :param index:
+        :param tag:
+        :return:
+        """
+        self.tags.insert(index, tag)
+        self.max_level = max(self.max_level, tag.level)
+
+    def remove_tag(self, index: int) -> Tag:
+        """remove the tag at a position
+        :param index:
+        :return: the removed tag
+        """
+        tag = self.tags.pop(index)
+        self.max_level = max([tag_.level for tag_ in self.tags], default=0)
+        return tag
 
     def serialize(self) -> Dict:
         return {
@@ -91,8 +376,18 @@ class Span:
             'id': self.id,
         }
 
+    def __eq__(self, other):
+        if not isinstance(other, Span):
+            return NotImplemented
+        return self.id == other.id
+
+    def __hash__(self):
+        return hash(self.id)
+
 
 class Relation:
+    __slots__ = ('start_id', 'end_id', 'name')
+
     def __init__(self, start_id: str, end_id: str, name: str):
         self.start_id = start_id
         self.end_id = end_id
@@ -101,6 +396,46 @@ class Relation:
     def serialize(self) -> Dict:
         return {'start_id': self.start_id, 'end_id': self.end_id, 'name': self.name}
 
+    def __eq__(self, other):
+        if not isinstance(other, Relation):
+            return NotImplemented
+        return (self.start_id, self.end_id, self.name) == (other.start_id, other.end_id, other.name)
+
+    def __hash__(self):
+        return hash((self.start_id, self.end_id, self.name))
+
+
+def relation_sort_key(relation: Relation) -> Tuple[str, str, str]:
+    return relation.name, relation.start_id, relation.end_id
+
+
+def span_from_dict(s: Dict) -> Span:
+    return Span(
+        sen_index=s['sen_index'],
+        tok_start_index=s['tok_start_index'],
+        tok_end_index=s['tok_end_index'],
+        content=s['content'],
+        char_start_index=s['char_start_index'],
+        char_end_index=s['char_end_index'],
+        tags=[Tag(**t) for t in s['tags']],
+        id=s['id'],
+    )
+
+
+def sen_index_from_id(id_: str, sentences: Dict[str, int]) -> Union[int, None]:
+    """get the sentence of a token or span id: default ids start with the sentence index, the others are looked up
+    :param id_:
+    :param sentences: id -> sentence index, for the ids that do not start with their sentence index
+    :return:
+    """
+    sen_index = sentences.get(id_)
+    if sen_index is not None:
+        return sen_index
+    try:
+        return int(id_.split(':', 1)[0])
+    except ValueError:
+        return None
+
 
 class Content:
     """
@@ -108,62 +443,509 @@ class Content:
     """
 
     def __init__(self, **kwargs):
-        self.tokens: List[Token] = kwargs.get('tokens', [])  # should really be an ordered set
-        self.spans: Set[Span] = set(kwargs.get('spans', []))
-        self.relations: Set[Relation] = set(kwargs.get('relations', []))
-        self.tokens_spans: List[Tuple[str, str]] = kwargs.get('tokens_spans', [])
+        self._tokens = TokenTable()
+        self._spans: Set[Span] = set()
+        self.relations: Set[Relation] = set()
+        # indexes, these must be kept in sync with the sets above
+        self._span_index: Dict[str, Span] = dict()
+        self._token_span_ids: Dict[str, Dict[str, None]] = dict()  # token id -> span ids (an ordered set)
+        self._span_token_ids: Dict[str, List[str]] = dict()  # span id -> token ids
+        self._sentence_spans: Dict[int, Dict[Tuple[int, int], Span]] = dict()  # (char start, char end) -> span
+        self._sentence_span_bounds: Dict[int, List[Tuple[int, int]]] = dict()  # sorted (char start, char end)
+        self._relations_out: Dict[str, Set[Relation]] = dict()  # span id -> relations starting from it
+        self._relations_in: Dict[str, Set[Relation]] = dict()  # span id -> relations ending at it
+        self._changed_sentences: Set[int] = set()  # sentences whose tags changed since the last render
+        self._listeners: List[Callable[[Dict, List[Dict]], None]] = []  # called with every change of the content
+        # sentences read by populate_from_json but not created yet: sen_index -> json arrays of the tokens, spans and
+        # (token id, span id) pairs of the sentence
+        self._pending: Dict[int, Tuple[str, str, str]] = dict()
+        self._pending_token_sentences: Dict[str, int] = dict()  # token id -> sen_index, for non default ids
+        self._pending_span_sentences: Dict[str, int] = dict()  # span id -> sen_index, for non default ids
+        self._sentence_order: Union[Sequence[int], None] = None  # sentence indices in file order, for lazy loads
+        # the lines populate_from_text has not split into tokens yet: _pending_lines[sen_index] is 1 until it is
+        self._text_source: Union[TextSource, None] = None
+        self._pending_lines = bytearray()
+        self._add_tokens([token.serialize() for token in kwargs.get('tokens', [])])
+        for span in kwargs.get('spans', []):
+            self._add_span(span)
+        for relation in kwargs.get('relations', []):
+            self._add_relation(relation)
+        self.tokens_spans = kwargs.get('tokens_spans', [])
+
+    @property
+    def tokens(self) -> TokenTable:
+        """the token table, with the tokens of every sentence
+        :return:
+        """
+        self.hydrate()
+        return self._tokens
+
+    @property
+    def spans(self) -> Set[Span]:
+        self.hydrate()
+        return self._spans
+
+    @property
+    def tokens_spans(self) -> List[Tuple[str, str]]:
+        """the (token id, span id) pairs, materialized from the token <-> span index
+        :return:
+        """
+        self.hydrate()
+        return [(token_id, span_id) for span_id, token_ids in self._span_token_ids.items() for token_id in token_ids]
+
+    @tokens_spans.setter
+    def tokens_spans(self, tokens_spans: List[Tuple[str, str]]):
+        self._token_span_ids = dict()
+        self._span_token_ids = dict()
+        for token_id, span_id in tokens_spans:
+            self._link_token_span(token_id, span_id)
 
-    def populate_from_json(self, json_file: str):
-        """populate the content from a json file
+    def _reset(self):
+        """remove everything from the content
         :return:
         """
-        content = json.load(open(json_file))
+        self._tokens = TokenTable()
+        self._spans = set()
+        self.relations = set()
+        self._span_index = dict()
+        self._token_span_ids = dict()
+        self._span_token_ids = dict()
+        self._sentence_spans = dict()
+        self._sentence_span_bounds = dict()
+        self._relations_out = dict()
+        self._relations_in = dict()
+        self._changed_sentences = set()
+        self._pending = dict()
+        self._pending_token_sentences = dict()
+        self._pending_span_sentences = dict()
+        self._sentence_order = None
+        if self._text_source is not None:
+            self._text_source.close()
+        self._text_source = None
+        self._pending_lines = bytearray()
+
+    def _hydrate(self, sen_index: int):
+        """create the tokens and spans of a sentence populate_from_json has not created yet
+        :param sen_index:
+        :return:
+        """
+        records = self._pending.pop(sen_index, None)
+        if records is None:
+            if self._is_line_pending(sen_index):
+                self._pending_lines[sen_index] = 0
+                self._add_tokens(self._text_source.tokens(sen_index))
+            return
+        tokens, spans, tokens_spans = [json.loads(x) for x in records]
+        self._add_tokens(tokens)
+        for s in spans:
+            self._add_span(span_from_dict(s))
+        for token_id, span_id in tokens_spans:
+            self._link_token_span(token_id, span_id)
+
+    def _is_line_pending(self, sen_index: Union[int, None]) -> bool:
+        return sen_index is not None and 0 < sen_index < len(self._pending_lines) and self._pending_lines[sen_index]
+
+    def _hydrate_token_id(self, id_: str):
+        if self._pending or self._pending_lines:
+            self._hydrate(sen_index_from_id(id_, self._pending_token_sentences))
+
+    def _hydrate_span_id(self, id_: str):
+        if self._pending or self._pending_lines:
+            self._hydrate(sen_index_from_id(id_, self._pending_span_sentences))
+
+    def hydrate(self):
+        """create the tokens and spans of all the sentences, call this before using `tokens` or `spans` directly
+        :return:
+        """
+        for sen_index in list(self._pending):
+            self._hydrate(sen_index)
+        if any(self._pending_lines):
+            for sen_index in range(1, len(self._pending_lines)):
+                self._hydrate(sen_index)
+
+    def _add_tokens(self, tokens: List[Dict]):
+        """add serialized tokens to the token table, grouped by sentence and in order
+        :param tokens:
+        :return:
+        """
+        first_seen = dict()  # sen_index -> order of appearance
+        keys = []
+        for t in tokens:
+            keys.append((first_seen.setdefault(t['sen_index'], len(first_seen)), t['char_start_index']))
+        if any(keys[index] < keys[index - 1] for index in range(1, len(keys))):  # almost never happens
+            tokens = [t for _, t in sorted(zip(keys, tokens), key=lambda x: x[0])]
+        for t in tokens:
+            self._tokens.append(
+                t['content'],
+                t['sen_index'],
+                t['tok_index'],
+                t['char_start_index'],
+                t['char_end_index'],
+                id_=t.get('id'),
+                tags=t.get('tags', t.get('tag')),
+            )
+
+    def _add_span(self, span: Span):
+        self._spans.add(span)
+        self._span_index[span.id] = span
+        bounds = (span.char_start_index, span.char_end_index)
+        sentence_spans = self._sentence_spans.setdefault(span.sen_index, dict())
+        if bounds not in sentence_spans:
+            insort(self._sentence_span_bounds.setdefault(span.sen_index, []), bounds)
+        sentence_spans[bounds] = span
+
+    def _remove_span(self, span: Span):
+        """remove a span and its token links
+        :param span:
+        :return:
+        """
+        self._spans.discard(span)
+        self._span_index.pop(span.id, None)
+        bounds = (span.char_start_index, span.char_end_index)
+        sentence_spans = self._sentence_spans.get(span.sen_index, dict())
+        if sentence_spans.get(bounds) is span:
+            del sentence_spans[bounds]
+            sentence_span_bounds = self._sentence_span_bounds[span.sen_index]
+            del sentence_span_bounds[bisect_left(sentence_span_bounds, bounds)]
+        for token_id in self._span_token_ids.pop(span.id, []):
+            span_ids = self._token_span_ids.get(token_id)
+            if span_ids is not None:
+                span_ids.pop(span.id, None)
+                if not span_ids:
+                    del self._token_span_ids[token_id]
+
+    def add_listener(self, listener: Callable[[Dict, List[Dict]], None]):
+        """register a callback for the operations (add/delete entity/relation) applied to the content. the listener
+        gets the operation and the operations that undo it. these are json serializable dicts, `apply_operation` can
+        replay them.
+        :param listener:
+        :return:
+        """
+        self._listeners.append(listener)
+
+    def _notify(self, operation: Dict, inverse: List[Dict]):
+        for listener in self._listeners:
+            listener(operation, inverse)
+
+    def apply_operation(self, operation: Dict):
+        """replay an operation sent to the listeners
+        :param operation:
+        :return:
+        """
+        op = operation['op']
+        if op == OP_ADD_ENTITY:
+            self.add_entity(
+                Tag(**operation['tag']),
+                sen_index=operation['sen_index'],
+                char_start_index=operation['char_start_index'],
+                char_end_index=operation['char_end_index'],
+            )
+        elif op == OP_DELETE_ENTITY:
+            span = self.span_from_span_id(operation['span_id'])
+            if span is None:
+                raise UnknownOperationError(f'can not delete a tag from span {operation["span_id"]}, no such span')
+            self.delete_entity(span, Tag(**operation['tag']))
+        elif op == OP_RESTORE_ENTITY:
+            self.restore_entity(
+                Tag(**operation['tag']),
+                sen_index=operation['sen_index'],
+                char_start_index=operation['char_start_index'],
+                char_end_index=operation['char_end_index'],
+                tag_index=operation['tag_index'],
+                token_tag_indices=operation['token_tag_indices'],
+            )
+        elif op == OP_ADD_RELATION:
+            self.add_relation(operation['start_id'], operation['end_id'], operation['name'])
+        elif op == OP_DELETE_RELATION:
+            self.delete_relation(operation['start_id'], operation['end_id'], operation['name'])
+        else:
+            raise UnknownOperationError(f'unknown operation {op}')
+
+    def _add_relation(self, relation: Relation):
+        self.relations.add(relation)
+        self._relations_out.setdefault(relation.start_id, set()).add(relation)
+        self._relations_in.setdefault(relation.end_id, set()).add(relation)
+
+    def _remove_relation(self, relation: Relation):
+        self.relations.discard(relation)
+        for span_id, relations in [(relation.start_id, self._relations_out), (relation.end_id, self._relations_in)]:
+            relations_this_span = relations.get(span_id)
+            if relations_this_span is not None:
+                relations_this_span.discard(relation)
+                if not relations_this_span:
+                    del relations[span_id]
+
+    def _link_token_span(self, token_id: str, span_id: str):
+        span_ids = self._token_span_ids.setdefault(token_id, dict())
+        if span_id not in span_ids:
+            span_ids[span_id] = None
+            self._span_token_ids.setdefault(span_id, []).append(token_id)
+
+    def populate_from_json(self, json_file: str) -> Dict:
+        """populate the content from a json file, .gz and .xz files are decompressed on the fly. a file in the compact
+        layout (see `serialize_columns`, told by its version wherever it is in the file) is read at once, a file in an
+        unknown layout is refused. a file in the first layout is read one record at a time, the records of a sentence
+        are kept as json text and the tokens and spans are created when the sentence is first used, so big files open
+        quickly.
+        :return: the top level values of the file that are not part of the content, e.g. the journal sequence number
+        """
+        with open_json(json_file) as f:
+            items = iter_json_items(f)
+            first = next(items, None)
+            if first is None or first[0] != JSON_VERSION_KEY:
+                others = self._populate_lazily(chain([first] if first is not None else [], items))
+                if others is not None:
+                    return others
+            f.seek(0)  # not in the first layout, e.g. compact: its columns are read at once
+            content = json.load(f)
         self.populate_from_dict(content)
+        return {key: value for key, value in content.items() if key not in CONTENT_KEYS}
+
+    def _populate_lazily(self, items: Iterator[Tuple[str, Any, str]]) -> Dict:
+        """populate the content from the records of a json file in the first (one dict per record) format
+        :param items: from iter_json_items
+        :return: the top level values of the file that are not part of the content, None when the file turns out to be
+        in another layout: it has a version, or its tokens are not records
+        """
+        self._reset()
+        self._sentence_order = []
+        pending: Dict[int, Tuple[List[str], List[str], List[str]]] = dict()
+        tokens_spans: List[Tuple[str, str]] = []  # pairs whose span is not in the file (yet)
+        others = dict()
+        last_sen_index, prefix, token_records = None, '', []
+        for key, item, raw in items:
+            if key == 'tokens':
+                sen_index = item.get('sen_index') if isinstance(item, dict) else None
+                if not isinstance(sen_index, int):  # not a token record, e.g. the token columns of the compact layout
+                    self._reset()
+                    return None
+                if sen_index != last_sen_index:  # the tokens of a sentence are usually next to each other
+                    if sen_index not in pending:
+                        pending[sen_index] = ([], [], [])
+                        self._sentence_order.append(sen_index)
+                    last_sen_index, prefix, token_records = sen_index, f'{sen_index}:', pending[sen_index][0]
+                token_records.append(raw)
+                id_ = item.get('id')
+                if id_ is not None and not id_.startswith(prefix):
+                    self._pending_token_sentences[id_] = sen_index
+            elif key == 'spans':
+                if not isinstance(item, dict):  # a span row of the compact layout
+                    self._reset()
+                    return None
+                sen_index = item['sen_index']
+                pending.setdefault(sen_index, ([], [], []))[1].append(raw)
+                if not item['id'].startswith(f'{sen_index}:'):
+                    self._pending_span_sentences[item['id']] = sen_index
+            elif key == 'relations':
+                self._add_relation(Relation(**item))
+            elif key == JSON_VERSION_KEY:
+                self._reset()
+                return None
+            elif key == 'tokens_spans':
+                sen_index = sen_index_from_id(item[1], self._pending_span_sentences)
+                if sen_index in pending:
+                    pending[sen_index][2].append(raw)
+                else:
+                    tokens_spans.append(item)
+            else:
+                others[key] = item
+        for sen_index, records in pending.items():
+            self._pending[sen_index] = tuple(f'[{",".join(x)}]' for x in records)
+        for token_id, span_id in tokens_spans:
+            sen_index = sen_index_from_id(span_id, self._pending_span_sentences)
+            if sen_index in self._pending:
+                self._hydrate(sen_index)
+            self._link_token_span(token_id, span_id)
+        return others
+
+    def populate_from_binary(self, binary_file: str) -> Dict:
+        """populate the content from a file in the binary format: the token columns are copied as they are, only the
+        string pool is decoded
+        :param binary_file:
+        :return: the top level values of the file that are not part of the content, e.g. the journal sequence number
+        """
+        self._reset()
+        with BinaryFile(binary_file) as f:
+            strings = f.strings()
+            ids = {row: strings[id_] for row, id_ in f.rows(TOKEN_IDS)}
+            tags: Dict[int, List[str]] = dict()
+            for row, tag in f.rows(TOKEN_TAGS):
+                tags.setdefault(row, []).append(strings[tag])
+            self._tokens.extend(
+                f.column(TOKEN_SEN_INDEX),
+                f.column(TOKEN_TOK_INDEX),
+                f.column(TOKEN_CHAR_START),
+                f.column(TOKEN_CHAR_END),
+                [strings[content] for content in f.table(TOKEN_CONTENT).tolist()],
+                ids,
+                tags,
+            )
+            span_tags = [Tag(strings[content], strings[color], level) for content, color, level in f.rows(SPAN_TAGS)]
+            span_ids = []
+            for (
+                sen_index,
+                tok_start_index,
+                tok_end_index,
+                char_start_index,
+                char_end_index,
+                content,
+                id_,
+                first_tag,
+                num_tags,
+            ) in f.rows(SPANS):
+                span = Span(
+                    sen_index=sen_index,
+                    tok_start_index=tok_start_index,
+                    tok_end_index=tok_end_index,
+                    content=strings[content],
+                    char_start_index=char_start_index,
+                    char_end_index=char_end_index,
+                    tags=span_tags[first_tag : first_tag + num_tags],
+                    id=f'{sen_index}:{tok_start_index}:{tok_end_index}' if id_ == -1 else strings[id_],
+                )
+                self._add_span(span)
+                span_ids.append(span.id)
+            for start_id, end_id, name in f.rows(RELATIONS):
+                self._add_relation(Relation(strings[start_id], strings[end_id], strings[name]))
+            for token, span in f.rows(TOKENS_SPANS):
+                token_id = self._tokens.token_id(token) if token >= 0 else strings[~token]
+                self._link_token_span(token_id, span_ids[span] if span >= 0 else strings[~span])
+            return {JOURNAL_SEQ_KEY: f.journal_seq}
 
     def populate_from_dict(self, content: Dict):
-        """populate the content from a dict
+        """populate the content from a dict, in either layout (see `serialize` and `serialize_columns`)
         :param content:
         :return:
         """
-        self.tokens = [Token(**t) for t in content.get('tokens', [])]
-        self.spans = set(
-            [
-                Span(
-                    sen_index=s['sen_index'],
-                    tok_start_index=s['tok_start_index'],
-                    tok_end_index=s['tok_end_index'],
-                    content=s['content'],
-                    char_start_index=s['char_start_index'],
-                    char_end_index=s['char_end_index'],
-                    tags=[Tag(**t) for t in s['tags']],
-                    id=s['id'],
-                )
-                for s in content.get('spans', [])
-            ]
-        )
-        self.relations = set([Relation(**r) for r in content.get('relations', [])])
+        version = content.get(JSON_VERSION_KEY, 1)
+        if version not in range(1, JSON_VERSION + 1):
+            raise UnknownJsonLayoutError(f'{JSON_VERSION_KEY} {version!r}')
+        if version >= JSON_VERSION:
+            self.populate_from_columns(content)
+            return
+        if not isinstance(content.get('tokens', []), list):
+            raise UnknownJsonLayoutError(f'no {JSON_VERSION_KEY} and the tokens are not a list')
+        self._reset()
+        self._add_tokens(content.get('tokens', []))
+        for s in content.get('spans', []):
+            self._add_span(span_from_dict(s))
+        for r in content.get('relations', []):
+            self._add_relation(Relation(**r))
         self.tokens_spans = content.get('tokens_spans', [])
 
+    def populate_from_columns(self, content: Dict):
+        """populate the content from a dict in the compact layout, see `serialize_columns`
+        :param content:
+        :return:
+        """
+        self._reset()
+        tokens = content.get('tokens', dict())
+        self._tokens.extend(
+            array('i', tokens.get('sen_index', [])),
+            array('i', tokens.get('tok_index', [])),
+            array('i', tokens.get('char_start_index', [])),
+            array('i', tokens.get('char_end_index', [])),
+            [sys.intern(x) for x in tokens.get('content', [])],
+            {row: id_ for row, id_ in tokens.get('id', [])},
+            {row: [sys.intern(tag) for tag in tags] for row, tags in tokens.get('tags', [])},
+        )
+        span_ids = []
+        for sen_index, tok_start_index, tok_end_index, char_start_index, char_end_index, text, id_, tags in content.get(
+            'spans', []
+        ):
+            span = Span(
+                sen_index=sen_index,
+                tok_start_index=tok_start_index,
+                tok_end_index=tok_end_index,
+                content=text,
+                char_start_index=char_start_index,
+                char_end_index=char_end_index,
+                tags=[Tag(*tag) for tag in tags],
+                id=f'{sen_index}:{tok_start_index}:{tok_end_index}' if id_ is None else id_,
+            )
+            self._add_span(span)
+            span_ids.append(span.id)
+        for start_id, end_id, name in content.get('relations', []):
+            self._add_relation(Relation(start_id, end_id, name))
+        for token, span in content.get('tokens_spans', []):
+            token_id = self._tokens.token_id(token) if isinstance(token, int) else token
+            self._link_token_span(token_id, span_ids[span] if isinstance(span, int) else span)
+
     def populate_from_text(self, txt_file):
         """
-        populate the content from a text file
+        populate the content from a text file, one sentence per line. the file is memory mapped, a line is split into
+        tokens when the sentence is first used.
         :return:
         """
-        with open(txt_file, 'r') as f:
-            for line_num, line in enumerate(f):
-                if line.endswith(NEW_LINE_CHAR):
-                    line = line[:-1]
+        self._reset()
+        self._text_source = TextSource(txt_file)
+        self._pending_lines = bytearray([0]) + bytearray([1]) * len(self._text_source)
+        self._sentence_order = range(1, len(self._text_source) + 1)
+
+    def populate_from_conll(
+        self,
+        conll_file: str,
+        entity_colors: Union[Dict[str, str], None] = None,
+        entity_levels: Union[Dict[str, int], None] = None,
+    ):
+        """populate the content from a (multi-column) conll file, e.g. one written by `towkf`: the first column has the
+        words, every other column has BIO labels. the file is read one sentence at a time and every column is decoded
+        in one pass, a span labeled in several columns gets all the tags.
+        :param conll_file:
+        :param entity_colors: entity -> color of its tags, DEFAULT_HIGHLIGHT_COLOR for the others
+        :param entity_levels: entity -> level of its tags, 1 for the others
+        :return:
+        """
+        self._reset()
+        entity_colors, entity_levels = entity_colors or dict(), entity_levels or dict()
+        tags: Dict[str, Tag] = dict()  # one tag per entity
+        columns = [array('i'), array('i'), array('i'), array('i')]  # sen_index, tok_index, char start and end
+        contents: List[str] = []
+        token_tags: Dict[int, List[str]] = dict()
+        with open(conll_file, encoding='utf-8') as f:
+            for sen_index, rows in enumerate(iter_conll_sentences(f), start=1):
+                words = [row[0] for row in rows]
+                char_start_indices = []
                 char_index = 0
-                for word_num, word in enumerate(line.split(WORD_SEP)):
-                    token = Token(
-                        content=word,
-                        sen_index=line_num + 1,
-                        tok_index=word_num,
-                        char_start_index=char_index,
-                        char_end_index=char_index + len(word),
-                    )
-                    char_index = char_index + len(word) + 1
-                    self.tokens.append(token)
+                for word in words:
+                    char_start_indices.append(char_index)
+                    char_index += len(word) + len(WORD_SEP)
+                first_row = len(contents)
+                spans: Dict[Tuple[int, int], Span] = dict()
+                for column in range(1, max(len(row) for row in rows)):
+                    labels = [row[column] if column < len(row) else BIO_OUTSIDE for row in rows]
+                    for entity, start, end in decode_bio(labels):
+                        span = spans.get((start, end))
+                        if span is None:
+                            span = spans[(start, end)] = Span(
+                                sen_index=sen_index,
+                                tok_start_index=start,
+                                tok_end_index=end,
+                                content=WORD_SEP.join(words[start : end + 1]),
+                                char_start_index=char_start_indices[start],
+                                char_end_index=char_start_indices[end] + len(words[end]),
+                                tags=[],
+                            )
+                        tag = tags.get(entity)
+                        if tag is None:
+                            color = entity_colors.get(entity, DEFAULT_HIGHLIGHT_COLOR)
+                            tag = tags[entity] = Tag(entity, color, entity_levels.get(entity, 1))
+                        if tag in span.tags:  # the same label in another column
+                            continue
+                        span.insert_tag(len(span.tags), tag)
+                        token_tags.setdefault(first_row + start, []).append(f'{BIO_BEGIN}{entity}')
+                        for index in range(first_row + start + 1, first_row + end + 1):
+                            token_tags.setdefault(index, []).append(f'{BIO_INSIDE}{entity}')
+                columns[0].extend([sen_index] * len(words))
+                columns[1].extend(range(len(words)))
+                columns[2].extend(char_start_indices)
+                columns[3].extend([start + len(word) for start, word in zip(char_start_indices, words)])
+                contents.extend([sys.intern(word) for word in words])
+                for (start, end), span in spans.items():
+                    self._add_span(span)
+                    for tok_index in range(start, end + 1):
+                        self._link_token_span(f'{sen_index}:{tok_index}', span.id)
+        self._tokens.extend(*columns, contents, dict(), token_tags)
 
     def add_entity(self, tag: Tag, sen_index: int, char_start_index: int, char_end_index: int):
         """add a label to a span
@@ -174,51 +956,87 @@ class Content:
         :return:
         """
         # which span have we selected?
-        tokens = []
-        for token in self.tokens:
-            if (
-                token.sen_index == sen_index
-                and token.char_start_index >= char_start_index
-                and token.char_end_index <= char_end_index
-            ):
-                tokens.append(token)
+        tokens = self.tokens_from_char_range(sen_index, char_start_index, char_end_index)
         if not tokens:
             raise NoTagSelectedError('can not add tag when no token is selected')
-        tokens.sort(key=lambda x: x.tok_index)
-        span_ids = [
-            span.id
-            for span in self.spans
-            if span.id == f'{span.sen_index}:{tokens[0].tok_index}:{tokens[-1].tok_index}'
-        ]
-        assert len(span_ids) <= 1
-        new_span = False
-        if span_ids:
-            span = self.span_from_span_id(span_ids[0])
+        span = self.span_from_span_id(f'{sen_index}:{tokens[0].tok_index}:{tokens[-1].tok_index}')
+        if span is not None:
+            if tag.content in [tag_.content for tag_ in span.tags]:  # nothing to do
+                return
             span.add_entity(tag)
         else:
-            inside_spans = [
-                span
-                for span in self.spans
-                if span.char_start_index >= char_start_index and span.char_end_index <= char_end_index
-            ]
+            inside_spans = self.spans_inside(sen_index, char_start_index, char_end_index)
             if inside_spans:
-                inside_span_max_level = max(
-                    [max([tag.level for tag in inside_span.tags]) for inside_span in inside_spans]
-                )
+                inside_span_max_level = max([inside_span.max_level for inside_span in inside_spans])
                 if inside_span_max_level > tag.level:
                     raise TagLevelHierarchyError(
                         'There is a span inside the selected text with a tag level higher than you want to assign here'
                     )
-            span = Span(tokens=tokens, tags=[tag])
-            self.spans.add(span)
-            new_span = True
+            span = self._new_span(tokens)
+            span.add_entity(tag)
         for index, token in enumerate(tokens):
-            if new_span:
-                self.tokens_spans.append((f'{token.id}', f'{span.id}'))
-            if index == 0:
-                token.tags.append(f'B-{tag.content}')
-            else:
-                token.tags.append(f'I-{tag.content}')
+            self._tokens.add_tag(token.row, f'B-{tag.content}' if index == 0 else f'I-{tag.content}')
+        self._changed_sentences.add(span.sen_index)
+        self._notify(
+            {
+                'op': OP_ADD_ENTITY,
+                'tag': tag.serialize(),
+                'sen_index': sen_index,
+                'char_start_index': char_start_index,
+                'char_end_index': char_end_index,
+            },
+            [{'op': OP_DELETE_ENTITY, 'span_id': span.id, 'tag': tag.serialize()}],
+        )
+
+    def restore_entity(
+        self,
+        tag: Tag,
+        sen_index: int,
+        char_start_index: int,
+        char_end_index: int,
+        tag_index: int,
+        token_tag_indices: List[int],
+    ):
+        """put back a tag removed by delete_entity at the positions it had, without checking the tag levels: the
+        content was valid before the tag was removed
+        :param tag: the tag to restore
+        :param sen_index:
+        :param char_start_index: start of the span
+        :param char_end_index: end of the span
+        :param tag_index: position of the tag in the span tags
+        :param token_tag_indices: position of the B-/I- tag in the tags of each token of the span
+        :return:
+        """
+        tokens = self.tokens_from_char_range(sen_index, char_start_index, char_end_index)
+        if not tokens:
+            raise NoTagSelectedError('can not add tag when no token is selected')
+        span = self.span_from_span_id(f'{sen_index}:{tokens[0].tok_index}:{tokens[-1].tok_index}')
+        if span is None:
+            span = self._new_span(tokens)
+        span.insert_tag(tag_index, tag)
+        for index, (token, token_tag_index) in enumerate(zip(tokens, token_tag_indices)):
+            token_tag = f'B-{tag.content}' if index == 0 else f'I-{tag.content}'
+            self._tokens.add_tag(token.row, token_tag, token_tag_index)
+        self._changed_sentences.add(span.sen_index)
+        self._notify(
+            {
+                'op': OP_RESTORE_ENTITY,
+                'tag': tag.serialize(),
+                'sen_index': sen_index,
+                'char_start_index': char_start_index,
+                'char_end_index': char_end_index,
+                'tag_index': tag_index,
+                'token_tag_indices': token_tag_indices,
+            },
+            [{'op': OP_DELETE_ENTITY, 'span_id': span.id, 'tag': tag.serialize()}],
+        )
+
+    def _new_span(self, tokens: List[Token]) -> Span:
+        span = Span(tokens=tokens, tags=[])
+        self._add_span(span)
+        for token in tokens:
+            self._link_token_span(token.id, span.id)
+        return span
 
     def delete_entity(self, span: Span, tag: Tag):
         """delete the tag from a span.
@@ -228,57 +1046,143 @@ class Content:
         :param tag:
         :return:
         """
-        for tag_ in span.tags:
-            if tag_.content == tag.content:
-                span.tags.remove(tag_)
-        span_id = span.id
-        for token_id_, span_id_ in self.tokens_spans:
-            if span_id_ == span_id:
-                token = self.token_from_token_id(token_id_)
-                if f'B-{tag.content}' in token.tags:
-                    token.tags.remove(f'B-{tag.content}')
-                else:
-                    token.tags.remove(f'I-{tag.content}')
+        tag_indices = [index for index, tag_ in enumerate(span.tags) if tag_.content == tag.content]
+        if not tag_indices:  # nothing to do
+            return
+        tag = span.remove_tag(tag_indices[0])
+        self._changed_sentences.add(span.sen_index)
+        # the pairs of a span need not be in token order (e.g. tokens_spans of a file), restore_entity expects it
+        rows = [self._tokens.row_from_token_id(token_id_) for token_id_ in self._span_token_ids.get(span.id, [])]
+        rows = sorted([row for row in rows if row is not None], key=lambda x: self._tokens.tok_indices[x])
+        token_tag_indices = []
+        for row in rows:
+            is_start = self._tokens.tok_indices[row] == span.tok_start_index
+            token_tag = f'B-{tag.content}' if is_start else f'I-{tag.content}'
+            token_tag_indices.append(self._tokens.remove_tag(row, token_tag))
+        inverse = [
+            {
+                'op': OP_RESTORE_ENTITY,
+                'tag': tag.serialize(),
+                'sen_index': span.sen_index,
+                'char_start_index': span.char_start_index,
+                'char_end_index': span.char_end_index,
+                'tag_index': tag_indices[0],
+                'token_tag_indices': token_tag_indices,
+            }
+        ]
         if not span.tags:
+            inverse.extend(
+                [{'op': OP_ADD_RELATION, **relation.serialize()} for relation in self.relations_by_span_id(span.id)]
+            )
             self.delete_relation_single_id(span.id)
-            self.spans.remove(span)
-            self.tokens_spans = [
-                (token_id_, span_id_) for token_id_, span_id_ in self.tokens_spans if span_id_ != span_id
-            ]
+            self._remove_span(span)
+        self._notify({'op': OP_DELETE_ENTITY, 'span_id': span.id, 'tag': tag.serialize()}, inverse)
+
+    def pop_changed_sentences(self) -> Set[int]:
+        """get the sentences whose tags were changed by add_entity/delete_entity since the last call
+        :return:
+        """
+        changed_sentences, self._changed_sentences = self._changed_sentences, set()
+        return changed_sentences
+
+    def sentence_indices(self) -> List[int]:
+        """get the sentence indices in the order they appear in the content
+        :return:
+        """
+        if self._sentence_order is not None:
+            return list(self._sentence_order)
+        return self._tokens.sentence_indices()
+
+    def sentence_tokens(self, sen_index: int) -> List[TokenView]:
+        """get the tokens of a sentence, in order
+        :param sen_index:
+        :return:
+        """
+        self._hydrate(sen_index)
+        return [TokenView(self._tokens, row) for row in self._tokens.sentence_rows(sen_index)]
+
+    def sentence_spans(self, sen_index: int) -> List[Span]:
+        """get the spans of a sentence
+        :param sen_index:
+        :return:
+        """
+        self._hydrate(sen_index)
+        return list(self._sentence_spans.get(sen_index, dict()).values())
+
+    def iter_sentences(self) -> Iterator[Tuple[int, List[Union[Token, TokenView]], List[Span]]]:
+        """go over the sentences in document order without creating the ones that were not used yet: their tokens and
+        spans are read from the file for the time of the iteration only
+        :return: (sen_index, tokens in order, spans sorted by their bounds) for every sentence
+        """
+        for sen_index in self.sentence_indices():
+            records = self._pending.get(sen_index)
+            if records is not None:
+                tokens, spans = [json.loads(x) for x in records[:2]]
+                tokens = sorted([Token(**t) for t in tokens], key=lambda x: x.char_start_index)
+                spans = [span_from_dict(s) for s in spans]
+            elif self._is_line_pending(sen_index):
+                tokens, spans = [Token(**t) for t in self._text_source.tokens(sen_index)], []
+            else:
+                tokens = [TokenView(self._tokens, row) for row in self._tokens.sentence_rows(sen_index)]
+                spans = list(self._sentence_spans.get(sen_index, dict()).values())
+            spans.sort(key=lambda x: (x.char_start_index, -x.char_end_index))
+            yield sen_index, tokens, spans
+
+    def iter_spans(self) -> Iterator[List[Span]]:
+        """go over the spans of the sentences in document order, like `iter_sentences` but without reading the tokens
+        :return: the spans of every sentence, sorted by their bounds
+        """
+        for sen_index in self.sentence_indices():
+            records = self._pending.get(sen_index)
+            if records is not None:
+                spans = [span_from_dict(s) for s in json.loads(records[1])]
+            else:
+                spans = list(self._sentence_spans.get(sen_index, dict()).values())
+            spans.sort(key=lambda x: (x.char_start_index, -x.char_end_index))
+            yield spans
+
+    def spans_inside(self, sen_index: int, char_start_index: int, char_end_index: int) -> List[Span]:
+        """get the spans of a sentence that lie inside the given char range. the spans are sorted by their bounds, so
+        this only looks at the spans that start inside the range
+        :param sen_index:
+        :param char_start_index:
+        :param char_end_index:
+        :return:
+        """
+        self._hydrate(sen_index)
+        bounds = self._sentence_span_bounds.get(sen_index, [])
+        sentence_spans = self._sentence_spans[sen_index] if bounds else dict()
+        start = bisect_left(bounds, (char_start_index,))
+        end = bisect_right(bounds, (char_end_index, char_end_index))
+        return [sentence_spans[x] for x in bounds[start:end] if x[1] <= char_end_index]
 
-    def token_from_token_id(self, id_: str) -> Union[Token, None]:
+    def token_from_token_id(self, id_: str) -> Union[TokenView, None]:
         """get token from token id
         :param id_: token id
         :return:
         """
-        _tokens = [x for x in self.tokens if x.id == id_]
-        if not _tokens:
+        self._hydrate_token_id(id_)
+        row = self._tokens.row_from_token_id(id_)
+        if row is None:
             return None
-        else:
-            return _tokens[0]
+        return TokenView(self._tokens, row)
 
     def span_from_span_id(self, id_: str) -> Union[Span, None]:
         """get span from span id
         :param id_: span id
         :return:
         """
-        _spans = [x for x in self.spans if x.id == id_]
-        if not _spans:
-            return None
-        else:
-            return _spans[0]
+        self._hydrate_span_id(id_)
+        return self._span_index.get(id_)
 
     def token_id_from_token(self, token: Token) -> Union[str, None]:
         """get token id from token
         :param token: token
         :return:
         """
-        _tokens = [x for x in self.tokens if x == token]
-        if not _tokens:
+        if self.token_from_token_id(token.id) != token:
             return None
-        else:
-            assert len(_tokens) == 1
-            return _tokens[0].id
+        return token.id
 
     def span_id_from_start_end_index(self, sen_index: int, start_index: int, end_index: int) -> Union[str, None]:
         """get the id for a span from given start and end char indices
@@ -287,15 +1191,11 @@ class Content:
         :param end_index:
         :return:
         """
-        spans = [
-            x
-            for x in self.spans
-            if x.sen_index == sen_index and x.char_start_index == start_index and x.char_end_index == end_index
-        ]
-        if not spans:
+        self._hydrate(sen_index)
+        span = self._sentence_spans.get(sen_index, dict()).get((start_index, end_index))
+        if span is None:
             return None
-        assert len(spans) == 1
-        return spans[0].id
+        return span.id
 
     def token_id_from_char_index(self, sen_index: int, char_index: int) -> Union[str, None]:
         """get token id from the cursor position
@@ -303,10 +1203,44 @@ class Content:
         :param char_index: cursor position in the sentence
         :return:
         """
-        for token in self.tokens:
-            if token.sen_index == sen_index and token.char_start_index <= char_index <= token.char_end_index:
-                return token.id
-        return None
+        self._hydrate(sen_index)
+        rows = self._tokens.sentence_rows(sen_index)
+        row = bisect_left(self._tokens.char_end_indices, char_index, rows.start, rows.stop)  # ends at/after the cursor
+        if row == rows.stop or self._tokens.char_start_indices[row] > char_index:
+            return None
+        return self._tokens.token_id(row)
+
+    def tokens_from_char_range(self, sen_index: int, char_start_index: int, char_end_index: int) -> List[TokenView]:
+        """get the tokens of a sentence that lie fully inside the given char range, in order
+        :param sen_index: sentence index
+        :param char_start_index:
+        :param char_end_index:
+        :return:
+        """
+        self._hydrate(sen_index)
+        rows = self._tokens.sentence_rows(sen_index)
+        start = bisect_left(self._tokens.char_start_indices, char_start_index, rows.start, rows.stop)
+        end = bisect_right(self._tokens.char_end_indices, char_end_index, rows.start, rows.stop)
+        return [TokenView(self._tokens, row) for row in range(start, end)]
+
+    def snap_to_tokens(self, sen_index: int, char_start_index: int, char_end_index: int) -> Tuple[int, int, str]:
+        """widen a char range to the tokens it touches, so that selecting part of a word selects the whole word
+        :param sen_index: sentence index
+        :param char_start_index:
+        :param char_end_index:
+        :return: the char range of the tokens and their text, the range as it is if it does not touch a token
+        """
+        self._hydrate(sen_index)
+        rows = self._tokens.sentence_rows(sen_index)
+        start = bisect_right(self._tokens.char_end_indices, char_start_index, rows.start, rows.stop)
+        end = bisect_left(self._tokens.char_start_indices, max(char_end_index, char_start_index + 1), start, rows.stop)
+        if start >= end:
+            return char_start_index, char_end_index, ''
+        parts = [self._tokens.contents[start]]
+        for row in range(start + 1, end):
+            parts.append(WORD_SEP * (self._tokens.char_start_indices[row] - self._tokens.char_end_indices[row - 1]))
+            parts.append(self._tokens.contents[row])
+        return self._tokens.char_start_indices[start], self._tokens.char_end_indices[end - 1], ''.join(parts)
 
     def span_ids_from_char_index(self, sen_index: int, char_index: int) -> List[str]:
         """get possible spans from a cursor position. There can be more than one span for a token
@@ -321,11 +1255,9 @@ class Content:
             return self.span_ids_from_token_id(token_id)
 
     def span_id_from_span(self, span: Span) -> Union[str, None]:
-        _spans = [x for x in self.spans if x == span]
-        if not _spans:
+        if span not in self._spans:
             return None
-        else:
-            return _spans[0].id
+        return span.id
 
     def is_token_in_span(self, token_id: str, span_id: str) -> bool:
         """is the token in the span?
@@ -333,26 +1265,131 @@ class Content:
         :param span_id:
         :return:
         """
-        for token_id_, span_id_ in self.tokens_spans:
-            if token_id_ == token_id and span_id_ == span_id:
-                return True
-        return False
+        self._hydrate_token_id(token_id)
+        return span_id in self._token_span_ids.get(token_id, ())
 
     def span_ids_from_token_id(self, token_id: str) -> List[str]:
-        return list(set([span_id_ for token_id_, span_id_ in self.tokens_spans if token_id_ == token_id]))
+        self._hydrate_token_id(token_id)
+        return list(self._token_span_ids.get(token_id, ()))
+
+    def token_ids_from_span_id(self, span_id: str) -> List[str]:
+        self._hydrate_span_id(span_id)
+        return list(self._span_token_ids.get(span_id, ()))
 
     def serialize(self) -> Dict:
         """
-        convert it to a dict to be serialized for later
+        convert it to a dict to be serialized for later. the sentences that were not created yet are serialized from
+        their json records.
         :return:
         """
+        pending = {sen_index: [json.loads(x) for x in records] for sen_index, records in self._pending.items()}
         dict_ = dict()
-        dict_['tokens'] = [token.serialize() for token in self.tokens]
-        dict_['spans'] = [span.serialize() for span in self.spans]
+        dict_['tokens'] = tokens = []
+        for sen_index in self.sentence_indices():
+            if sen_index in pending:
+                tokens.extend([Token(**t).serialize() for t in pending[sen_index][0]])
+            elif self._is_line_pending(sen_index):
+                tokens.extend([Token(**t).serialize() for t in self._text_source.tokens(sen_index)])
+            else:
+                tokens.extend([self._tokens.serialize_row(row) for row in self._tokens.sentence_rows(sen_index)])
+        dict_['spans'] = [span.serialize() for span in self._spans]
         dict_['relations'] = [relation.serialize() for relation in self.relations]
-        dict_['tokens_spans'] = list(self.tokens_spans)
+        dict_['tokens_spans'] = [
+            (token_id, span_id) for span_id, token_ids in self._span_token_ids.items() for token_id in token_ids
+        ]
+        for spans, tokens_spans in [(x[1], x[2]) for x in pending.values()]:
+            dict_['spans'].extend([span_from_dict(x).serialize() for x in spans])
+            dict_['tokens_spans'].extend([tuple(x) for x in tokens_spans])
         return dict_
 
+    def serialize_columns(self) -> Dict:
+        """
+        convert it to a dict in the compact layout: the tokens column by column in document order, the spans,
+        relations and (token, span) pairs as lists. ids are only stored when they are not the default ones, a token or
+        span of a pair is its row, or its id when it is not in the content.
+        like `serialize`, the sentences that were not created yet are serialized from the file and not created.
+        :return:
+        """
+        table = self._tokens
+        names = ['sen_index', 'tok_index', 'char_start_index', 'char_end_index', 'content']
+        token_columns = [table.sen_indices, table.tok_indices, table.char_start_indices, table.char_end_indices]
+        tokens: Dict[str, List] = {name: [] for name in names}
+        tokens['id'], tokens['tags'] = [], []
+        spans = list(self._spans)
+        tokens_spans = []  # [row or token id, span id]
+        first_rows: Dict[int, int] = dict()  # sen_index -> first new row, for the sentences in the table
+        # the sentences that were not created yet are read from the file for the time of the loop only
+        for sen_index in self.sentence_indices():
+            new_row = len(tokens['content'])
+            records = self._pending.get(sen_index)
+            if records is None and not self._is_line_pending(sen_index):
+                rows = table.sentence_rows(sen_index)
+                first_rows[sen_index] = new_row - rows.start
+                for name, column in zip(names, token_columns + [table.contents]):
+                    tokens[name].extend(column[rows.start : rows.stop])
+                continue
+            if records is None:  # a line of a text file: no ids, tags or spans
+                words, char_start_indices = self._text_source.words(sen_index)
+                tokens['sen_index'].extend([sen_index] * len(words))
+                tokens['tok_index'].extend(range(len(words)))
+                tokens['char_start_index'].extend(char_start_indices)
+                tokens['char_end_index'].extend([x + len(word) for x, word in zip(char_start_indices, words)])
+                tokens['content'].extend(words)
+                continue
+            sentence_tokens, sentence_spans, sentence_tokens_spans = [json.loads(x) for x in records]
+            sentence_tokens.sort(key=lambda x: x['char_start_index'])
+            for name in names:
+                tokens[name].extend([t[name] for t in sentence_tokens])
+            token_rows = dict()
+            for row, t in enumerate(sentence_tokens, start=new_row):
+                id_ = t.get('id') or f'{t["sen_index"]}:{t["tok_index"]}'
+                if sentence_tokens_spans:
+                    token_rows[id_] = row
+                if id_ != f'{t["sen_index"]}:{t["tok_index"]}':
+                    tokens['id'].append([row, id_])
+                tags = t.get('tags', t.get('tag'))
+                if tags:
+                    tokens['tags'].append([row, list(tags)])
+            spans.extend([span_from_dict(x) for x in sentence_spans])
+            tokens_spans.extend([token_rows.get(x, x), span_id] for x, span_id in sentence_tokens_spans)
+
+        def new_row_from_row(row: int) -> int:
+            return first_rows[table.sen_indices[row]] + row
+
+        tokens['id'].extend([new_row_from_row(row), id_] for row, id_ in table.ids().items())
+        tokens['id'].sort()
+        tokens['tags'].extend([new_row_from_row(row), list(tags)] for row, tags in table.tags.items())
+        tokens['tags'].sort()
+        for span_id, token_ids in self._span_token_ids.items():
+            for token_id in token_ids:
+                row = table.row_from_token_id(token_id)
+                tokens_spans.append([token_id if row is None else new_row_from_row(row), span_id])
+        spans.sort(key=lambda x: (x.sen_index, x.char_start_index, x.char_end_index, x.id))
+        span_rows = {span.id: row for row, span in enumerate(spans)}
+        tokens_spans = [[token, span_rows.get(span_id, span_id)] for token, span_id in tokens_spans]
+        return {
+            JSON_VERSION_KEY: JSON_VERSION,
+            'tokens': tokens,
+            'spans': [
+                [
+                    span.sen_index,
+                    span.tok_start_index,
+                    span.tok_end_index,
+                    span.char_start_index,
+                    span.char_end_index,
+                    span.content,
+                    None if span.id == f'{span.sen_index}:{span.tok_start_index}:{span.tok_end_index}' else span.id,
+                    [[tag.content, tag.color, tag.level] for tag in span.tags],
+                ]
+                for span in spans
+            ],
+            'relations': [
+                [relation.start_id, relation.end_id, relation.name]
+                for relation in sorted(self.relations, key=relation_sort_key)
+            ],
+            'tokens_spans': tokens_spans,
+        }
+
     def add_relation(self, start_span_id: str, end_span_id: str, relation_name: str):
         """add a relationship between two spans
         :param start_span_id:
@@ -361,14 +1398,36 @@ class Content:
         :return:
         """
         relation = Relation(start_id=start_span_id, end_id=end_span_id, name=relation_name)
-        self.relations.add(relation)
+        if relation in self.relations:  # nothing to do
+            return
+        self._add_relation(relation)
+        self._notify(
+            {'op': OP_ADD_RELATION, **relation.serialize()}, [{'op': OP_DELETE_RELATION, **relation.serialize()}]
+        )
+
+    def relations_by_span_id(self, span_id: str) -> List[Relation]:
+        """return the relations this span is involved in, the outgoing ones first
+        :param span_id:
+        :return:
+        """
+        relations = sorted(self._relations_out.get(span_id, ()), key=relation_sort_key)
+        incoming = [x for x in self._relations_in.get(span_id, ()) if x.start_id != span_id]
+        relations.extend(sorted(incoming, key=relation_sort_key))
+        return relations
 
-    def relations_by_span_id(self, span_id: str):
-        """return the relations this span is involved in
+    def outgoing_relations(self, span_id: str) -> List[Relation]:
+        """return the relations that start from this span
         :param span_id:
         :return:
         """
-        return [x for x in self.relations if x.start_id == span_id or x.end_id == span_id]
+        return list(self._relations_out.get(span_id, ()))
+
+    def incoming_relations(self, span_id: str) -> List[Relation]:
+        """return the relations that end at this span
+        :param span_id:
+        :return:
+        """
+        return list(self._relations_in.get(span_id, ()))
 
     def delete_relation(self, start_span_id: str, end_span_id: str, relation_name: str):
         """delete a relation
@@ -377,12 +1436,12 @@ class Content:
         :param relation_name:
         :return:
         """
-        self.relations = set(
-            [
-                x
-                for x in self.relations
-                if not (x.start_id == start_span_id and x.end_id == end_span_id and x.name == relation_name)
-            ]
+        relation = Relation(start_id=start_span_id, end_id=end_span_id, name=relation_name)
+        if relation not in self.relations:  # nothing to do
+            return
+        self._remove_relation(relation)
+        self._notify(
+            {'op': OP_DELETE_RELATION, **relation.serialize()}, [{'op': OP_ADD_RELATION, **relation.serialize()}]
         )
 
     def delete_relation_single_id(self, span_id: str):
@@ -390,4 +1449,5 @@ class Content:
         :param span_id:
         :return:
         """
-        self.relations = set([x for x in self.relations if not (x.start_id == span_id or x.end_id == span_id)])
+        for relation in self.relations_by_span_id(span_id):
+            self._remove_relation(relation)
@@ -36,3 +36,23 @@ class NoTagSelectedError(CustomException):
 class TagLevelHierarchyError(CustomException):
     def __init__(self, msg, *args, **kwargs):
         super().__init__(msg, *args, **kwargs)
+
+
+class UnknownOperationError(CustomException):
+    def __init__(self, msg, *args, **kwargs):
+        super().__init__(msg, *args, **kwargs)
+
+
+class UnknownExportFormatError(CustomException):
+    def __init__(self, export_format, *args, **kwargs):
+        super().__init__(f'unknown export format {export_format}, use one of {ALL_EXPORT_FORMATS}', *args, **kwargs)
+
+
+class UnknownJsonLayoutError(CustomException):
+    def __init__(self, layout, *args, **kwargs):
+        super().__init__(
+            f'unknown json layout ({layout}), use a file without "{JSON_VERSION_KEY}" or with a {JSON_VERSION_KEY} up '
+            f'to {JSON_VERSION}',
+            *args,
+            **kwargs,
+        )
@@ -0,0 +1,235 @@
+# writes a content in other formats, one sentence at a time
+import os
+import json
+import tempfile
+from typing import Dict, List, Type, Union
+from annotate.consts import *
+from annotate.data import Content, Span, Token, TokenView, relation_sort_key
+from annotate.exceptions import UnknownExportFormatError
+
+
+def sentence_text(tokens: List[Union[Token, TokenView]]) -> str:
+    """rebuild the text of a sentence from its tokens, the gaps between them are filled with spaces
+    :param tokens:
+    :return:
+    """
+    parts = []
+    char_index = 0
+    for token in tokens:
+        parts.append(WORD_SEP * (token.char_start_index - char_index))
+        parts.append(token.content)
+        char_index = token.char_end_index
+    return ''.join(parts)
+
+
+def token_positions(tokens: List[Union[Token, TokenView]]) -> Dict[int, int]:
+    """
+    :param tokens:
+    :return: tok_index -> position of the token in the sentence
+    """
+    return {token.tok_index: position for position, token in enumerate(tokens)}
+
+
+def span_columns(spans: List[Span]) -> List[int]:
+    """put the tags of the spans of a sentence in columns, each tag in the first column that is free from its start
+    :param spans: sorted by start, the longer spans first
+    :return: the column of every tag of every span, in order
+    """
+    columns = []
+    column_ends: List[int] = []  # tok_index of the last token labeled in every column
+    for span in spans:
+        for _ in span.tags:
+            column = next((index for index, end in enumerate(column_ends) if end < span.tok_start_index), None)
+            if column is None:
+                column = len(column_ends)
+                column_ends.append(-1)
+            column_ends[column] = span.tok_end_index
+            columns.append(column)
+    return columns
+
+
+class Encoder:
+    """
+    Turns the sentences of a content into text, in document order. `export` writes `header()`, then `sentence(...)`
+    for every sentence, then `footer()`.
+    """
+
+    extension = ''
+
+    def __init__(self, content: Content, output_file: str):
+        self.content = content
+        self.output_file = output_file
+
+    def header(self) -> str:
+        return ''
+
+    def sentence(self, sen_index: int, tokens: List[Union[Token, TokenView]], spans: List[Span]) -> str:
+        raise NotImplementedError
+
+    def footer(self) -> str:
+        return ''
+
+    def close(self):
+        pass
+
+
+class BioEncoder(Encoder):
+    """
+    One token per line: the word, then the labels, one column per level of nesting. The spans of a column do not
+    overlap, so every column can be read back on its own (see `Content.populate_from_conll`). Every sentence has as
+    many columns as the most nested sentence of the content, so the columns line up across the file. Sentences end
+    with an empty line.
+    """
+
+    extension = f'.{EXPORT_FORMAT_BIO}{FILE_TYPE_CONLL}'
+
+    def __init__(self, content: Content, output_file: str, columns: int = 1):
+        """
+        :param content:
+        :param output_file:
+        :param columns: the minimum number of label columns
+        """
+        super().__init__(content, output_file)
+        self.columns = max([columns] + [max(span_columns(spans), default=-1) + 1 for spans in content.iter_spans()])
+
+    def labels(self, entity: str, length: int) -> List[str]:
+        return [f'{BIO_BEGIN}{entity}'] + [f'{BIO_INSIDE}{entity}'] * (length - 1)
+
+    def sentence(self, sen_index: int, tokens: List[Union[Token, TokenView]], spans: List[Span]) -> str:
+        positions = token_positions(tokens)
+        columns = [[BIO_OUTSIDE] * len(tokens) for _ in range(self.columns)]
+        tags = [(span, tag) for span in spans for tag in span.tags]
+        for (span, tag), column in zip(tags, span_columns(spans)):
+            start, end = positions[span.tok_start_index], positions[span.tok_end_index]
+            columns[column][start : end + 1] = self.labels(tag.content, end - start + 1)
+        lines = [WORD_SEP.join([token.content, *labels]) for token, *labels in zip(tokens, *columns)]
+        return NEW_LINE_CHAR.join(lines) + NEW_LINE_CHAR * 2
+
+
+class BioesEncoder(BioEncoder):
+    """
+    Like `BioEncoder`, the last token of a span is labeled E- and a span of one token S-.
+    """
+
+    extension = f'.{EXPORT_FORMAT_BIOES}{FILE_TYPE_CONLL}'
+
+    def labels(self, entity: str, length: int) -> List[str]:
+        if length == 1:
+            return [f'{BIO_SINGLE}{entity}']
+        return [f'{BIO_BEGIN}{entity}'] + [f'{BIO_INSIDE}{entity}'] * (length - 2) + [f'{BIO_END}{entity}']
+
+
+class JsonlEncoder(Encoder):
+    """
+    One json object per sentence: its text, tokens, spans and the relations that start from its spans.
+    """
+
+    extension = '.jsonl'
+
+    def sentence(self, sen_index: int, tokens: List[Union[Token, TokenView]], spans: List[Span]) -> str:
+        record = {
+            'sen_index': sen_index,
+            'text': sentence_text(tokens),
+            'tokens': [token.content for token in tokens],
+            'spans': [
+                {
+                    'id': span.id,
+                    'tok_start_index': span.tok_start_index,
+                    'tok_end_index': span.tok_end_index,
+                    'char_start_index': span.char_start_index,
+                    'char_end_index': span.char_end_index,
+                    'content': span.content,
+                    'labels': [tag.content for tag in span.tags],
+                }
+                for span in spans
+            ],
+            'relations': [
+                relation.serialize() for span in spans for relation in self.content.outgoing_relations(span.id)
+            ],
+        }
+        return json.dumps(record) + NEW_LINE_CHAR
+
+
+class BratEncoder(Encoder):
+    """
+    brat standoff: the text goes to a .txt file next to the .ann file, one sentence per line. every tag of a span is a
+    text bound annotation, a relation links the first annotations of its spans.
+    """
+
+    extension = '.ann'
+
+    def __init__(self, content: Content, output_file: str):
+        super().__init__(content, output_file)
+        self.text_file = f'{os.path.splitext(output_file)[0]}{BRAT_TEXT_FILE_EXT}'
+        # the text file can be the one the content is read from, it is only replaced at the end
+        self.text_writer = tempfile.NamedTemporaryFile(
+            'w',
+            encoding='utf-8',
+            dir=os.path.dirname(os.path.abspath(self.text_file)),
+            suffix=JOURNAL_TEMP_FILE_EXT,
+            delete=False,
+            buffering=EXPORT_BUFFER_SIZE,
+        )
+        self.char_index = 0  # of the sentence in the text file
+        self.num_annotations = 0
+        self.annotation_ids: Dict[str, str] = dict()  # span id -> its first annotation
+
+    def sentence(self, sen_index: int, tokens: List[Union[Token, TokenView]], spans: List[Span]) -> str:
+        text = sentence_text(tokens)
+        self.text_writer.write(text + NEW_LINE_CHAR)
+        lines = []
+        for span in spans:
+            start, end = self.char_index + span.char_start_index, self.char_index + span.char_end_index
+            span_text = text[span.char_start_index : span.char_end_index]
+            for tag in span.tags:
+                self.num_annotations += 1
+                annotation_id = f'T{self.num_annotations}'
+                self.annotation_ids.setdefault(span.id, annotation_id)
+                lines.append(f'{annotation_id}\t{tag.content} {start} {end}\t{span_text}')
+        self.char_index += len(text) + len(NEW_LINE_CHAR)
+        return ''.join(line + NEW_LINE_CHAR for line in lines)
+
+    def footer(self) -> str:
+        self.text_writer.close()
+        os.replace(self.text_writer.name, self.text_file)
+        lines = []
+        for relation in sorted(self.content.relations, key=relation_sort_key):
+            start, end = self.annotation_ids.get(relation.start_id), self.annotation_ids.get(relation.end_id)
+            if start is not None and end is not None:
+                lines.append(f'R{len(lines) + 1}\t{relation.name} Arg1:{start} Arg2:{end}')
+        return ''.join(line + NEW_LINE_CHAR for line in lines)
+
+    def close(self):
+        if not self.text_writer.closed:  # the export failed
+            self.text_writer.close()
+            os.remove(self.text_writer.name)
+
+
+ENCODERS: Dict[str, Type[Encoder]] = {
+    EXPORT_FORMAT_BIO: BioEncoder,
+    EXPORT_FORMAT_BIOES: BioesEncoder,
+    EXPORT_FORMAT_JSONL: JsonlEncoder,
+    EXPORT_FORMAT_BRAT: BratEncoder,
+}
+
+
+def export(content: Content, output_file: str, export_format: str = EXPORT_FORMAT_BIO, **kwargs):
+    """write a content in one pass over its sentences, in document order, through a buffered writer. sentences that
+    were not used yet are not kept in the content.
+    :param content:
+    :param output_file:
+    :param export_format: one of the keys of ENCODERS
+    :param kwargs: passed to the encoder
+    :return:
+    """
+    if export_format not in ENCODERS:
+        raise UnknownExportFormatError(export_format)
+    encoder = ENCODERS[export_format](content, output_file, **kwargs)
+    try:
+        with open(output_file, 'w', encoding='utf-8', buffering=EXPORT_BUFFER_SIZE) as f:
+            f.write(encoder.header())
+            for sen_index, tokens, spans in content.iter_sentences():
+                f.write(encoder.sentence(sen_index, tokens, spans))
+            f.write(encoder.footer())
+    finally:
+        encoder.close()
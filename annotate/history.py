@@ -0,0 +1,76 @@
+# undo/redo by replaying the inverse of the operations on the content
+from collections import deque
+from typing import Deque, Dict, List, Tuple, Union
+from annotate.consts import *
+from annotate.data import Content
+
+
+class History:
+    """
+    Every change of the content is recorded with the operations that undo it (see `Content.add_listener`), so undo
+    and redo cost as much as the change itself, not the size of the content. The depth is bounded by the total
+    number of operations kept, not by the number of entries.
+    """
+
+    def __init__(self, max_operations: int = HISTORY_MAX_OPERATIONS):
+        self.max_operations = max_operations
+        self.undo_stack: Deque[Tuple[Dict, List[Dict], str]] = deque()
+        self.redo_stack: List[Tuple[Dict, List[Dict], str]] = []
+        self._num_operations = 0
+        self._replaying = False
+
+    def record(self, operation: Dict, inverse: List[Dict], cursor_index: str):
+        """record an operation on the content, this clears the redo stack. the operations applied by undo/redo are
+        not recorded.
+        :param operation:
+        :param inverse: the operations that undo this one
+        :param cursor_index: the cursor position to go back to on undo
+        :return:
+        """
+        if self._replaying:
+            return
+        self.undo_stack.append((operation, inverse, cursor_index))
+        self._num_operations += 1 + len(inverse)
+        while self._num_operations > self.max_operations and len(self.undo_stack) > 1:
+            operation_, inverse_, _ = self.undo_stack.popleft()
+            self._num_operations -= 1 + len(inverse_)
+        self.redo_stack = []
+
+    def clear(self):
+        self.undo_stack.clear()
+        self.redo_stack = []
+        self._num_operations = 0
+
+    def undo(self, content: Content) -> Union[str, None]:
+        """undo the last operation
+        :param content:
+        :return: the cursor index to go back to, None if there is nothing to undo
+        """
+        if not self.undo_stack:
+            return None
+        operation, inverse, cursor_index = self.undo_stack.pop()
+        self._num_operations -= 1 + len(inverse)
+        self._replay(content, inverse)
+        self.redo_stack.append((operation, inverse, cursor_index))
+        return cursor_index
+
+    def redo(self, content: Content) -> Union[str, None]:
+        """redo the last undone operation
+        :param content:
+        :return: the cursor index to go back to, None if there is nothing to redo
+        """
+        if not self.redo_stack:
+            return None
+        operation, inverse, cursor_index = self.redo_stack.pop()
+        self._replay(content, [operation])
+        self.undo_stack.append((operation, inverse, cursor_index))
+        self._num_operations += 1 + len(inverse)
+        return cursor_index
+
+    def _replay(self, content: Content, operations: List[Dict]):
+        self._replaying = True
+        try:
+            for operation in operations:
+                content.apply_operation(operation)
+        finally:
+            self._replaying = False
@@ -0,0 +1,123 @@
+# append-only journal of the operations on a content, kept next to its json file
+import os
+import json
+import tempfile
+from typing import Dict, Iterator, List
+from annotate.consts import *
+from annotate.data import Content
+from annotate.binary import write_binary
+from annotate.jsonstream import dump_json
+
+
+class Journal:
+    """
+    The json (or binary, see annotate.binary) file holds a snapshot of the content, the journal holds the operations
+    applied after it, one json record per line. Every record has a sequence number, the snapshot stores the sequence
+    number of the last record it includes, so a crash between writing the snapshot and truncating the journal does not
+    apply a record twice.
+    """
+
+    def __init__(self, json_file: str):
+        self.json_file = json_file
+        self.file_name = f'{json_file}{JOURNAL_FILE_EXT}'
+        self.seq = 0  # sequence number of the last record
+        self.size = 0  # number of records written after the last snapshot
+
+    def load(self, content: Content):
+        """populate the content from the snapshot and replay the journal records written after it
+        :param content:
+        :return:
+        """
+        if self.json_file.endswith(FILE_TYPE_BINARY):
+            others = content.populate_from_binary(self.json_file)
+        else:
+            others = content.populate_from_json(self.json_file)
+        self.seq = others.get(JOURNAL_SEQ_KEY, 0)
+        self.size = 0
+        for record in self.records():
+            if record['seq'] <= self.seq:
+                continue
+            content.apply_operation(record)
+            self.seq = record['seq']
+            self.size += 1
+
+    def records(self) -> Iterator[Dict]:
+        """read the journal records. a partially written last record (the process died while writing it) is dropped
+        :return:
+        """
+        if not os.path.exists(self.file_name):
+            return
+        with open(self.file_name) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    return
+                yield record
+
+    def record(self, operation: Dict) -> Dict:
+        """number an operation, the returned record can be written later with `write`
+        :param operation:
+        :return:
+        """
+        self.seq += 1
+        self.size += 1
+        return {'seq': self.seq, **operation}
+
+    def mark(self) -> int:
+        """start a new journal: the snapshot taken now includes every record so far
+        :return: the sequence number of the last record the snapshot includes
+        """
+        self.size = 0
+        return self.seq
+
+    def snapshot(self, content: Content) -> Dict:
+        """take a snapshot of the content that includes every record so far, it can be written later with
+        `write_snapshot`
+        :param content:
+        :return:
+        """
+        snapshot = content.serialize_columns()
+        snapshot[JOURNAL_SEQ_KEY] = self.mark()
+        return snapshot
+
+    def write(self, records: List[Dict]):
+        """append records to the journal file with a single write
+        :param records:
+        :return:
+        """
+        with open(self.file_name, 'a') as f:
+            f.write(''.join([json.dumps(record) + NEW_LINE_CHAR for record in records]))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def write_snapshot(self, snapshot: Dict):
+        """atomically replace the json file with the snapshot (write to a temp file, then rename), then empty the
+        journal. records newer than the snapshot must be written after this.
+        :param snapshot:
+        :return:
+        """
+        directory = os.path.dirname(os.path.abspath(self.json_file))
+        with tempfile.NamedTemporaryFile('wb', dir=directory, suffix=JOURNAL_TEMP_FILE_EXT, delete=False) as f:
+            if self.json_file.endswith(FILE_TYPE_BINARY):
+                write_binary(snapshot, f)
+            else:
+                dump_json(snapshot, f, self.json_file)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(f.name, self.json_file)
+        open(self.file_name, 'w').close()
+
+    def append(self, operation: Dict):
+        """append an operation to the journal
+        :param operation:
+        :return:
+        """
+        self.write([self.record(operation)])
+
+    def compact(self, content: Content):
+        """write the snapshot of the content and empty the journal
+        :param content:
+        :return:
+        """
+        self.write_snapshot(self.snapshot(content))
@@ -0,0 +1,166 @@
+# reads large json files one record at a time
+import re
+import gzip
+import json
+import lzma
+from typing import Any, BinaryIO, Dict, IO, Iterator, Tuple
+from annotate.consts import *
+
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+
+class JsonStream:
+    """
+    A window over a json text file: values are decoded with the C scanner of the json module straight from the
+    buffer, more of the file is read when a value runs past the end of the buffer.
+    """
+
+    def __init__(self, fp: IO[str], chunk_size: int = JSON_READ_CHUNK_SIZE):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self) -> bool:
+        """read the next chunk of the file, drop the part of the buffer that was consumed
+        :return: False at the end of the file
+        """
+        if self.eof:
+            return False
+        chunk = self.fp.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos :] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """skip the whitespace
+        :return: the next character, empty at the end of the file
+        """
+        while True:
+            self.pos = WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ''
+
+    def expect(self, char: str):
+        if self.peek() != char:
+            raise json.JSONDecodeError(f'Expecting {char!r}', self.buffer, self.pos)
+        self.pos += 1
+
+    def value(self) -> Tuple[Any, str]:
+        """decode the next value
+        :return: the value and its json text
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.scan_once(self.buffer, self.pos)
+            except (StopIteration, json.JSONDecodeError) as e:
+                if self._fill():
+                    continue
+                if isinstance(e, StopIteration):
+                    raise json.JSONDecodeError('Expecting value', self.buffer, self.pos) from None
+                raise
+            if end == len(self.buffer) and self._fill():  # a number can go on in the next chunk
+                continue
+            raw = self.buffer[self.pos : end]
+            self.pos = end
+            return value, raw
+
+    def array_items(self) -> Iterator[Tuple[Any, str]]:
+        """decode the items of the array at the current position, after its `[`. this is `value` and `peek` inlined,
+        it runs once per record of the file.
+        :return: (item, json text of the item)
+        """
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        scan_once = self.decoder.scan_once
+        skip = WHITESPACE.match
+        while True:
+            try:
+                item, end = scan_once(self.buffer, self.pos)
+            except (StopIteration, json.JSONDecodeError):
+                item, end = None, len(self.buffer)
+            if end >= len(self.buffer) - 1:  # the item or the separator after it may be cut off
+                if self._fill():
+                    self.peek()
+                    continue
+                if item is None:
+                    self.value()  # raises the decoding error
+            raw = self.buffer[self.pos : end]
+            self.pos = skip(self.buffer, end).end()
+            yield item, raw
+            if self.pos < len(self.buffer) and self.buffer[self.pos] == ',':
+                self.pos = skip(self.buffer, self.pos + 1).end()
+                continue
+            if self.peek() == ',':
+                self.pos += 1
+                self.peek()
+                continue
+            self.expect(']')
+            return
+
+
+def iter_json_items(fp: IO[str], chunk_size: int = JSON_READ_CHUNK_SIZE) -> Iterator[Tuple[str, Any, str]]:
+    """read a json object like {"key": [item, item, ...], "other_key": value} without loading the whole file: only
+    one array item is decoded at a time
+    :param fp: the open file
+    :param chunk_size: number of characters read at a time
+    :return: (key, item, json text of the item) for every item of the array values, (key, value, json text of the
+    value) for the other values
+    """
+    stream = JsonStream(fp, chunk_size)
+    stream.expect('{')
+    if stream.peek() == '}':
+        return
+    while True:
+        key, _ = stream.value()
+        stream.expect(':')
+        if stream.peek() == '[':
+            stream.pos += 1
+            for item, raw in stream.array_items():
+                yield key, item, raw
+        else:
+            value, raw = stream.value()
+            yield key, value, raw
+        if stream.peek() != ',':
+            break
+        stream.pos += 1
+    stream.expect('}')
+
+
+def open_json(file_name: str) -> IO[str]:
+    """open a json file for reading, .gz and .xz files are decompressed on the fly
+    :param file_name:
+    :return:
+    """
+    if file_name.endswith(GZIP_FILE_EXT):
+        return gzip.open(file_name, 'rt', encoding='utf-8')
+    if file_name.endswith(XZ_FILE_EXT):
+        return lzma.open(file_name, 'rt', encoding='utf-8')
+    return open(file_name, encoding='utf-8')
+
+
+def dump_json(obj: Dict, fp: BinaryIO, file_name: str):
+    """write compact json to an open binary file, compressed if file_name ends with .gz or .xz
+    :param obj:
+    :param fp:
+    :param file_name: the name of the json file, it can be different from the file fp writes to (e.g. a temp file)
+    :return:
+    """
+    if file_name.endswith(GZIP_FILE_EXT):
+        compressed = gzip.GzipFile(fileobj=fp, mode='wb')
+    elif file_name.endswith(XZ_FILE_EXT):
+        compressed = lzma.LZMAFile(fp, 'wb')
+    else:
+        compressed = None
+    (compressed or fp).write(json.dumps(obj, separators=(',', ':')).encode('utf-8'))
+    if compressed is not None:
+        compressed.close()  # writes the end of the stream, fp stays open
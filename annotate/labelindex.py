@@ -0,0 +1,120 @@
+# case insensitive type-ahead search over large label sets
+from array import array
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Union
+from annotate.consts import *
+
+
+class LabelIndex:
+    """
+    The labels, normalized (stripped, lower case) and sorted once. A query is matched by prefix with a binary search
+    over the sorted labels and by substring with an n-gram index: gram -> ids of the labels that contain it, in label
+    order. The matches are ranked exact, prefix, then substring, and at most `limit` are returned, so the cost of a
+    query depends on the number of results, not on the number of labels.
+    """
+
+    def __init__(self, labels: Iterable[str], gram_size: int = LABEL_INDEX_GRAM_SIZE):
+        pairs = sorted(set((label.strip().lower(), label) for label in labels))
+        self.normalized: List[str] = [pair[0] for pair in pairs]
+        self.labels: List[str] = [pair[1] for pair in pairs]
+        self.gram_size = gram_size
+        # one pass, labels in id order: a label is already in a posting list iff it is the last id appended to it
+        self.grams: Dict[str, array] = dict()
+        for label_id, normalized in enumerate(self.normalized):
+            for size in range(1, gram_size + 1):
+                for start in range(len(normalized) - size + 1):
+                    gram = normalized[start : start + size]
+                    posting = self.grams.get(gram)
+                    if posting is None:
+                        self.grams[gram] = array('i', [label_id])
+                    elif posting[-1] != label_id:
+                        posting.append(label_id)
+        # the last query, to narrow its results when the query grows
+        self._last_query: Union[str, None] = None
+        self._last_results: List[int] = []
+        self._last_complete = False
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def _prefix_ids(self, query: str, limit: int) -> List[int]:
+        label_ids = []
+        label_id = bisect_left(self.normalized, query)
+        while label_id < len(self.normalized) and len(label_ids) < limit:
+            if not self.normalized[label_id].startswith(query):
+                break
+            label_ids.append(label_id)
+            label_id += 1
+        return label_ids
+
+    def _substring_ids(self, query: str, limit: int, exclude: set) -> List[int]:
+        """the labels that contain the query, from the smallest posting list of its grams
+        :return:
+        """
+        if len(query) <= self.gram_size:
+            candidates = self.grams.get(query, ())
+        else:
+            postings = [
+                self.grams.get(query[start : start + self.gram_size], ())
+                for start in range(len(query) - self.gram_size + 1)
+            ]
+            candidates = min(postings, key=len)
+        label_ids = []
+        for label_id in candidates:
+            if label_id not in exclude and query in self.normalized[label_id]:
+                label_ids.append(label_id)
+                if len(label_ids) == limit:
+                    break
+        return label_ids
+
+    def search(self, query: str, limit: int = TYPE_AHEAD_MAX_RESULTS) -> List[str]:
+        """find the labels that contain the query, case insensitive
+        :param query:
+        :param limit: the maximum number of labels returned
+        :return: the labels equal to the query, then the ones that start with it, then the others, each group sorted
+        """
+        query = query.strip().lower()
+        if not query:
+            return []
+        last_query = self._last_query
+        if last_query is not None and self._last_complete and query.startswith(last_query):  # narrow the last results
+            results = [x for x in self._last_results if query in self.normalized[x]]
+            results.sort(key=lambda x: (self.normalized[x] != query, not self.normalized[x].startswith(query), x))
+            complete = True
+        else:
+            results = self._prefix_ids(query, limit + 1)
+            if len(results) <= limit:
+                results += self._substring_ids(query, limit + 1 - len(results), set(results))
+            complete = len(results) <= limit
+        self._last_query, self._last_results, self._last_complete = query, results, complete
+        return [self.labels[x] for x in results[:limit]]
+
+
+class LabelScan:
+    """
+    The labels that start with a query, found by a linear scan: the stand-in for a `LabelIndex` that is not built yet
+    """
+
+    def __init__(self, labels: Iterable[str]):
+        self.labels = sorted(labels, key=lambda label: label.strip().lower())
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def search(self, query: str, limit: int = TYPE_AHEAD_MAX_RESULTS) -> List[str]:
+        """find the labels that start with the query, case insensitive
+        :param query:
+        :param limit: the maximum number of labels returned
+        :return: the labels equal to the query, then the others, each group sorted
+        """
+        query = query.strip().lower()
+        if not query:
+            return []
+        results = []
+        for label in self.labels:
+            if label.strip().lower().startswith(query):
+                results.append(label)
+                if len(results) == limit:
+                    break
+        results.sort(key=lambda label: label.strip().lower() != query)
+        return results
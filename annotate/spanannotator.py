@@ -1,25 +1,73 @@
 import os
-import json
-from typing import List, Tuple
+from functools import partial
+from typing import Dict, List, Set, Tuple, Union
 import tkinter as tk
 from tkinter import Text
 from tkinter.ttk import Frame, Button, Label, Scrollbar
 from tkinter.constants import *
 from tkinter.filedialog import Open as tkfileopen
 from tkinter.font import Font
-from collections import deque
-from annotate.utils import towkf, get_file_type, get_entity_colors
+from annotate.utils import towkf, file_stem, get_file_type
+from annotate.export import sentence_text, ENCODERS
+from annotate.config import compile_config
 from annotate.autocomplete import AutocompleteEntry
-from annotate.data import Tag, Span, Content
+from annotate.catalogue import EntityCatalogue
+from annotate.data import Tag, Span, Relation, Content
+from annotate.journal import Journal
+from annotate.autosave import AutoSaver
+from annotate.history import History
 from annotate.exceptions import *
 
 
 class SpanEntry(tk.Entry):
-    def __init__(self, span: Span, tag: Tag, current_cursor: str, master=None, cnf={}, **kwargs):
+    """
+    A row of the span info area: a span and one of its tags, or a relation. The entries are reused as the cursor moves.
+    """
+
+    def __init__(self, master=None, cnf={}, **kwargs):
         super().__init__(master, cnf, **kwargs)
-        self.span = span
-        self.tag = tag
-        self.current_cursor = current_cursor
+        self.span: Union[Span, None] = None
+        self.tag: Union[Tag, None] = None
+        self.relation: Union[Relation, None] = None
+        self.current_cursor = TEXTAREA_START
+        self.shown_text = None
+        self.shown_color = None
+        self.hidden = False
+
+    def show(
+        self,
+        text: str,
+        color: str,
+        current_cursor: str,
+        span: Union[Span, None] = None,
+        tag: Union[Tag, None] = None,
+        relation: Union[Relation, None] = None,
+    ):
+        """show a row, the widget is only changed where the row is different from the last one
+        :return:
+        """
+        self.span, self.tag, self.relation, self.current_cursor = span, tag, relation, current_cursor
+        if text != self.shown_text:
+            self.config(state='normal')
+            self.delete(0, END)
+            self.insert(0, text)
+            self.config(state='readonly')
+            self.shown_text = text
+        if color != self.shown_color:
+            self.config(fg=color)
+            self.shown_color = color
+        if self.hidden:
+            self.grid()
+            self.hidden = False
+
+    def hide(self):
+        """hide the entry and let go of what it showed
+        :return:
+        """
+        self.span, self.tag, self.relation = None, None, None
+        if not self.hidden:
+            self.grid_remove()
+            self.hidden = True
 
 
 class SpanAnnotatorFrame(Frame):
@@ -34,15 +82,20 @@ class SpanAnnotatorFrame(Frame):
         self.debug = False
         self.color_all_chunk = True
         self.recommend_flag = True
-        self.history = deque(maxlen=20)
-        self.current_content = deque(maxlen=1)
+        self.history = History()
+        config = compile_config(config)
         self.entities = config[ENTITIES_KEY]
-        self.entity_names = [x['name'] for x in self.entities]
-        self.entity_colors = get_entity_colors(self.entities)
-        self.entity_shortcuts = {entity['shortcut']: entity['name'] for entity in self.entities if 'shortcut' in entity}
-        self.entity_levels = {x['name']: x.get('level', 1) for x in self.entities}
+        self.entity_names = config[ENTITY_NAMES_KEY]
+        self.entity_colors = config[ENTITY_COLORS_KEY]
+        self.entity_shortcuts = config[ENTITY_SHORTCUTS_KEY]
+        self.entity_levels = config[ENTITY_LEVELS_KEY]
+        # the entities of the config and of its catalogue file, read with its type-ahead index in the background
+        self.entity_catalogue = EntityCatalogue(self.entities, config.get(ENTITY_CATALOGUE_KEY))
+        if self.entity_catalogue.catalogue_file is not None:
+            self.entity_catalogue.build_index()
         self.special_key_map = {
             UNDO_KEY: UNDO_COMMAND,
+            REDO_KEY: REDO_COMMAND,
             UN_LABEL_KEY: UN_LABEL_COMMAND,
             SHOW_SPAN_INFO_KEY: SHOW_SPAN_INFO_COMMAND,
         }
@@ -55,9 +108,28 @@ class SpanAnnotatorFrame(Frame):
         self.text_font_style = None
         self.text = None
         self.content = Content()
+        self.content.add_listener(self.content_changed)
+        self.autosave_delay = config.get(AUTOSAVE_DELAY_KEY, AUTOSAVE_DELAY)
+        # windowed view: only the sentences view_sentences[view_start:view_end] are in the text area
+        self.view_window = config.get(VIEW_WINDOW_KEY, VIEW_WINDOW_SENTENCES)
+        self.view_sentences: List[int] = []
+        self.sentence_positions: Dict[int, int] = dict()  # sen_index -> position in view_sentences
+        self.view_start = 0
+        self.view_end = 0
+        self.page_pending = False
+        self.cursor_refresh_pending = False
+        self.scrollbar = None
+        self.needs_snapshot = False  # the json file has not been written yet
+        self.autosaver = None
         self.cursor_index_lbl = None
+        self.cursor_label_text = None
         self.span_info_row_start = None
-        self.span_info_entries = []
+        self.span_info_entries: List[SpanEntry] = []  # the rows of the span info area, hidden ones included
+        self.span_info_font = None
+        self.sentence_tag_names: Dict[int, Set[str]] = dict()  # sen_index -> highlight tags in that row
+        # one text area tag per label and level, from the lowest priority (highest level) to the highest
+        self.label_tags: List[Tuple[int, str]] = []
+        self.label_tag_names: Set[str] = set()
         self.min_text_row = MIN_TEXT_ROW
         self.min_text_column = MIN_TEXT_COL
         self.type_ahead_entity = None
@@ -66,7 +138,6 @@ class SpanAnnotatorFrame(Frame):
         self.span_relations_def_area = None
         self.type_ahead_string_replace = TYPE_AHEAD
         self.all_input_keys = ALL_INPUT_KEYS
-        self.init_ui()
 
     def init_ui(self):
         """initialize the UI and bind the appropriate keys.
@@ -96,10 +167,10 @@ class SpanAnnotatorFrame(Frame):
         self.text.grid(
             row=1, column=0, columnspan=self.text_column, rowspan=self.text_row, padx=12, sticky=E + W + S + N
         )
-        sb = Scrollbar(self)
-        sb.grid(row=1, column=self.text_column, rowspan=self.text_row, padx=0, sticky=E + W + S + N)
-        self.text["yscrollcommand"] = sb.set
-        sb["command"] = self.text.yview
+        self.scrollbar = Scrollbar(self)
+        self.scrollbar.grid(row=1, column=self.text_column, rowspan=self.text_row, padx=0, sticky=E + W + S + N)
+        self.text["yscrollcommand"] = self.on_text_scroll
+        self.scrollbar["command"] = self.on_scrollbar
 
         open_button = Button(self, text="Open", command=self.open_file_dialog_read_file)
         open_button.grid(row=1, column=self.text_column + 1)
@@ -107,8 +178,9 @@ class SpanAnnotatorFrame(Frame):
         export_button = Button(self, text="Export", command=self.export)
         export_button.grid(row=6, column=self.text_column + 1, pady=4)
 
-        quit_button = Button(self, text="Quit", command=self.quit)
+        quit_button = Button(self, text="Quit", command=self.save_and_quit)
         quit_button.grid(row=7, column=self.text_column + 1, pady=4)
+        self.parent.protocol('WM_DELETE_WINDOW', self.save_and_quit)
 
         cursor_name_row = 9
         cursor_name = Label(self, text="Cursor: ", foreground="Blue", font=(self.text_font_style, 14, "bold"))
@@ -140,14 +212,15 @@ class SpanAnnotatorFrame(Frame):
         # bind special keys
         self.text.bind(UN_LABEL_KEY, self.un_label)
         self.text.bind(UNDO_KEY, self.undo)
+        self.text.bind(REDO_KEY, self.redo)
         self.text.bind(SHOW_SPAN_INFO_KEY, self.show_span_details)
 
         self.show_special_key_mapping()
 
-        # bind arrow keys to show cursor positions
+        # bind arrow keys to show cursor positions. the class binding moves the cursor after this one, the cursor
+        # label is updated once the events are handled
         for arrow_key in ['Left', 'Right', 'Up', 'Down']:
             self.text.bind(f'<{arrow_key}>', self.show_cursor_position)
-            self.text.bind(f'<KeyRelease-{arrow_key}>', self.show_cursor_position)
 
         # if the input file is supplied, load that file in the text area
         if self.file_name is not None:
@@ -199,7 +272,13 @@ class SpanAnnotatorFrame(Frame):
         """open the file dialog, read the file, and set the content of the file in the textarea
         :return:
         """
-        file_types = [("text files", ".txt"), ("json files", ".json"), ("conll files", "*.conll")]
+        file_types = [
+            ("text files", ".txt"),
+            ("json files", ".json"),
+            ("compressed json files", (".json.gz", ".json.xz")),
+            ("satya files", ".satya"),
+            ("conll files", "*.conll"),
+        ]
         dlg = tkfileopen(self, filetypes=file_types)
         fl = dlg.show()
         if fl:
@@ -211,66 +290,284 @@ class SpanAnnotatorFrame(Frame):
         except (NoFileFoundError, UnknownFileFormatError) as e:
             self.log(e.msg, ERROR)
             return
+        if self.autosaver is not None:
+            self.autosaver.close()
+        self.autosaver = None  # nothing is journaled while the file is loaded
+        # `load` populates the copy of the content the autosaver takes the snapshots from, in the background
         if file_type == FILE_TYPE_TXT:
             self.content.populate_from_text(txt_file=fl)
+            load = partial(Content.populate_from_text, txt_file=fl)
             self.file_name = f'{fl[:-4]}.json'
-        elif file_type == FILE_TYPE_JSON:
-            self.content.populate_from_json(json_file=fl)
+            journal = Journal(self.file_name)
+        elif file_type in [FILE_TYPE_JSON, FILE_TYPE_BINARY]:
+            self.file_name = fl
+            journal = Journal(self.file_name)
+            try:
+                journal.load(self.content)  # the sentences are created as they are shown
+            except UnknownJsonLayoutError as e:
+                self.log(e.msg, ERROR)
+                return BREAK
+            load = Journal(self.file_name).load
         elif file_type == FILE_TYPE_CONLL:
-            raise NotImplementedError('reading from conll not supported yet')  # TODO: change this
+            colors, levels = self.entity_catalogue.colors, self.entity_catalogue.levels
+            self.content.populate_from_conll(fl, entity_colors=colors, entity_levels=levels)
+            load = partial(Content.populate_from_conll, conll_file=fl, entity_colors=colors, entity_levels=levels)
+            self.file_name = f'{os.path.splitext(fl)[0]}.json'
+            journal = Journal(self.file_name)
         else:
             return BREAK
+        self.autosaver = AutoSaver(journal, delay=self.autosave_delay, load=load)
+        self.history.clear()
         self.msg_lbl.config(text=f'File: {os.path.abspath(self.file_name)}')
         self.write_output_and_text_area()
+        if journal.size:
+            self.save_content()
+        # a text or conll file is only read into its json file with the first change
+        self.needs_snapshot = file_type in [FILE_TYPE_TXT, FILE_TYPE_CONLL]
 
     def write_output_and_text_area(self, cursor_index=TEXTAREA_START):
-        """convert the content into something that can be put into a text area, add highlight colors
+        """convert the content into something that can be put into a text area, add highlight colors. large documents
+        are shown in a window of `view_window` sentences that moves as the user scrolls.
+        :return:
+        """
+        self.view_sentences = self.content.sentence_indices()
+        self.sentence_positions = {sen_index: position for position, sen_index in enumerate(self.view_sentences)}
+        self.content.pop_changed_sentences()
+        self.render_window(0)
+        self.move_cursor(cursor_index)
+        self.show_span_details(None)
+
+    def render_window(self, start: int):
+        """put the sentences view_sentences[start:start + window size] in the text area
+        :param start: position of the first sentence
         :return:
         """
-        start_char_index = 0
+        window = len(self.view_sentences)
+        if 0 < self.view_window < window:
+            window = self.view_window
+        start = max(0, min(start, len(self.view_sentences) - window))
         self.text.delete(TEXTAREA_START, TEXTAREA_END)
-        span_tags = []
-        content = ''
-        current_sentence_num = 1
-        for token in self.content.tokens:
-            if token.sen_index != current_sentence_num:
-                content += NEW_LINE_CHAR
-                current_sentence_num = token.sen_index
-            content += f'{token.content} '
-            end_char_index = start_char_index + len(content)
-            spans: List[Span] = [
-                self.content.span_from_span_id(_id) for _id in self.content.span_ids_from_token_id(token.id)
-            ]
-            for span in spans:
+        self.sentence_tag_names = dict()
+        self.view_start, self.view_end = start, start + window
+        lines = []
+        for sen_index in self.view_sentences[self.view_start : self.view_end]:
+            # the tokens keep their char offsets, so the gaps of repeated spaces are kept too
+            lines.append(sentence_text(self.content.sentence_tokens(sen_index)) + WORD_SEP)
+        self.text.insert(TEXTAREA_END, NEW_LINE_CHAR.join(lines))
+        self.tag_sentences(self.view_sentences[self.view_start : self.view_end])
+
+    def sen_index_from_row(self, row: int) -> int:
+        """get the sentence shown in a row of the text area
+        :param row:
+        :return:
+        """
+        if not self.view_sentences:  # no file loaded yet
+            return row
+        position = min(max(self.view_start + row - 1, self.view_start), self.view_end - 1)
+        return self.view_sentences[position]
+
+    def row_from_sen_index(self, sen_index: int) -> Union[int, None]:
+        """get the row of the text area that shows a sentence, None if the sentence is outside the window
+        :param sen_index:
+        :return:
+        """
+        position = self.sentence_positions.get(sen_index)
+        if position is None or not self.view_start <= position < self.view_end:
+            return None
+        return position - self.view_start + 1
+
+    def document_index(self, text_index: str) -> str:
+        """convert a text area index (row.col) to a document index (sen_index.col), which stays valid when the
+        window moves
+        :param text_index:
+        :return:
+        """
+        row, col = text_index.split(CURSOR_SEP)
+        return f'{self.sen_index_from_row(int(row))}{CURSOR_SEP}{col}'
+
+    def text_index(self, document_index: str) -> str:
+        """convert a document index (sen_index.col) to a text area index, moving the window to the sentence if needed
+        :param document_index:
+        :return:
+        """
+        sen_index, col = document_index.split(CURSOR_SEP)
+        sen_index = int(sen_index)
+        if sen_index not in self.sentence_positions:
+            return TEXTAREA_START
+        if self.row_from_sen_index(sen_index) is None:
+            self.render_window(self.sentence_positions[sen_index] - (self.view_end - self.view_start) // 2)
+        return f'{self.row_from_sen_index(sen_index)}{CURSOR_SEP}{col}'
+
+    def on_text_scroll(self, first, last):
+        """the text area scrolled: show the position in the whole document on the scrollbar, and move the window
+        once the viewport gets close to its edges
+        :param first: fraction of the window above the viewport
+        :param last: fraction of the window at the end of the viewport
+        :return:
+        """
+        first, last = float(first), float(last)
+        num_sentences = max(len(self.view_sentences), 1)
+        window = self.view_end - self.view_start
+        self.scrollbar.set(
+            (self.view_start + first * window) / num_sentences, (self.view_start + last * window) / num_sentences
+        )
+        if self.page_pending or window >= len(self.view_sentences):
+            return
+        at_top = first < VIEW_PAGE_THRESHOLD and self.view_start > 0
+        at_bottom = last > 1 - VIEW_PAGE_THRESHOLD and self.view_end < len(self.view_sentences)
+        if at_top or at_bottom:
+            self.page_pending = True
+            self.after_idle(self.page_to_viewport)
+
+    def on_scrollbar(self, *args):
+        """the scrollbar moved: in the windowed view the scrollbar covers the whole document, so dragging it moves
+        the window
+        :param args: the scrollbar command, e.g. ('moveto', fraction) or ('scroll', number, 'units')
+        :return:
+        """
+        window = self.view_end - self.view_start
+        if args[0] != MOVETO or window >= len(self.view_sentences):
+            self.text.yview(*args)
+            return
+        position = min(int(float(args[1]) * len(self.view_sentences)), len(self.view_sentences) - 1)
+        position = max(position, 0)
+        if not self.view_start <= position < self.view_end - window // 4:
+            self.render_window(position - window // 2)
+        self.text.yview(f'{position - self.view_start + 1}.0')
+
+    def page_to_viewport(self):
+        """move the window so that it is centered on the rows the user is looking at, keeping the view and the
+        cursor where they are
+        :return:
+        """
+        self.page_pending = False
+        top_row = int(self.text.index('@0,0').split(CURSOR_SEP)[0])
+        bottom_row = int(self.text.index(f'@0,{self.text.winfo_height()}').split(CURSOR_SEP)[0])
+        top_sen_index = self.sen_index_from_row(top_row)
+        cursor = self.document_index(self.text.index(INSERT))
+        center = self.view_start + (top_row + bottom_row) // 2 - 1
+        self.render_window(center - (self.view_end - self.view_start) // 2)
+        self.text.yview(f'{self.row_from_sen_index(top_sen_index)}.0')
+        sen_index, col = cursor.split(CURSOR_SEP)
+        if self.row_from_sen_index(int(sen_index)) is not None:
+            self.text.mark_set(INSERT, self.text_index(cursor))
+        else:
+            self.text.mark_set(INSERT, f'{self.row_from_sen_index(top_sen_index)}.0')
+        self.set_cursor_label(self.text.index(INSERT))
+
+    def refresh_text_area(self, cursor_index):
+        """re-tag only the sentences changed since the last render. the text itself never changes after a file is
+        loaded, so the cursor and the scroll position stay where they are.
+        :param cursor_index:
+        :return:
+        """
+        changed = self.content.pop_changed_sentences()
+        # the others are tagged when they are paged in
+        self.tag_sentences([x for x in changed if self.row_from_sen_index(x) is not None])
+        self.move_cursor(cursor_index)
+        self.show_span_details(None)
+
+    def label_tag(self, tag: Tag) -> str:
+        """the text area tag of a label and level, it is created the first time it is used. the tags of the lower
+        levels have a higher priority, so a nested span shows its own color. spans above level 1 are underlined, so the
+        outer spans stay visible.
+        :param tag:
+        :return: the name of the tag
+        """
+        level = tag.level or 1
+        tag_name = f'{LABEL_TAG_PREFIX}{level}.{tag.content}'
+        if tag_name in self.label_tag_names:
+            return tag_name
+        self.text.tag_config(tag_name, foreground=self.entity_colors.get(tag.content, tag.color), underline=level > 1)
+        position = next((index for index, (level_, _) in enumerate(self.label_tags) if level_ < level), None)
+        if position is None:
+            self.label_tags.append((level, tag_name))
+        else:
+            self.text.tag_lower(tag_name, self.label_tags[position][1])
+            self.label_tags.insert(position, (level, tag_name))
+        self.label_tag_names.add(tag_name)
+        return tag_name
+
+    def tag_sentences(self, sen_indices: List[int]):
+        """remove the highlight tags from sentences in the text area and add them back from the content, with one
+        call per label
+        :param sen_indices:
+        :return:
+        """
+        ranges: Dict[str, List[str]] = dict()  # tag name -> start and end indices of its spans
+        for sen_index in sen_indices:
+            row = self.row_from_sen_index(sen_index)
+            for tag_name in self.sentence_tag_names.pop(sen_index, set()):
+                self.text.tag_remove(tag_name, f'{row}.0', f'{row}.end')
+            tag_names = set()
+            for span in self.content.sentence_spans(sen_index):
                 for tag in span.tags:
-                    span_tags.append(
-                        (
-                            f'TOKEN_TAG_{token.id}.{tag.content}',
-                            f'{span.sen_index}.{span.char_start_index}',
-                            f'{span.sen_index}.{span.char_end_index}',
-                            tag.color,
-                        )
+                    tag_name = self.label_tag(tag)
+                    ranges.setdefault(tag_name, []).extend(
+                        [f'{row}.{span.char_start_index}', f'{row}.{span.char_end_index}']
                     )
-            start_char_index = end_char_index
-        self.text.insert(TEXTAREA_END, content)
-        for span_tag_id, start, end, color in span_tags:
-            self.text.tag_add(span_tag_id, start, end)
-            self.text.tag_config(span_tag_id, foreground=color)
+                    tag_names.add(tag_name)
+            if tag_names:
+                self.sentence_tag_names[sen_index] = tag_names
+        for tag_name, indices in ranges.items():
+            self.text.tag_add(tag_name, *indices)
+
+    def save_content(self):
+        """queue a snapshot of the content for the output json file, it is written in the background
+        :return:
+        """
+        if self.autosaver is not None:
+            self.autosaver.save()
+
+    def content_changed(self, operation, inverse):
+        """record an operation on the content for undo and queue it for the journal, take a snapshot once the
+        journal gets too long
+        :param operation:
+        :param inverse: the operations that undo it
+        :return:
+        """
+        if self.autosaver is None:  # the file is being loaded
+            return
+        self.history.record(operation, inverse, self.document_index(self.text.index(INSERT)))
+        if self.autosaver.error is not None:
+            self.log(f'could not save {self.file_name}: {self.autosaver.error}', ERROR)
+        self.autosaver.append(operation)
+        if self.needs_snapshot or self.autosaver.journal.size >= JOURNAL_COMPACT_SIZE:
+            self.save_content()
+            self.needs_snapshot = False
+
+    def save_and_quit(self):
+        """write the snapshot before quitting, if there was a change since the last one
+        :return:
+        """
+        if self.autosaver is not None:
+            if self.autosaver.journal.size:
+                self.save_content()
+            self.autosaver.close()
+        self.quit()
+
+    def move_cursor(self, cursor_index):
+        """move the cursor to an index, scroll to it and show it in the cursor label
+        :param cursor_index:
+        :return:
+        """
         self.text.mark_set(INSERT, cursor_index)
         self.text.see(cursor_index)
         self.set_cursor_label(cursor_index)
-        json.dump(self.content.serialize(), open(self.file_name, 'w'), indent=2)
-        self.show_span_details(None)
 
     def show_cursor_position(self, event):
-        """show the current cursor position in the cursor label + move the cursor in that index
+        """show the cursor position in the cursor label once the pending events are handled. the text area moves
+        the cursor and scrolls to it by itself, so a held down arrow key only updates the label when tk is idle
         :param event: the event that caused this callback
         :return:
         """
-        cursor_index = self.text.index(INSERT)
-        self.text.mark_set(INSERT, cursor_index)
-        self.text.see(cursor_index)
-        self.set_cursor_label(cursor_index)
+        if not self.cursor_refresh_pending:
+            self.cursor_refresh_pending = True
+            self.after_idle(self.refresh_cursor_position)
+
+    def refresh_cursor_position(self):
+        self.cursor_refresh_pending = False
+        self.set_cursor_label(self.text.index(INSERT))
 
     def get_entity_type_ahead(self, event, selection_start, selection_end):
         """the user has pressed enter on the type ahead. get the label from the type ahead widget, close the type ahead window, label the selected string
@@ -288,9 +585,11 @@ class SpanAnnotatorFrame(Frame):
         :param cursor_index:
         :return:
         """
-        cursor_row, cursor_column = cursor_index.split(CURSOR_SEP)
+        cursor_row, cursor_column = self.document_index(cursor_index).split(CURSOR_SEP)
         cursor_text = f'row: {cursor_row}\ncol: {cursor_column}'
-        self.cursor_index_lbl.config(text=cursor_text)
+        if cursor_text != self.cursor_label_text:
+            self.cursor_label_text = cursor_text
+            self.cursor_index_lbl.config(text=cursor_text)
 
     def un_label(self, event):
         """If there is a labeled text around the cursor, select the span. else do nothing
@@ -306,10 +605,11 @@ class SpanAnnotatorFrame(Frame):
             sel_row_start, sel_col_start = [int(x) for x in selection_start.split(CURSOR_SEP)]
             sel_row_end, sel_col_end = [int(x) for x in selection_end.split(CURSOR_SEP)]
             assert sel_row_start == sel_row_end
-            span_id = self.content.span_id_from_start_end_index(sel_row_start, sel_col_start, sel_col_end)
+            sen_index = self.sen_index_from_row(sel_row_start)
+            span_id = self.content.span_id_from_start_end_index(sen_index, sel_col_start, sel_col_end)
         else:
             current_row, current_col = [int(x) for x in current_cursor.split(CURSOR_SEP)]
-            span_ids = self.content.span_ids_from_char_index(current_row, current_col)
+            span_ids = self.content.span_ids_from_char_index(self.sen_index_from_row(current_row), current_col)
             if not span_ids:
                 self.log('There is no span for the token you clicked on', ERROR)
                 return BREAK
@@ -325,8 +625,9 @@ class SpanAnnotatorFrame(Frame):
         self.log(f'deleted tag [{tag.content}] for span [{span.content}]')
         self.content.delete_entity(span=span, tag=tag)
 
-        self.write_output_and_text_area(cursor_index=current_cursor)
-        self.text.tag_add("sel", f'{span.sen_index}.{span.char_start_index}', f'{span.sen_index}.{span.char_end_index}')
+        self.refresh_text_area(cursor_index=current_cursor)
+        row = self.row_from_sen_index(span.sen_index)
+        self.text.tag_add(SEL, f'{row}.{span.char_start_index}', f'{row}.{span.char_end_index}')
         return BREAK
 
     def label_type_ahead(self, event):
@@ -337,15 +638,16 @@ class SpanAnnotatorFrame(Frame):
         :return:
         """
         press_key = event.keysym
-        self.push_to_history()
-        self.log(f'type ahead: {press_key}')
         if not self.text.tag_ranges(SEL):
             return BREAK
         allowed, selected_content, selection_start, selection_end = self.adjust_selection()
         if not allowed:
             return BREAK
+        self.log(f'type ahead: {press_key}')
         self.type_ahead_entity = AutocompleteEntry(self)
-        self.type_ahead_entity.build(entries=self.entity_names, no_results_message=TYPE_AHEAD_NO_RESULTS_MESSAGE)
+        self.type_ahead_entity.build(
+            entries=self.entity_catalogue.label_index(), no_results_message=TYPE_AHEAD_NO_RESULTS_MESSAGE
+        )
         self.type_ahead_entity.text_.set(press_key)
         self.type_ahead_entity.listbox.bind(
             "<Return>", lambda event_: self.get_entity_type_ahead(event_, selection_start, selection_end)
@@ -362,7 +664,6 @@ class SpanAnnotatorFrame(Frame):
         :return:
         """
         press_key = event.keysym
-        self.push_to_history()
         self.log(f'shortcut: {press_key}')
         if not self.text.tag_ranges(SEL):
             return BREAK
@@ -376,48 +677,46 @@ class SpanAnnotatorFrame(Frame):
     def adjust_selection(self) -> Tuple[bool, str, str, str]:
         """verify the selected text
         1. you can not select text spanning multiple rows
-        2. if you select 'part' of a word, the selected text and the index is adjusted to capture the whole word.
+        2. if you select 'part' of a word, the selected text and the index is adjusted to capture the whole word. the
+        word boundaries come from the tokens of the content, not from the text area.
         :return:
         """
-        selected_content = self.text.selection_get()
-        selection_start = self.text.index(SEL_FIRST)
-        selection_end = self.text.index(SEL_LAST)
+        selection_start, selection_end = [str(x) for x in self.text.tag_ranges(SEL)[:2]]
         begin_row, begin_col = [int(x) for x in selection_start.split(CURSOR_SEP)]
         end_row, end_col = [int(x) for x in selection_end.split(CURSOR_SEP)]
         if begin_row != end_row:
             self.log('Selected text must be in the same row', ERROR)
             return False, '_', '_', '_'
-        move_left, move_right = True, True
-        while move_left:
-            if begin_col == 0 or self.text.get(f'{begin_row}.{begin_col-1}') == WORD_SEP:
-                move_left = False
-            else:
-                selected_content = self.text.get(f'{begin_row}.{begin_col-1}') + selected_content
-                begin_col -= 1
-        while move_right:
-            if (
-                self.text.get(f'{begin_row}.{end_col}') == WORD_SEP
-                or self.text.get(f'{begin_row}.{end_col}') == NEW_LINE_CHAR
-            ):
-                move_right = False
-            else:
-                selected_content = selected_content + self.text.get(f'{begin_row}.{end_col}')
-                end_col += 1
+        begin_col, end_col, selected_content = self.content.snap_to_tokens(
+            self.sen_index_from_row(begin_row), begin_col, end_col
+        )
         selection_start = f'{begin_row}.{begin_col}'
         selection_end = f'{begin_row}.{end_col}'
         return True, selected_content, selection_start, selection_end
 
     def undo(self, event):
-        """handle the ctrl z event by loading the last text and cursor index back in the text area
+        """handle the ctrl z event by undoing the last change and moving the cursor back to where it was
         :param event: the event that happened
         :return:
         """
-        if len(self.history) > 0:
-            content, cursor_index = self.history.pop()
-            self.content.populate_from_dict(content)
-            self.write_output_and_text_area(cursor_index=cursor_index)
-        else:
+        cursor_index = self.history.undo(self.content)
+        if cursor_index is None:
             self.log("History is empty!", ERROR)
+            return BREAK
+        self.refresh_text_area(cursor_index=self.text_index(cursor_index))
+        return BREAK
+
+    def redo(self, event):
+        """handle the ctrl y event by redoing the last undone change
+        :param event: the event that happened
+        :return:
+        """
+        cursor_index = self.history.redo(self.content)
+        if cursor_index is None:
+            self.log("Nothing to redo!", ERROR)
+            return BREAK
+        self.refresh_text_area(cursor_index=self.text_index(cursor_index))
+        return BREAK
 
     def log(self, msg: str, msg_type: str = INFO):
         """append a msg to the logging area
@@ -429,33 +728,34 @@ class SpanAnnotatorFrame(Frame):
 
     def label_selected_text(self, label: str, label_start_index: str, label_end_index: str):
         """we got a label from the labeling mechanism (type-ahead/shortcut), label the selected content with it
-        :param label: label to apply
+        :param label: label to apply, an entity name or an alias
         :param label_start_index: cursor index of where the selected text begins
         :param label_end_index: cursor index of where the selected text ends
         :return:
         """
         row_index_start, col_index_start = [int(x) for x in label_start_index.split(CURSOR_SEP)]
         row_index_end, col_index_end = [int(x) for x in label_end_index.split(CURSOR_SEP)]
-        label_color = self.entity_colors[label]
+        if label in self.entity_colors:
+            label_color, label_level = self.entity_colors[label], self.entity_levels.get(label)
+        else:
+            name = self.entity_catalogue.resolve(label)
+            if name is None:
+                self.log(f'{label} is not an entity', ERROR)
+                return
+            label = name
+            label_color, label_level = self.entity_catalogue.colors[name], self.entity_catalogue.levels[name]
         assert row_index_start == row_index_end
         try:
             self.content.add_entity(
-                tag=Tag(label, color=label_color, level=self.entity_levels.get(label)),
-                sen_index=row_index_start,
+                tag=Tag(label, color=label_color, level=label_level),
+                sen_index=self.sen_index_from_row(row_index_start),
                 char_start_index=col_index_start,
                 char_end_index=col_index_end,
             )
         except (TagLevelHierarchyError, NoTagSelectedError) as e:
             self.log(e.msg, ERROR)
             return
-        self.write_output_and_text_area(cursor_index=f'{row_index_start}.{col_index_end}')
-
-    def push_to_history(self):
-        """push the current selected span and the cursor position to a queue
-        :return:
-        """
-        cursor_position = self.text.index(INSERT)
-        self.history.append((self.content.serialize(), cursor_position))
+        self.refresh_text_area(cursor_index=f'{row_index_start}.{col_index_end}')
 
     def export(self):
         """export the text area content in a conll BIO format
@@ -463,7 +763,7 @@ class SpanAnnotatorFrame(Frame):
         in the conll file, with `words` as the first column.
         :return:
         """
-        file_name = f'{self.file_name[:-5]}.bio.conll'
+        file_name = f'{file_stem(self.file_name)}{ENCODERS[EXPORT_FORMAT_BIO].extension}'  # as `satya export` does
         self.log(f'Writing output to {file_name}')
         towkf(self.content, file_name)
 
@@ -472,59 +772,75 @@ class SpanAnnotatorFrame(Frame):
         :param event:
         :return:
         """
-        for entry in self.span_info_entries:
-            entry.destroy()
-            self.span_info_entries.remove(entry)
         current_cursor = self.text.index(INSERT)
         if self.text.tag_ranges(SEL):  # a text is selected
             allowed, selected_content, selection_start, selection_end = self.adjust_selection()
             if not allowed:
+                self.show_span_info([], current_cursor)
                 return BREAK
             sel_row_start, sel_col_start = [int(x) for x in selection_start.split(CURSOR_SEP)]
             sel_row_end, sel_col_end = [int(x) for x in selection_end.split(CURSOR_SEP)]
             assert sel_row_start == sel_row_end
-            span_ids = [self.content.span_id_from_start_end_index(sel_row_start, sel_col_start, sel_col_end)]
+            sen_index = self.sen_index_from_row(sel_row_start)
+            span_ids = [self.content.span_id_from_start_end_index(sen_index, sel_col_start, sel_col_end)]
         else:
             current_row, current_col = [int(x) for x in current_cursor.split(CURSOR_SEP)]
-            span_ids = self.content.span_ids_from_char_index(current_row, current_col)
+            span_ids = self.content.span_ids_from_char_index(self.sen_index_from_row(current_row), current_col)
             if not span_ids:
+                self.show_span_info([], current_cursor)
                 self.log('There is no span for the token you clicked on', ERROR)
                 return BREAK
-        start_col = self.span_info_row_start + 1
-        _fnt = Font(family=self.text_font_style, size=15, weight="bold", underline=0)
+        rows = []
         for span_id in span_ids:
-            span = self.content.span_from_span_id(span_id)
-            if span is None:
-                continue
-            span_content = span.content
-            for tag in span.tags:
+            span = self.content.span_from_span_id(span_id) if span_id is not None else None
+            if span is not None:
+                rows.extend(self.span_info_rows(span))
+        self.show_span_info(rows, current_cursor)
+
+    def span_info_rows(self, span: Span) -> List[Tuple[str, str, Dict]]:
+        """the rows of the span info area for a span
+        :param span:
+        :return: (text, color, what the row shows: the span and tag, or the relation) for every row
+        """
+        return [(f'{span.content}/{tag.content}', tag.color, {'span': span, 'tag': tag}) for tag in span.tags]
+
+    def show_span_info(self, rows: List[Tuple[str, str, Dict]], current_cursor: str):
+        """show rows in the span info area. the entries are kept and reused, only the ones that are needed are shown
+        :param rows: see `span_info_rows`
+        :param current_cursor: where the cursor goes back after a row is deleted
+        :return:
+        """
+        if self.span_info_font is None:
+            self.span_info_font = Font(family=self.text_font_style, size=15, weight="bold", underline=0)
+        for position, (text, color, item) in enumerate(rows):
+            if position == len(self.span_info_entries):
                 entry = SpanEntry(
-                    span=span,
-                    tag=tag,
-                    current_cursor=current_cursor,
-                    master=self,
-                    width=15,
-                    background='white',
-                    justify=tk.CENTER,
-                    font=_fnt,
+                    master=self, width=15, background='white', justify=tk.CENTER, font=self.span_info_font
                 )
                 entry.grid(
-                    padx=10, pady=5, row=start_col, column=self.text_column + 1, sticky=W + E + N + S, columnspan=20
+                    padx=10,
+                    pady=5,
+                    row=self.span_info_row_start + 1 + position,
+                    column=self.text_column + 1,
+                    sticky=W + E + N + S,
+                    columnspan=20,
                 )
-                entry.insert(0, f'{span_content}/{tag.content}')
-                entry.config(fg=tag.color)
-                entry.config(state='readonly')
-                entry.bind(UN_LABEL_FROM_SPAN_INFO_AREA_KEY, lambda event_: self.un_label_span(event_))
-                start_col += 1
+                entry.bind(UN_LABEL_FROM_SPAN_INFO_AREA_KEY, self.un_label_span)
                 self.span_info_entries.append(entry)
+            self.span_info_entries[position].show(text, color, current_cursor, **item)
+        for entry in self.span_info_entries[len(rows) :]:
+            entry.hide()
 
     def un_label_span(self, event):
-        """delete a span selected from the details area
+        """delete a span (or relation) selected from the details area
         :param event:
         :return:
         """
-        self.push_to_history()
         entry: SpanEntry = event.widget
-        self.content.delete_entity(entry.span, entry.tag)
-        self.write_output_and_text_area(cursor_index=entry.current_cursor)
-        entry.destroy()
+        if entry.relation is not None:
+            self.content.delete_relation(entry.relation.start_id, entry.relation.end_id, entry.relation.name)
+        elif entry.span is not None:
+            self.content.delete_entity(entry.span, entry.tag)
+        else:  # the row is hidden
+            return
+        self.refresh_text_area(cursor_index=entry.current_cursor)
@@ -1,5 +1,11 @@
+import os
+import json
 import pytest
 from annotate.utils import get_file_type
+from annotate.data import Tag, Token, TokenTable, Span, Relation, Content
+from annotate.journal import Journal
+from annotate.autosave import AutoSaver
+from annotate.history import History
 from annotate.exceptions import *
 
 
@@ -8,3 +14,738 @@ def test_get_file_type():
         get_file_type('something.txt') == FILE_TYPE_TXT
     except NoFileFoundError:
         assert True
+
+
+SAMPLE_TXT = os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'wiki-obama-sample.txt')
+SAMPLE_JSON = os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'wiki-obama-sample.json')
+
+
+def assert_same_content(content, expected):
+    content, expected = content.serialize(), expected.serialize()
+    for key in ['tokens', 'spans', 'relations', 'tokens_spans']:
+        assert sorted(json.dumps(x, sort_keys=True) for x in content[key]) == sorted(
+            json.dumps(x, sort_keys=True) for x in expected[key]
+        )
+
+
+def test_content_indexes():
+    content = Content()
+    content.populate_from_text(SAMPLE_TXT)
+    content.add_entity(Tag('PER', color='red'), sen_index=1, char_start_index=0, char_end_index=20)
+    content.add_entity(Tag('MISC', color='blue'), sen_index=1, char_start_index=7, char_end_index=14)
+    assert content.token_from_token_id('1:1').content == 'Hussein'
+    assert content.span_from_span_id('1:0:2').content == 'Barack Hussein Obama'
+    assert content.span_ids_from_token_id('1:1') == ['1:0:2', '1:1:1']
+    assert content.is_token_in_span('1:2', '1:0:2') and not content.is_token_in_span('1:2', '1:1:1')
+    content.delete_entity(content.span_from_span_id('1:1:1'), Tag('MISC', color='blue'))
+    assert content.span_from_span_id('1:1:1') is None
+    assert content.span_ids_from_token_id('1:1') == ['1:0:2']
+    assert ('1:1', '1:1:1') not in content.tokens_spans
+
+
+def test_content_round_trip():
+    content = Content()
+    content.populate_from_json(SAMPLE_JSON)
+    serialized = content.serialize()
+    reloaded = Content()
+    reloaded.populate_from_dict(json.loads(json.dumps(serialized)))
+    assert_same_content(reloaded, content)
+    assert reloaded.token_from_token_id('1:0').tags == ['B-PER']
+
+
+def test_char_index_lookups():
+    content = Content()
+    content.populate_from_text(SAMPLE_TXT)
+    for sen_index in [1, 2]:
+        tokens = [x for x in content.tokens if x.sen_index == sen_index]
+        for char_index in range(tokens[-1].char_end_index + 2):
+            expected = [x.id for x in tokens if x.char_start_index <= char_index <= x.char_end_index]
+            assert content.token_id_from_char_index(sen_index, char_index) == (expected[0] if expected else None)
+    assert [x.content for x in content.tokens_from_char_range(2, 2, 22)] == ['member', 'of', 'the']
+    assert content.tokens_from_char_range(2, 3, 5) == []
+    assert content.token_id_from_char_index(1000, 0) is None
+    content.add_entity(Tag('ORG', color='red'), sen_index=2, char_start_index=16, char_end_index=32)
+    assert content.span_id_from_start_end_index(2, 16, 32) == '2:4:5'
+    assert content.span_id_from_start_end_index(1, 16, 32) is None
+
+
+def test_snap_to_tokens():
+    content = Content()
+    content.populate_from_text(SAMPLE_TXT)
+    line = 'A member of the Democratic Party , he was the first'
+    assert content.snap_to_tokens(2, 4, 10) == (2, 11, 'member of')
+    assert content.snap_to_tokens(2, 0, 1) == (0, 1, 'A') and content.snap_to_tokens(2, 5, 5) == (2, 8, 'member')
+    assert content.snap_to_tokens(2, 1, 2) == (1, 2, '')  # only a space
+    for start in range(len(line)):  # the same as widening the selection (without its spaces) to the spaces around it
+        for end in range(start + 1, len(line) + 1):
+            selected = line[start:end]
+            if selected.strip():
+                begin = line.rfind(' ', 0, start + len(selected) - len(selected.lstrip())) + 1
+                finish = line.find(' ', end - len(selected) + len(selected.rstrip()))
+                finish = len(line) if finish == -1 else finish
+                assert content.snap_to_tokens(2, start, end) == (begin, finish, line[begin:finish])
+
+
+def test_serialize_columns_lazily():
+    for populate, sample in [(Content.populate_from_text, SAMPLE_TXT), (Content.populate_from_json, SAMPLE_JSON)]:
+        content = Content()
+        populate(content, sample)
+        serialized = content.serialize_columns()
+        assert len(content._tokens) == 0  # the sentences are not created
+        content.hydrate()
+        assert serialized == content.serialize_columns()
+
+
+def test_repeated_spaces(tmp_path):
+    from annotate.export import sentence_text
+
+    txt_file = str(tmp_path / 'spaces.txt')
+    with open(txt_file, 'w') as f:
+        f.write('Barack  Obama was\n')
+    content = Content()
+    content.populate_from_text(txt_file)
+    row = sentence_text(content.sentence_tokens(1))  # what the text area shows
+    assert row == 'Barack  Obama was'
+    start = row.index('Obama')
+    assert content.token_id_from_char_index(1, start) == '1:1'
+    content.add_entity(Tag('PER', color='red'), sen_index=1, char_start_index=start, char_end_index=start + 5)
+    assert content.span_from_span_id('1:1:1').content == 'Obama'
+
+
+def test_changed_sentences():
+    content = Content()
+    content.populate_from_text(SAMPLE_TXT)
+    assert content.pop_changed_sentences() == set()
+    content.add_entity(Tag('ORG', color='red'), sen_index=2, char_start_index=16, char_end_index=32)
+    content.add_entity(Tag('PER', color='red'), sen_index=3, char_start_index=0, char_end_index=2)
+    assert content.pop_changed_sentences() == {2, 3}
+    span = content.span_from_span_id('2:4:5')
+    content.delete_entity(span, span.tags[0])
+    assert content.pop_changed_sentences() == {2}
+    assert content.sentence_spans(2) == [] and [x.id for x in content.sentence_spans(3)] == ['3:0:0']
+
+
+def test_delete_entity_out_of_order():
+    tokens = [
+        Token(word, 1, index, start, start + len(word))
+        for index, (word, start) in enumerate([('george', 0), ('walker', 7), ('bush', 14)])
+    ]
+    for token in tokens:
+        token.tags = ['I-PER' if token.tok_index else 'B-PER']
+    content = Content()
+    content.populate_from_dict(
+        {
+            'tokens': [token.serialize() for token in tokens],
+            'spans': [Span(tokens=tokens, tags=[Tag('PER', 'red')]).serialize()],
+            'tokens_spans': [('1:2', '1:0:2'), ('1:0', '1:0:2'), ('1:1', '1:0:2')],  # not in token order
+        }
+    )
+    history = History()
+    content.add_listener(lambda operation, inverse: history.record(operation, inverse, '1.0'))
+    span = content.span_from_span_id('1:0:2')
+    content.delete_entity(span, span.tags[0])
+    assert content.span_from_span_id('1:0:2') is None
+    assert [content.token_from_token_id(f'1:{x}').tags for x in range(3)] == [[], [], []]
+    history.undo(content)
+    assert [content.token_from_token_id(f'1:{x}').tags for x in range(3)] == [['B-PER'], ['I-PER'], ['I-PER']]
+    assert [tag.content for tag in content.span_from_span_id('1:0:2').tags] == ['PER']
+
+
+def test_journal_replay(tmp_path):
+    json_file = str(tmp_path / 'sample.json')
+    content = Content()
+    content.populate_from_text(SAMPLE_TXT)
+    journal = Journal(json_file)
+    content.add_listener(lambda operation, inverse: journal.append(operation))
+    journal.compact(content)
+    content.add_entity(Tag('PER', color='red', level=1), sen_index=1, char_start_index=0, char_end_index=20)
+    content.add_entity(Tag('ORG', color='blue'), sen_index=2, char_start_index=16, char_end_index=32)
+    content.add_relation('1:0:2', '2:4:5', 'MEMBER_OF')
+    span = content.span_from_span_id('2:4:5')
+    content.delete_entity(span, span.tags[0])
+    assert journal.size == 4
+    with open(journal.file_name, 'a') as f:
+        f.write('{"seq": 5, "op": "add_')  # the process died while writing this record
+
+    recovered = Content()
+    Journal(json_file).load(recovered)
+    assert_same_content(recovered, content)
+    assert recovered.span_from_span_id('1:0:2').tags[0].level == 1
+
+    journal.compact(content)
+    assert list(journal.records()) == []
+    reloaded = Content()
+    Journal(json_file).load(reloaded)
+    assert_same_content(reloaded, content)
+
+
+def test_autosave(tmp_path):
+    json_file = str(tmp_path / 'sample.json')
+    content = Content()
+    content.populate_from_text(SAMPLE_TXT)
+    saver = AutoSaver(Journal(json_file), delay=60)
+    content.add_listener(lambda operation, inverse: saver.append(operation))
+    saver.save(content)
+    content.add_entity(Tag('PER', color='red'), sen_index=1, char_start_index=0, char_end_index=20)
+    content.add_entity(Tag('ORG', color='blue'), sen_index=2, char_start_index=16, char_end_index=32)
+    assert not os.path.exists(json_file)  # still inside the quiet period
+    assert saver.flush(timeout=10)
+    assert len(list(saver.journal.records())) == 2
+    saver.save(content)
+    content.add_relation('1:0:2', '2:4:5', 'MEMBER_OF')
+    assert saver.close(timeout=10) and saver.error is None
+    assert [x['op'] for x in saver.journal.records()] == ['add_relation']
+    assert json.load(open(json_file))['journal_seq'] == 2
+    reloaded = Content()
+    Journal(json_file).load(reloaded)
+    assert_same_content(reloaded, content)
+    assert [x for x in os.listdir(tmp_path) if x.endswith('.tmp')] == []
+
+
+def test_autosave_in_background(tmp_path):
+    from functools import partial
+
+    json_file = str(tmp_path / 'sample.json')
+    content = Content()
+    content.populate_from_text(SAMPLE_TXT)
+    load = partial(Content.populate_from_text, txt_file=SAMPLE_TXT)
+    saver = AutoSaver(Journal(json_file), delay=60, load=load)
+    content.add_listener(lambda operation, inverse: saver.append(operation))
+    content.add_entity(Tag('PER', color='red'), sen_index=1, char_start_index=0, char_end_index=20)
+    saver.save()  # serialized on the worker, from its own copy
+    content.add_entity(Tag('ORG', color='blue'), sen_index=2, char_start_index=16, char_end_index=32)
+    assert saver.flush(timeout=10) and saver.error is None
+    assert json.load(open(json_file))['journal_seq'] == 1
+    assert [x['op'] for x in saver.journal.records()] == ['add_entity']
+    saver.save()
+    assert saver.close(timeout=10) and saver.error is None
+    reloaded = Content()
+    Journal(json_file).load(reloaded)
+    assert_same_content(reloaded, content)
+
+    journal = Journal(json_file)
+    journal.load(Content())
+    saver = AutoSaver(journal, delay=60, load=Journal(json_file).load)  # a json file and its journal
+    content.add_listener(lambda operation, inverse: saver.append(operation))
+    content.add_relation('1:0:2', '2:4:5', 'MEMBER_OF')
+    saver.save()
+    assert saver.close(timeout=10) and saver.error is None
+    assert list(saver.journal.records()) == []
+    reloaded = Content()
+    Journal(json_file).load(reloaded)
+    assert_same_content(reloaded, content)
+
+
+def test_undo_redo():
+    content = Content()
+    content.populate_from_text(SAMPLE_TXT)
+    history = History()
+    content.add_listener(lambda operation, inverse: history.record(operation, inverse, '1.0'))
+    states = []
+
+    def checkpoint():
+        state = Content()
+        state.populate_from_dict(content.serialize())
+        states.append(state)
+
+    checkpoint()
+    content.add_entity(Tag('PER', color='red', level=1), sen_index=1, char_start_index=0, char_end_index=20)
+    checkpoint()
+    content.add_entity(Tag('STATE', color='blue', level=2), sen_index=1, char_start_index=7, char_end_index=14)
+    checkpoint()
+    content.add_entity(Tag('MISC', color='green', level=1), sen_index=1, char_start_index=0, char_end_index=20)
+    checkpoint()
+    content.add_relation('1:0:2', '1:1:1', 'PART_OF')
+    checkpoint()
+    span = content.span_from_span_id('1:0:2')
+    content.delete_entity(span, span.tags[0])  # PER, the first of the two tags
+    checkpoint()
+    content.delete_entity(span, span.tags[0])  # MISC, removes the span and the relation
+    checkpoint()
+    assert content.span_from_span_id('1:0:2') is None and not content.relations
+
+    for state in reversed(states[:-1]):
+        history.undo(content)
+        assert_same_content(content, state)
+    assert history.undo(content) is None
+    for state in states[1:]:
+        history.redo(content)
+        assert_same_content(content, state)
+    assert history.redo(content) is None
+
+
+def test_token_table():
+    content = Content()
+    content.populate_from_text(SAMPLE_TXT)
+    assert isinstance(content.tokens, TokenTable) and len(content.tokens) == sum(
+        len(line.split()) for line in open(SAMPLE_TXT)
+    )
+    token = content.token_from_token_id('2:4')
+    assert (token.content, token.char_start_index, token.char_end_index, token.tags) == ('Democratic', 16, 26, [])
+    assert token == content.tokens[token.row] and content.token_id_from_token(token) == '2:4'
+    content.add_entity(Tag('ORG', color='red'), sen_index=2, char_start_index=16, char_end_index=32)
+    assert content.token_from_token_id('2:5').tags == ['I-ORG'] and len(content.tokens.tags) == 2
+    custom = Content(tokens=[Token('a', 1, 0, 0, 1, id='x'), Token('b', 1, 1, 2, 3)])
+    assert custom.token_from_token_id('x').content == 'a' and custom.token_from_token_id('1:0') is None
+    assert [x.id for x in custom.tokens] == ['x', '1:1']
+
+
+def test_value_equality():
+    content = Content()
+    content.populate_from_text(SAMPLE_TXT)
+    content.add_entity(Tag('PER', color='red'), sen_index=1, char_start_index=0, char_end_index=20)
+    content.add_entity(Tag('LOC', color='red'), sen_index=3, char_start_index=0, char_end_index=2)
+    content.add_relation('1:0:2', '3:0:0', 'SAME_AS')
+    content.add_relation('1:0:2', '3:0:0', 'SAME_AS')
+    assert len(content.relations) == 1 and Relation('1:0:2', '3:0:0', 'SAME_AS') in content.relations
+    span = Span(sen_index=1, tok_start_index=0, tok_end_index=2, content='', char_start_index=0, char_end_index=20)
+    assert span in content.spans and content.span_id_from_span(span) == '1:0:2'
+    assert Token('Barack', 1, 0, 0, 6) == content.tokens[0] and Tag('PER', 'red') == Tag('PER', 'red', level=1)
+    assert not hasattr(Tag('PER', 'red'), '__dict__')
+    content.delete_relation('1:0:2', '3:0:0', 'SAME_AS')
+    assert not content.relations
+
+
+def test_relation_adjacency():
+    content = Content()
+    content.populate_from_text(SAMPLE_TXT)
+    for sen_index in [1, 2, 3]:
+        content.add_entity(Tag('PER', color='red'), sen_index=sen_index, char_start_index=0, char_end_index=6)
+    content.add_relation('1:0:0', '2:0:0', 'B')
+    content.add_relation('1:0:0', '2:0:0', 'A')
+    content.add_relation('3:0:0', '1:0:0', 'C')
+    content.add_relation('1:0:0', '1:0:0', 'D')
+    assert [x.name for x in content.relations_by_span_id('1:0:0')] == ['A', 'B', 'D', 'C']
+    assert [x.name for x in content.incoming_relations('2:0:0')] in [['A', 'B'], ['B', 'A']]
+    span = content.span_from_span_id('1:0:0')
+    content.delete_entity(span, span.tags[0])
+    assert not content.relations and content.relations_by_span_id('2:0:0') == []
+    assert content.outgoing_relations('3:0:0') == []
+
+
+def test_level_hierarchy():
+    content = Content()
+    content.populate_from_text(SAMPLE_TXT)
+    content.add_entity(Tag('STATE', color='red', level=2), sen_index=2, char_start_index=16, char_end_index=26)
+    # a span in another sentence with the same offsets does not matter
+    content.add_entity(Tag('LOC', color='red', level=1), sen_index=1, char_start_index=0, char_end_index=26)
+    with pytest.raises(TagLevelHierarchyError):
+        content.add_entity(Tag('LOC', color='red', level=1), sen_index=2, char_start_index=12, char_end_index=32)
+    content.add_entity(Tag('ORG', color='red', level=2), sen_index=2, char_start_index=12, char_end_index=32)
+    assert [x.id for x in content.spans_inside(2, 12, 32)] == ['2:3:5', '2:4:4']
+    span = content.span_from_span_id('2:4:4')
+    assert span.max_level == 2
+    with pytest.raises(TagLevelHierarchyError):
+        content.add_entity(Tag('MISC', color='red', level=1), sen_index=2, char_start_index=16, char_end_index=26)
+    content.add_entity(Tag('CITY', color='red', level=3), sen_index=2, char_start_index=16, char_end_index=26)
+    content.delete_entity(span, Tag('CITY', color='red', level=3))
+    assert span.max_level == 2
+
+
+def test_json_stream():
+    import io
+    from annotate.jsonstream import iter_json_items
+
+    document = {'tokens': [{'content': 'a{"]', 'n': 12345}, {'content': 'b'}], 'empty': [], 'journal_seq': 123456}
+    text = json.dumps(document, indent=2)
+    for chunk_size in [1, 7, len(text)]:
+        items = list(iter_json_items(io.StringIO(text), chunk_size=chunk_size))
+        assert [(key, item) for key, item, _ in items] == [
+            ('tokens', document['tokens'][0]),
+            ('tokens', document['tokens'][1]),
+            ('journal_seq', 123456),
+        ]
+        assert [json.loads(raw) for _, _, raw in items] == [item for _, item, _ in items]
+    with pytest.raises(json.JSONDecodeError):
+        list(iter_json_items(io.StringIO(text[:-3])))
+
+
+def test_lazy_json_load(tmp_path):
+    expected = Content()
+    expected.populate_from_dict(json.load(open(SAMPLE_JSON)))
+    json_file = str(tmp_path / 'sample.json')
+    json.dump({**expected.serialize(), 'journal_seq': 4}, open(json_file, 'w'), indent=2)
+    content = Content()
+    assert content.populate_from_json(json_file) == {'journal_seq': 4}
+    assert len(content._tokens) == 0 and content.sentence_indices() == expected.sentence_indices()
+    assert [x.content for x in content.sentence_tokens(2)] == [x.content for x in expected.sentence_tokens(2)]
+    assert set(content._tokens.sentence_indices()) == {2}
+    assert content.span_from_span_id('1:0:2').content == 'Barack Hussein Obama'
+    assert_same_content(content, expected)
+    content.hydrate()
+    assert len(content.tokens) == len(expected.tokens)
+    assert_same_content(content, expected)
+
+
+def test_text_source(tmp_path):
+    from annotate.textsource import TextSource
+
+    txt_file = str(tmp_path / 'sample.txt')
+    with open(txt_file, 'wb') as f:
+        f.write('Barack  Obama\r\n\nwas born in Hawaiʻi'.encode('utf-8'))
+    source = TextSource(txt_file, cache_size=0)
+    assert len(source) == 3 and os.path.exists(source.index_file)
+    assert [source.line(x) for x in [3, 1, 2]] == ['was born in Hawaiʻi', 'Barack  Obama', '']
+    assert [(x['content'], x['tok_index'], x['char_start_index']) for x in source.tokens(1)] == [
+        ('Barack', 0, 0),
+        ('Obama', 1, 8),
+    ]
+    assert source.tokens(2) == []
+    cached = TextSource(txt_file, cache_size=0)
+    assert list(cached.offsets) == list(source.offsets) == [0, 15, 16, 36]
+    source.close()
+    cached.close()
+
+    content = Content()
+    content.populate_from_text(SAMPLE_TXT)
+    assert len(content._tokens) == 0 and content.sentence_indices()[:3] == [1, 2, 3]
+    assert [x.content for x in content.sentence_tokens(3)][:2] == ['He', 'previously']
+    assert content._tokens.sentence_indices() == [3]
+    assert content.token_from_token_id('5:0').sen_index == 5
+    eager = Content()
+    eager.populate_from_dict(content.serialize())
+    assert len(content._tokens.sentence_indices()) == 2
+    assert_same_content(content, eager)
+
+
+def test_binary_format(tmp_path):
+    from annotate.utils import convert, read_content
+    from annotate.binary import BinaryFile
+
+    binary_file, json_file = str(tmp_path / 'sample.satya'), str(tmp_path / 'sample.json')
+    convert(SAMPLE_JSON, binary_file)
+    assert get_file_type(binary_file) == FILE_TYPE_BINARY
+    assert os.path.getsize(binary_file) * 5 < os.path.getsize(SAMPLE_JSON)
+    content = read_content(binary_file)
+    assert_same_content(content, read_content(SAMPLE_JSON))
+    assert content.token_from_token_id('1:0').tags == ['B-PER']
+    convert(binary_file, json_file)
+    assert_same_content(read_content(json_file), content)
+
+    custom = Content()
+    custom.populate_from_dict(
+        {
+            'tokens': [Token('Obama', 1, 0, 0, 5, id='x', tags=['B-PER']).serialize()],
+            'spans': [Span(tokens=[Token('Obama', 1, 0, 0, 5)], tags=[Tag('PER', 'red', 2)], id='s').serialize()],
+            'relations': [Relation('s', 's', 'self').serialize()],
+            'tokens_spans': [('x', 's'), ('missing', 's')],
+        }
+    )
+    journal = Journal(binary_file)
+    journal.seq = 7
+    journal.compact(custom)
+    with BinaryFile(binary_file) as f:
+        assert f.journal_seq == 7
+    reloaded = Content()
+    assert reloaded.populate_from_binary(binary_file) == {JOURNAL_SEQ_KEY: 7}
+    assert [tuple(x) for x in reloaded.serialize()['tokens_spans']] == [('x', 's'), ('missing', 's')]
+    journal = Journal(binary_file)
+    reloaded = Content()
+    journal.load(reloaded)
+    assert journal.seq == 7
+    assert_same_content(reloaded, custom)
+
+
+def test_compact_json(tmp_path):
+    from annotate.utils import read_content, write_content
+
+    content = read_content(SAMPLE_JSON)
+    columns = content.serialize_columns()
+    assert columns[JSON_VERSION_KEY] == JSON_VERSION
+    assert len(columns['tokens']['content']) == len(content.tokens)
+    reloaded = Content()
+    reloaded.populate_from_dict(columns)
+    assert_same_content(reloaded, content)
+    for name in ['sample.json', 'sample.json.gz', 'sample.json.xz']:
+        file_name = str(tmp_path / name)
+        write_content(content, file_name)
+        assert get_file_type(file_name) == FILE_TYPE_JSON
+        assert os.path.getsize(file_name) * 4 < os.path.getsize(SAMPLE_JSON)
+        assert_same_content(read_content(file_name), content)
+
+    custom = Content()
+    custom.populate_from_dict(
+        {
+            'tokens': [
+                Token('Obama', 2, 0, 0, 5, id='x', tags=['B-PER']).serialize(),
+                Token('said', 1, 0, 0, 4).serialize(),
+            ],
+            'spans': [Span(tokens=[Token('Obama', 2, 0, 0, 5)], tags=[Tag('PER', 'red', 2)], id='s').serialize()],
+            'relations': [Relation('s', 's', 'self').serialize()],
+            'tokens_spans': [('x', 's'), ('missing', 's')],
+        }
+    )
+    file_name = str(tmp_path / 'custom.json.gz')
+    journal = Journal(file_name)
+    journal.seq = 3
+    journal.compact(custom)
+    reloaded = Content()
+    journal = Journal(file_name)
+    journal.load(reloaded)
+    assert journal.seq == 3
+    assert_same_content(reloaded, custom)
+    assert reloaded.token_from_token_id('x').tags == ['B-PER']
+
+    # the version is found wherever it is in the file, a layout that is not known is refused
+    file_name = str(tmp_path / 'version_last.json')
+    with open(file_name, 'w') as f:
+        json.dump({key: columns[key] for key in ['spans', 'tokens', 'relations', 'tokens_spans']}, f)
+        f.seek(f.tell() - 1)
+        f.write(f', "{JSON_VERSION_KEY}": {JSON_VERSION}}}')
+    with open(file_name) as f:
+        assert list(json.load(f))[-1] == JSON_VERSION_KEY
+    reloaded = Content()
+    assert reloaded.populate_from_json(file_name) == {}
+    assert_same_content(reloaded, content)
+    for layout in [{**columns, JSON_VERSION_KEY: JSON_VERSION + 1}, {'tokens': columns['tokens']}]:
+        with open(file_name, 'w') as f:
+            json.dump(layout, f)
+        with pytest.raises(UnknownJsonLayoutError):
+            Content().populate_from_json(file_name)
+
+
+def test_conll_import(tmp_path):
+    from annotate.conll import decode_bio
+    from annotate.utils import read_content, towkf
+
+    assert decode_bio(['B-PER', 'I-PER', 'O', 'I-LOC', 'I-LOC', 'B-LOC', 'I-PER']) == [
+        ('PER', 0, 1),
+        ('LOC', 3, 4),
+        ('LOC', 5, 5),
+        ('PER', 6, 6),
+    ]
+    assert decode_bio(['S-PER', 'B-ORG', 'E-ORG', 'O']) == [('PER', 0, 0), ('ORG', 1, 2)]
+
+    conll_file = str(tmp_path / 'sample.conll')
+    with open(conll_file, 'w') as f:
+        f.write('-DOCSTART- O\n\ngeorge B-PER B-PRES\nbush I-PER I-PRES\nsaid O\n\nin O\nnew I-LOC\ntexas I-LOC O\n')
+    assert get_file_type(conll_file) == FILE_TYPE_CONLL
+    content = Content()
+    content.populate_from_conll(conll_file, entity_colors={'PER': 'red'}, entity_levels={'PRES': 2})
+    assert content.sentence_indices() == [1, 2]
+    assert [x.content for x in content.sentence_tokens(1)] == ['george', 'bush', 'said']
+    span = content.span_from_span_id('1:0:1')
+    assert span.content == 'george bush' and (span.char_start_index, span.char_end_index) == (0, 11)
+    assert span.tags == [Tag('PER', 'red', 1), Tag('PRES', DEFAULT_HIGHLIGHT_COLOR, 2)]
+    assert content.token_from_token_id('1:1').tags == ['I-PER', 'I-PRES']
+    assert content.token_from_token_id('2:1').tags == ['B-LOC']  # I- without B- starts a span
+    assert content.token_ids_from_span_id('2:1:2') == ['2:1', '2:2']
+
+    with open(conll_file, 'w') as f:  # the same entity on the same tokens in two columns
+        f.write('george B-PER B-PER\nbush I-PER I-PER\n')
+    content.populate_from_conll(conll_file)
+    span = content.span_from_span_id('1:0:1')
+    assert span.tags == [Tag('PER', DEFAULT_HIGHLIGHT_COLOR, 1)]
+    assert content.token_from_token_id('1:0').tags == ['B-PER'] and content.token_from_token_id('1:1').tags == ['I-PER']
+    content.delete_entity(span, span.tags[0])
+    assert content.token_from_token_id('1:0').tags == [] and content.token_from_token_id('1:1').tags == []
+
+    towkf(read_content(SAMPLE_JSON), conll_file)
+    exported = read_content(conll_file)
+    expected = read_content(SAMPLE_JSON)
+    assert [x.content for x in exported.tokens] == [x.content for x in expected.tokens]
+    spans = [(x.content, [tag.content for tag in x.tags]) for x in exported.spans]
+    assert spans == [(x.content, [tag.content for tag in x.tags]) for x in expected.spans]
+
+
+def test_export(tmp_path):
+    from annotate.export import export
+
+    content = Content()
+    content.populate_from_dict(
+        {
+            'tokens': [
+                Token(word, 1, index, start, start + len(word)).serialize()
+                for index, (word, start) in enumerate([('george', 0), ('bush', 7), ('said', 12)])
+            ]
+            + [Token('hi', 2, 0, 0, 2).serialize()],
+        }
+    )
+    content.add_entity(Tag('PER', 'red', 1), 1, 0, 11)
+    content.add_entity(Tag('PRES', 'blue', 2), 1, 0, 11)
+    content.add_entity(Tag('NAME', 'green', 1), 1, 0, 6)
+    content.add_entity(Tag('GREET', 'green', 1), 2, 0, 2)
+    content.add_relation('1:0:1', '2:0:0', 'says')
+
+    export(content, str(tmp_path / 'out.conll'))
+    with open(tmp_path / 'out.conll') as f:
+        exported = f.read()
+    assert exported == 'george B-PER B-PRES B-NAME\nbush I-PER I-PRES O\nsaid O O O\n\nhi B-GREET O O\n\n'
+    assert len(set(len(line.split(WORD_SEP)) for line in exported.splitlines() if line)) == 1  # the columns line up
+    export(content, str(tmp_path / 'out.bioes'), EXPORT_FORMAT_BIOES, columns=4)
+    with open(tmp_path / 'out.bioes') as f:
+        assert f.read().split('\n\n')[1] == 'hi S-GREET O O O'
+    reloaded = Content()
+    reloaded.populate_from_conll(str(tmp_path / 'out.conll'))
+    assert [tag.content for tag in reloaded.span_from_span_id('1:0:1').tags] == ['PER', 'PRES']
+
+    export(content, str(tmp_path / 'out.jsonl'), EXPORT_FORMAT_JSONL)
+    with open(tmp_path / 'out.jsonl') as f:
+        records = [json.loads(line) for line in f]
+    assert records[0]['text'] == 'george bush said'
+    assert [span['labels'] for span in records[0]['spans']] == [['PER', 'PRES'], ['NAME']]
+    assert records[0]['relations'] == [{'start_id': '1:0:1', 'end_id': '2:0:0', 'name': 'says'}]
+
+    export(content, str(tmp_path / 'out.ann'), EXPORT_FORMAT_BRAT)
+    with open(tmp_path / 'out.txt') as f:
+        assert f.read() == 'george bush said\nhi\n'
+    with open(tmp_path / 'out.ann') as f:
+        assert f.read().splitlines() == [
+            'T1\tPER 0 11\tgeorge bush',
+            'T2\tPRES 0 11\tgeorge bush',
+            'T3\tNAME 0 6\tgeorge',
+            'T4\tGREET 17 19\thi',
+            'R1\tsays Arg1:T1 Arg2:T4',
+        ]
+    with pytest.raises(UnknownExportFormatError):
+        export(content, str(tmp_path / 'out.xml'), 'xml')
+
+
+def test_batch_commands(tmp_path, capsys):
+    import shutil
+    import subprocess
+    import sys
+    from annotate.batch import main
+    from annotate.utils import check_content
+
+    code = 'import sys, annotate.annotator, annotate.batch; print("tkinter" in sys.modules)'
+    assert subprocess.check_output([sys.executable, '-c', code]).decode().strip() == 'False'
+
+    directory = tmp_path / 'inputs'
+    directory.mkdir()
+    shutil.copy(SAMPLE_JSON, str(directory / 'a.json'))
+    shutil.copy(SAMPLE_TXT, str(directory / 'b.txt'))
+    output_dir = str(tmp_path / 'outputs')
+    assert main(['convert', str(directory), '--to', 'json.gz', '--output-dir', output_dir, '--workers', '2']) == 0
+    assert sorted(os.listdir(output_dir)) == ['a.json.gz', 'b.json.gz']
+    assert main(['export', output_dir, '--format', 'bioes', '--workers', '1']) == 0
+    assert os.path.exists(os.path.join(output_dir, 'a.bioes.conll'))
+    assert main(['check', str(directory / 'a.json'), str(directory / 'missing.json')]) == 1
+    output = capsys.readouterr().out
+    assert f'OK    {directory / "a.json"}' in output and '1 of 2 files done, 1 failed' in output
+    malformed = {'version': 2, 'tokens': {'sen_index': [1, 1], 'tok_index': [0], 'content': ['Obama']}}
+    with open(directory / 'c.json', 'w') as f:
+        json.dump(malformed, f)
+    for workers in ['1', '2']:
+        assert main(['check', str(directory / 'a.json'), str(directory / 'c.json'), '--workers', workers]) == 1
+        output = capsys.readouterr().out
+        assert f'ERROR {directory / "c.json"}: IndexError: ' in output and '1 of 2 files done, 1 failed' in output
+
+    os.remove(str(directory / 'c.json'))
+    shutil.copy(SAMPLE_JSON, str(directory / 'b.json'))  # b.txt and b.json export to the same file
+    assert main(['export', str(directory), '--workers', '2']) == 1
+    output = capsys.readouterr().out
+    assert f'ERROR {directory / "b.json"}: {directory / "b.json"}, {directory / "b.txt"} would all write' in output
+    assert not os.path.exists(str(directory / 'b.bio.conll')) and os.path.exists(str(directory / 'a.bio.conll'))
+    assert main(['check', str(directory)]) == 0  # the exported a.bio.conll is not an input
+    assert f'{directory / "a.bio.conll"}' not in capsys.readouterr().out
+
+    content = Content()
+    content.populate_from_dict({'tokens': [Token('Obama', 1, 0, 0, 5).serialize()]})
+    content.add_entity(Tag('PER', 'red'), 1, 0, 5)
+    content.add_relation('1:0:0', '9:9:9', 'knows')
+    assert check_content(content, {'entities': [{'name': 'LOC'}], 'relations': []}) == [
+        'relation knows has a missing span 9:9:9',
+        'label PER is not in the config',
+        'relation knows is not in the config',
+    ]
+
+
+def test_config_cache(tmp_path):
+    from annotate.config import load_config
+
+    config_file = str(tmp_path / 'config.json')
+    cache_dir = str(tmp_path / 'cache')
+    with open(config_file, 'w') as f:
+        json.dump({'entities': [{'name': 'PER', 'shortcut': 'p'}, {'name': 'LOC', 'level': 2}], 'relations': []}, f)
+    config = load_config(config_file, cache_dir)
+    assert config[ENTITY_SHORTCUTS_KEY] == {'p': 'PER'} and config[ENTITY_LEVELS_KEY] == {'PER': 1, 'LOC': 2}
+    assert config[ENTITY_COLORS_KEY] == {'PER': TKINTER_COLORS[0], 'LOC': TKINTER_COLORS[1]}
+    assert len(os.listdir(cache_dir)) == 1
+    assert load_config(config_file, cache_dir) == config
+    stat = os.stat(config_file)
+    os.utime(config_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))  # touched: same hash
+    assert load_config(config_file, cache_dir) == config
+    with open(config_file, 'w') as f:
+        json.dump({'entities': [{'name': 'PER', 'shortcut': 'q'}]}, f)
+    with pytest.raises(ConfigReadError):  # changed: validated again
+        load_config(config_file, cache_dir)
+
+
+def test_import_time():
+    import subprocess
+    import sys
+
+    # the command line tool is started once per document from scripts, it does not import the slow modules
+    code = 'import sys, annotate.annotator; print(sorted(set(sys.modules) & {"tkinter", "yaml", "annotate.data"}))'
+    assert subprocess.check_output([sys.executable, '-c', code]).decode().strip() == '[]'
+
+
+def test_label_index():
+    from annotate.labelindex import LabelIndex
+
+    index = LabelIndex(['Person', 'PER', ' per_title ', 'Location', 'Superpower', 'LOC'])
+    assert index.search('per') == ['PER', ' per_title ', 'Person', 'Superpower']
+    assert index.search('PERS') == ['Person']
+    assert index.search('pers', limit=1) == ['Person']
+    assert index.search('ocat') == ['Location']
+    assert index.search('xyz') == [] and index.search('  ') == []
+
+    labels = [f'Q{x}_entity_{x * 7919 % 100003}' for x in range(50000)]
+    index = LabelIndex(labels)
+    queries = ['q', 'q1', 'q12', 'q123', 'q1234', 'entity', 'y_9', '_999']
+    results = [index.search(query, limit=20) for query in queries]
+    matches = [[x for x in labels if query in x.lower()] for query in queries]
+    for results_this_query, matches_this_query in zip(results, matches):
+        assert len(results_this_query) == min(20, len(matches_this_query))
+        assert set(results_this_query) <= set(matches_this_query)
+    # the posting lists are sorted, without duplicates, and a substring query only visits the smallest one
+    assert all(list(posting) == sorted(set(posting)) for posting in index.grams.values())
+    assert list(index.grams['y_9']) == [x for x, label in enumerate(index.normalized) if 'y_9' in label]
+    assert len(index.grams['_99']) < len(labels) // 10
+    assert index.search('q1234_') == [f'Q1234_entity_{1234 * 7919 % 100003}']
+
+
+def test_entity_catalogue(tmp_path):
+    from annotate.catalogue import EntityCatalogue, entity_color
+    from annotate.labelindex import LabelIndex, LabelScan
+    from annotate.config import load_config, validate
+    from annotate.utils import check_content
+
+    with open(tmp_path / 'entities.tsv', 'w') as f:
+        f.write('# name\taliases\tlevel\tcolor\nPER\tperson\nORG\torganization|company\t2\tred\n\n')
+        f.writelines(f'Q{x}\n' for x in range(1000))
+    with open(tmp_path / 'entities.jsonl', 'w') as f:
+        f.write('{"name": "GPE", "aliases": ["country"], "level": 2}\n')
+    config_file = str(tmp_path / 'config.json')
+    with open(config_file, 'w') as f:
+        json.dump({'entities': [{'name': 'PER'}], 'relations': [], 'entity_catalogue': 'entities.tsv'}, f)
+    config = load_config(config_file, str(tmp_path / 'cache'))
+    catalogue = EntityCatalogue(config[ENTITIES_KEY], config[ENTITY_CATALOGUE_KEY])
+    assert len(catalogue) == 1002 and 'Q999' in catalogue and 'person' not in catalogue
+    assert catalogue.resolve('company') == 'ORG' and catalogue.resolve('person') == 'PER'
+    assert catalogue.resolve('nobody') is None
+    assert catalogue.levels['ORG'] == 2 and catalogue.colors['ORG'] == 'red'
+    assert len(set(catalogue.colors.values())) == 1002  # no color is used twice
+    assert entity_color(0) == TKINTER_COLORS[0] and entity_color(len(TKINTER_COLORS)).startswith('#')
+    assert catalogue.label_index().search('organ') == ['organization']
+    catalogue = EntityCatalogue(config[ENTITIES_KEY], config[ENTITY_CATALOGUE_KEY])
+    thread = catalogue.build_index()
+    assert catalogue.build_index() is thread
+    assert catalogue.label_index().search('q99')[:2] == ['Q99', 'Q990']  # scanned or indexed, depending on the thread
+    thread.join()
+    assert isinstance(catalogue.label_index(), LabelIndex)
+    assert catalogue.label_index().search('organ') == ['organization']
+    assert LabelScan(['Person', 'PER', 'Superpower']).search('per') == ['PER', 'Person']
+    assert EntityCatalogue([], str(tmp_path / 'entities.jsonl')).levels == {'GPE': 2}
+
+    relation = {'name': 'works_for', 'entities': [{'start': 'PER', 'end': 'Q7'}]}
+    validate({**config, 'relations': [relation]})
+    with pytest.raises(ConfigReadError):
+        validate({'entities': [{'name': 'PER'}], 'relations': [relation]})
+
+    content = Content()
+    content.populate_from_text(SAMPLE_TXT)
+    content.add_entity(Tag('Q7', color='red'), sen_index=1, char_start_index=0, char_end_index=20)
+    content.add_entity(Tag('Q1000', color='red'), sen_index=1, char_start_index=7, char_end_index=14)
+    assert check_content(content, config) == ['label Q1000 is not in the config']
@@ -0,0 +1,119 @@
+# random access to the lines of a big text file through mmap
+import os
+import mmap
+import struct
+import tempfile
+from array import array
+from typing import Dict, List, Tuple
+from annotate.consts import *
+
+TEXT_INDEX_HEADER = struct.Struct('<8sQQ')  # magic, size and mtime (ns) of the text file
+TEXT_INDEX_MAGIC = b'SATYAIDX'
+
+
+class TextSource:
+    """
+    A text file with one sentence per line, mapped in memory. The start offsets of the lines are found once (and
+    cached next to big files), so a line can be read without reading the lines before it.
+    """
+
+    def __init__(self, txt_file: str, cache_size: int = TEXT_INDEX_CACHE_SIZE):
+        self.txt_file = txt_file
+        self.index_file = f'{txt_file}{TEXT_INDEX_FILE_EXT}'
+        with open(txt_file, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if stat.st_size else b''
+        self.key = (stat.st_size, stat.st_mtime_ns)
+        self.offsets = self._read_index()  # start of every line, then the end of the file
+        if self.offsets is None:
+            self.offsets = self._build_index()
+            if stat.st_size > cache_size:
+                self._write_index()
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def _build_index(self) -> array:
+        offsets = array('q', [0])
+        find = self.data.find
+        pos = find(b'\n')
+        while pos != -1:
+            offsets.append(pos + 1)
+            pos = find(b'\n', pos + 1)
+        if offsets[-1] != len(self.data):  # the last line has no new line char
+            offsets.append(len(self.data))
+        return offsets
+
+    def _read_index(self):
+        """read the cached line offsets, if they were built for this version of the file
+        :return:
+        """
+        try:
+            with open(self.index_file, 'rb') as f:
+                magic, size, mtime = TEXT_INDEX_HEADER.unpack(f.read(TEXT_INDEX_HEADER.size))
+                if magic != TEXT_INDEX_MAGIC or (size, mtime) != self.key:
+                    return None
+                offsets = array('q')
+                offsets.frombytes(f.read())
+        except (OSError, struct.error, ValueError):
+            return None
+        if not offsets or offsets[-1] != self.key[0]:
+            return None
+        return offsets
+
+    def _write_index(self):
+        """cache the line offsets next to the text file, it is fine if the directory is not writable
+        :return:
+        """
+        try:
+            directory = os.path.dirname(os.path.abspath(self.index_file))
+            with tempfile.NamedTemporaryFile('wb', dir=directory, suffix=JOURNAL_TEMP_FILE_EXT, delete=False) as f:
+                f.write(TEXT_INDEX_HEADER.pack(TEXT_INDEX_MAGIC, *self.key))
+                f.write(self.offsets.tobytes())
+            os.replace(f.name, self.index_file)
+        except OSError:
+            pass
+
+    def line(self, sen_index: int) -> str:
+        """get a line without the new line chars
+        :param sen_index: the line number, starting at 1
+        :return:
+        """
+        line = self.data[self.offsets[sen_index - 1] : self.offsets[sen_index]]
+        return line.decode('utf-8').rstrip('\r\n')
+
+    def words(self, sen_index: int) -> Tuple[List[str], List[int]]:
+        """split a line into words. empty words (from repeated spaces) are skipped, the char offsets stay the ones in
+        the line
+        :param sen_index: the line number, starting at 1
+        :return: the words and their start char offsets
+        """
+        words, char_start_indices = [], []
+        char_index = 0
+        for word in self.line(sen_index).split(WORD_SEP):
+            if word.strip():
+                words.append(word)
+                char_start_indices.append(char_index)
+            char_index = char_index + len(word) + 1
+        return words, char_start_indices
+
+    def tokens(self, sen_index: int) -> List[Dict]:
+        """split a line into serialized tokens, see `words`
+        :param sen_index: the line number, starting at 1
+        :return:
+        """
+        words, char_start_indices = self.words(sen_index)
+        return [
+            {
+                'content': word,
+                'sen_index': sen_index,
+                'tok_index': tok_index,
+                'char_start_index': char_start_index,
+                'char_end_index': char_start_index + len(word),
+            }
+            for tok_index, (word, char_start_index) in enumerate(zip(words, char_start_indices))
+        ]
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
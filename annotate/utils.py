@@ -1,27 +1,67 @@
 import os
-from typing import Dict, List
+from typing import Dict, List, Union
 from annotate.consts import *
-from annotate.data import Token, Content
-from annotate.exceptions import ConfigReadError, UnknownFileFormatError, NoFileFoundError
+from annotate.data import Content, relation_sort_key
+from annotate.export import export
+from annotate.journal import Journal
+from annotate.catalogue import EntityCatalogue
+from annotate.binary import write_binary
+from annotate.jsonstream import dump_json
+from annotate.exceptions import UnknownFileFormatError, NoFileFoundError
 
 
 def towkf(content: Content, output_file: str):
     """
-    create a (multi-column) conll file from the content
+    create a (multi-column) conll file from the content, see `annotate.export.BioEncoder`
     :param content:
     :param output_file:
     :return:
     """
-    sentence_nums = set([x.sen_index for x in content.tokens])
-    sentences: List[List[Token]] = [[x for x in content.tokens if x.sen_index == y] for y in sentence_nums]
-    max_num_labels = max([len(token.tags) for token in content.tokens])
-    with open(output_file, 'w') as wf:
-        for sentence in sentences:
-            for token in sentence:
-                tags = token.tags + ['O'] * (max_num_labels - len(token.tags))
-                tags = ' '.join(tags)
-                wf.write(f'{token.content} {tags}\n')
-            wf.write(NEW_LINE_CHAR)
+    export(content, output_file, EXPORT_FORMAT_BIO)
+
+
+def read_content(input_file: str) -> Content:
+    """read a content from a json, binary, text or conll file
+    :param input_file:
+    :return:
+    """
+    file_type = get_file_type(input_file)
+    content = Content()
+    if file_type in [FILE_TYPE_JSON, FILE_TYPE_BINARY]:
+        Journal(input_file).load(content)  # with the edits that were not folded into the file yet
+    elif file_type == FILE_TYPE_TXT:
+        content.populate_from_text(input_file)
+    elif file_type == FILE_TYPE_CONLL:
+        content.populate_from_conll(input_file)
+    else:
+        raise UnknownFileFormatError(input_file)
+    return content
+
+
+def write_content(content: Content, output_file: str):
+    """write a content as (compact, optionally compressed) json or in the binary format, depending on the extension of
+    the output file
+    :param content:
+    :param output_file:
+    :return:
+    """
+    file_type = file_type_from_name(output_file)
+    if file_type not in [FILE_TYPE_BINARY, FILE_TYPE_JSON]:
+        raise UnknownFileFormatError(output_file)
+    with open(output_file, 'wb') as f:
+        if file_type == FILE_TYPE_BINARY:
+            write_binary(content.serialize_columns(), f)
+        else:
+            dump_json(content.serialize_columns(), f, output_file)
+
+
+def convert(input_file: str, output_file: str):
+    """convert a content between the json and the binary formats (a text file can be converted too)
+    :param input_file:
+    :param output_file:
+    :return:
+    """
+    write_content(read_content(input_file), output_file)
 
 
 def get_file_type(file_name: str):
@@ -31,57 +71,64 @@ def get_file_type(file_name: str):
     """
     if not os.path.exists(file_name):
         raise NoFileFoundError(file_name)
+    return file_type_from_name(file_name)
+
+
+def file_stem(file_name: str) -> str:
+    """remove the extension (with the compression extension, if any) from a file name
+    :param file_name:
+    :return:
+    """
+    name, ext = os.path.splitext(file_name)
+    if ext in COMPRESSED_FILE_EXTS:
+        name, ext = os.path.splitext(name)
+    return name
+
+
+def file_type_from_name(file_name: str):
+    """get the file type from the extension, a json file can be compressed (e.g. `.json.gz`)
+    :param file_name:
+    :return:
+    """
+    name, ext = os.path.splitext(file_name)
+    if ext in COMPRESSED_FILE_EXTS and name.endswith(FILE_TYPE_JSON):
+        return FILE_TYPE_JSON
     for allowed_file_ext in ALLOWED_FILE_TYPE:
         if file_name.endswith(allowed_file_ext):
             return allowed_file_ext
     raise UnknownFileFormatError(file_name)
 
 
-def validate(config: Dict):
-    """validate the config file for the span annotator, raise exceptions as necessary
+def check_content(content: Content, config: Union[Dict, None] = None) -> List[str]:
+    """find the problems in a content: token-span pairs and relations that point to missing tokens or spans, spans
+    that do not cover tokens of their sentence and, if a config is given, labels and relations it does not define
+    :param content:
     :param config:
-    :return:
+    :return: one message per problem
     """
-    entity_names = [entity['name'] for entity in config['entities']]
-    if not entity_names:
-        raise ConfigReadError(msg='must provide entities')
-    for entity_desc in config['entities']:
-        if 'name' not in entity_desc:
-            raise ConfigReadError(msg='each entity must have a name')
-        if entity_desc.get('shortcut') in RESERVED_CHARS:
-            raise ConfigReadError(
-                msg=f'shortcut {entity_desc.get("shortcut")} for entity {entity_desc["name"]} not allowed because it '
-                f'is a reserved character'
-            )
-    relation_entities = [(relation['name'], relation['entities']) for relation in config.get('relations')]
-    for relation_name, entities_this_relation in relation_entities:
-        for entity_pair in entities_this_relation:
-            start = entity_pair.get('start')
-            end = entity_pair.get('end')
-            if start is None or end is None:
-                raise ConfigReadError(msg=f'Start or End entity not provided for relation {relation_name}')
-            if start not in entity_names:
-                raise ConfigReadError(
-                    msg=f'relation {relation_name} has an entity {start} which is not in the entities list'
-                )
-            if end not in entity_names:
-                raise ConfigReadError(
-                    msg=f'relation {relation_name} has an entity {end} which is not in the entities list'
-                )
-    return
-
-
-def get_entity_colors(entity_list: List[Dict[str, str]]) -> Dict[str, str]:
-    """get the  entity colors. if no color is provided, create own
-    :param entity_list:
-    :return:
-    """
-    color_index = 0
-    entity_colors = dict()
-    for entity_desc in entity_list:
-        if 'color' in entity_desc:
-            entity_colors[entity_desc['name']] = entity_desc['color']
-        else:
-            entity_colors[entity_desc['name']] = TKINTER_COLORS[color_index]
-            color_index += 1
-    return entity_colors
+    problems = []
+    content.hydrate()
+    for sen_index, tokens, spans in content.iter_sentences():
+        tok_indices = set(token.tok_index for token in tokens)
+        for span in spans:
+            if span.tok_start_index not in tok_indices or span.tok_end_index not in tok_indices:
+                problems.append(f'span {span.id} is not on the tokens of sentence {sen_index}')
+    for token_id, span_id in content.tokens_spans:
+        if content.token_from_token_id(token_id) is None:
+            problems.append(f'span {span_id} has a missing token {token_id}')
+        if content.span_from_span_id(span_id) is None:
+            problems.append(f'token {token_id} has a missing span {span_id}')
+    for relation in sorted(content.relations, key=relation_sort_key):
+        for span_id in [relation.start_id, relation.end_id]:
+            if content.span_from_span_id(span_id) is None:
+                problems.append(f'relation {relation.name} has a missing span {span_id}')
+    if config is not None:
+        entity_names = set(entity['name'] for entity in config.get(ENTITIES_KEY, []))
+        catalogue = EntityCatalogue(config.get(ENTITIES_KEY, []), config.get(ENTITY_CATALOGUE_KEY))
+        relation_names = set(relation['name'] for relation in config.get(RELATIONS_KEY) or [])
+        labels = set(tag.content for span in content.spans for tag in span.tags) - entity_names
+        labels = sorted(label for label in labels if label not in catalogue)
+        problems.extend([f'label {label} is not in the config' for label in labels])
+        names = sorted(set(relation.name for relation in content.relations) - relation_names)
+        problems.extend([f'relation {name} is not in the config' for name in names])
+    return problems